@@ -1,6 +1,101 @@
+from django.conf import settings
+from django import forms
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from .models import Category, StyledImage, Tag  # Added Tag
+from .blobs import release_blob
+from .ingest import IngestError, check_upload, ingest_upload
+from .models import Category, ImageBlob, RenderJob, StyledImage, StylePreset, Tag  # Added Tag
+from .styles import StyleSpec
+from .thumbnails import get_thumbnail_url
+
+
+def estimate_row_count(model):
+    """Planner/statistics row estimate for a table, or None when unavailable"""
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            elif connection.vendor == 'sqlite':
+                # Filled in by ANALYZE; the first number is the table's row count
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            elif connection.vendor == 'mysql':
+                cursor.execute(
+                    "SELECT table_rows FROM information_schema.tables "
+                    "WHERE table_schema = DATABASE() AND table_name = %s", [table]
+                )
+            else:
+                return None
+            row = cursor.fetchone()
+    except Exception:
+        return None
+
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Skips the full-table COUNT(*) on large unfiltered changelists"""
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimate_row_count(self.object_list.model)
+            threshold = getattr(settings, 'STYLER_ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+            if estimate is not None and estimate >= threshold:
+                return estimate
+        return super().count
+
+
+class RangeListFilter(admin.SimpleListFilter):
+    """Fixed value ranges instead of one filter entry per distinct value"""
+    field_name = None
+    ranges = {}  # key: (label, lower bound or None, upper bound (exclusive) or None)
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, (label, _, _) in self.ranges.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        _, low, high = self.ranges[self.value()]
+        if low is not None:
+            queryset = queryset.filter(**{f'{self.field_name}__gte': low})
+        if high is not None:
+            queryset = queryset.filter(**{f'{self.field_name}__lt': high})
+        return queryset
+
+
+class FontSizeRangeFilter(RangeListFilter):
+    title = 'font size'
+    parameter_name = 'font_size_range'
+    field_name = 'font_size'
+    ranges = {
+        'small': ('Small (< 24)', None, 24),
+        'medium': ('Medium (24 - 47)', 24, 48),
+        'large': ('Large (48 - 95)', 48, 96),
+        'huge': ('Huge (96+)', 96, None),
+    }
+
+
+class UpdateClicksRangeFilter(RangeListFilter):
+    """Buckets match the activity levels of the most-updated API"""
+    title = 'update clicks'
+    parameter_name = 'update_clicks_range'
+    field_name = 'update_clicks'
+    ranges = {
+        'none': ('Never updated', None, 1),
+        'low': ('Low (1 - 4)', 1, 5),
+        'medium': ('Medium (5 - 9)', 5, 10),
+        'high': ('High (10 - 19)', 10, 20),
+        'very_high': ('Very high (20+)', 20, None),
+    }
 
 
 @admin.register(Tag)
@@ -8,10 +103,12 @@ class TagAdmin(admin.ModelAdmin):
     list_display = ['name', 'styled_images_count', 'created_at']
     search_fields = ['name']
     ordering = ['name']
+    show_full_result_count = False  # avoid a second unfiltered COUNT(*) when filtering
 
     def styled_images_count(self, obj):
-        return obj.styled_images.count()
+        return obj.image_count
     styled_images_count.short_description = 'Images'
+    styled_images_count.admin_order_field = 'image_count'
 
 
 @admin.register(Category)
@@ -25,13 +122,45 @@ class CategoryAdmin(admin.ModelAdmin):
     list_editable = ['show_in_landing']
     list_filter = ['show_in_landing', 'created_at']
     search_fields = ['name', 'description']
+    show_full_result_count = False  # avoid a second unfiltered COUNT(*) when filtering
 
     def styled_images_count(self, obj):
-        return obj.styled_images.count()
+        return obj.image_count
     styled_images_count.short_description = 'Images'
+    styled_images_count.admin_order_field = 'image_count'
+
+
+class StyleFieldsFormMixin:
+    """Validates the styling fields like the API does, so the admin never stores a style that cannot render"""
+
+    def clean(self):
+        cleaned_data = super().clean()
+        try:
+            StyleSpec.from_options(cleaned_data)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        return cleaned_data
+
+
+class StyledImageAdminForm(StyleFieldsFormMixin, forms.ModelForm):
+    class Meta:
+        model = StyledImage
+        fields = '__all__'
+
+    def clean_original_image(self):
+        """Apply the upload API's size limit to originals uploaded here"""
+        original_image = self.cleaned_data.get('original_image')
+        if original_image and 'original_image' in self.changed_data:
+            try:
+                check_upload(original_image)
+            except IngestError as e:
+                raise forms.ValidationError(str(e))
+        return original_image
 
 
 class StyledImageAdmin(admin.ModelAdmin):
+    form = StyledImageAdminForm
+
     # Fields to display in the list view
     list_display = [
         'id',
@@ -51,9 +180,9 @@ class StyledImageAdmin(admin.ModelAdmin):
         'category',
         'tags',  # NEW
         'font_family',
-        'font_size',
+        FontSizeRangeFilter,
         'created_at',
-        'update_clicks',
+        UpdateClicksRangeFilter,
     ]
 
     # Fields that can be searched
@@ -191,7 +320,7 @@ class StyledImageAdmin(admin.ModelAdmin):
         if obj.original_image:
             return format_html(
                 '<img src="{}" style="max-height: 50px; max-width: 50px; border: 1px solid #ddd; border-radius: 3px;" />',
-                obj.original_image.url
+                get_thumbnail_url(obj.original_image, 64, obj.get_original_thumbnail_width())
             )
         return format_html('<span style="color: #999;">-</span>')
     original_image_preview_list.short_description = 'Original'
@@ -201,7 +330,7 @@ class StyledImageAdmin(admin.ModelAdmin):
         if obj.output_image:
             return format_html(
                 '<img src="{}" style="max-height: 50px; max-width: 50px; border: 1px solid #4CAF50; border-radius: 3px;" />',
-                obj.output_image.url
+                get_thumbnail_url(obj.output_image, 64, obj.get_output_thumbnail_width())
             )
         return format_html('<span style="color: #999;">-</span>')
     output_image_preview_list.short_description = 'Styled'
@@ -214,7 +343,7 @@ class StyledImageAdmin(admin.ModelAdmin):
                 '<img src="{}" style="max-height: 300px; max-width: 300px; border: 1px solid #ddd; border-radius: 5px; padding: 5px;" />'
                 '<br><a href="{}" target="_blank" style="font-size: 12px;">View Full Size</a>'
                 '</div>',
-                obj.original_image.url,
+                get_thumbnail_url(obj.original_image, 320, obj.get_original_thumbnail_width()),
                 obj.original_image.url
             )
         return format_html('<span style="color: #999;">No original image</span>')
@@ -228,7 +357,7 @@ class StyledImageAdmin(admin.ModelAdmin):
                 '<img src="{}" style="max-height: 300px; max-width: 300px; border: 2px solid #4CAF50; border-radius: 5px; padding: 5px;" />'
                 '<br><a href="{}" target="_blank" style="font-size: 12px;">View Full Size</a>'
                 '</div>',
-                obj.output_image.url,
+                get_thumbnail_url(obj.output_image, 320, obj.get_output_thumbnail_width()),
                 obj.output_image.url
             )
         return format_html('<span style="color: #999;">No output image generated</span>')
@@ -253,51 +382,65 @@ class StyledImageAdmin(admin.ModelAdmin):
     assign_to_category.short_description = "Assign to category"
 
     def regenerate_output_images(self, request, queryset):
-        """Admin action to regenerate output images"""
-        from .utils import add_text_to_image
-
-        regenerated_count = 0
-        for styled_image in queryset:
-            if styled_image.original_image:
-                try:
-                    original_path = styled_image.original_image.path
-                    style_options = {
-                        'font_size': styled_image.font_size,
-                        'font_color': styled_image.font_color,
-                        'x_position': styled_image.x_position,
-                        'y_position': styled_image.y_position,
-                        'font_family': styled_image.font_family,
-                    }
-                    output_image_path = add_text_to_image(
-                        original_path,
-                        styled_image.text,
-                        style_options
-                    )
-                    styled_image.output_image = output_image_path
-                    styled_image.save()
-                    regenerated_count += 1
-                except Exception as e:
-                    self.message_user(
-                        request,
-                        f"Error regenerating image {styled_image.id}: {str(e)}",
-                        level='ERROR'
-                    )
+        """Admin action to regenerate output images in the background"""
+        from django.urls import reverse
+        from .rendering import start_render_job
+
+        image_ids = list(queryset.values_list('id', flat=True))
+        job = start_render_job(image_ids)
         self.message_user(
             request,
-            f"Successfully regenerated {regenerated_count} output images."
+            format_html(
+                'Regenerating {} output images in the background. '
+                '<a href="{}">Follow the progress of render job {}</a>.',
+                len(image_ids),
+                reverse('admin:styler_renderjob_change', args=[job.id]),
+                job.id
+            )
         )
     regenerate_output_images.short_description = "Regenerate output images"
 
     def reset_clicks(self, request, queryset):
-        """Admin action to reset click counters"""
-        updated = queryset.update(update_clicks=0)
+        """Admin action to reset click counters, trending scores and click history"""
+        from .clicks import click_aggregator
+
+        updated = click_aggregator.reset(queryset.values_list('id', flat=True))
         self.message_user(
             request,
             f"Successfully reset click counters for {updated} images."
         )
     reset_clicks.short_description = "Reset click counters"
 
+    def get_queryset(self, request):
+        """
+        Load tags for the whole page at once, and the blobs thumbnails are sized from
+        (the changelist skips list_select_related once the queryset has a select_related)
+        """
+        return super().get_queryset(request).select_related('category', 'blob').prefetch_related('tags')
+
+    def save_model(self, request, obj, form, change):
+        """Store a newly uploaded original normalized and content-addressed, like the upload API does"""
+        blob = None
+        if 'original_image' in form.changed_data and obj.original_image:
+            blob, _, _ = ingest_upload(obj.original_image.file)
+            obj.blob = blob
+            obj.original_image = blob.file.name
+        if 'output_image' in form.changed_data:
+            # An output replaced by hand is not a known render of the stored fields,
+            # and has no variants
+            obj.output_signature = ''
+            obj.output_has_thumbnails = False
+        try:
+            super().save_model(request, obj, form, change)
+        finally:
+            if blob is not None:
+                # The saved image holds its own reference to the original
+                release_blob(blob.id)
+
     # Admin configuration
+    list_select_related = ['category', 'blob']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # avoid a second unfiltered COUNT(*) when filtering
     list_per_page = 20
     ordering = ['-created_at']
     date_hierarchy = 'created_at'
@@ -305,4 +448,99 @@ class StyledImageAdmin(admin.ModelAdmin):
 
 
 # Register the StyledImage model
-admin.site.register(StyledImage, StyledImageAdmin)
\ No newline at end of file
+admin.site.register(StyledImage, StyledImageAdmin)
+
+
+@admin.register(RenderJob)
+class RenderJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'progress_display', 'completed', 'failed', 'created_at', 'finished_at']
+    list_filter = ['status']
+    show_full_result_count = False  # avoid a second unfiltered COUNT(*) when filtering
+    readonly_fields = [
+        'status', 'progress_display', 'total', 'completed', 'failed',
+        'errors', 'created_at', 'started_at', 'heartbeat_at', 'finished_at',
+    ]
+    fields = readonly_fields
+
+    def progress_display(self, obj):
+        return obj.get_progress_display()
+    progress_display.short_description = 'Progress'
+
+    def has_add_permission(self, request):
+        # Jobs are started from the "Regenerate output images" action
+        return False
+
+
+@admin.register(ImageBlob)
+class ImageBlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'file', 'size', 'ref_count', 'created_at']
+    search_fields = ['sha256']
+    show_full_result_count = False  # avoid a second unfiltered COUNT(*) when filtering
+    readonly_fields = ['sha256', 'file', 'size', 'ref_count', 'created_at']
+    fields = readonly_fields
+
+    def has_add_permission(self, request):
+        # Blobs are created from uploads
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Unused blobs are deleted with their file by the reference counting signals
+        return False
+
+
+class StylePresetAdminForm(StyleFieldsFormMixin, forms.ModelForm):
+    class Meta:
+        model = StylePreset
+        fields = '__all__'
+
+
+@admin.register(StylePreset)
+class StylePresetAdmin(admin.ModelAdmin):
+    form = StylePresetAdminForm
+    list_display = ['name', 'font_family', 'font_weight', 'font_size', 'font_color', 'updated_at']
+    search_fields = ['name', 'description']
+    readonly_fields = ['created_at', 'updated_at']
+    show_full_result_count = False  # avoid a second unfiltered COUNT(*) when filtering
+
+    fieldsets = (
+        ('Preset', {
+            'fields': (
+                'name',
+                'description',
+            )
+        }),
+        ('Styling Options', {
+            'fields': (
+                'font_family',
+                'font_size',
+                'font_color',
+                'x_position',
+                'y_position',
+                'text_alignment',
+                'font_weight',
+            )
+        }),
+        ('Advanced Styling', {
+            'fields': (
+                'text_rotate',
+                'text_opacity',
+                'letter_spacing',
+                'line_height',
+                'enable_shadow',
+                'shadow_x',
+                'shadow_y',
+                'shadow_blur',
+                'shadow_color',
+                'enable_background',
+                'text_background',
+            ),
+            'classes': ('collapse',)
+        }),
+        ('Metadata', {
+            'fields': (
+                'created_at',
+                'updated_at',
+            ),
+            'classes': ('collapse',)
+        }),
+    )
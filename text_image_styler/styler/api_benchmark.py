@@ -0,0 +1,284 @@
+"""
+API benchmark: every styler endpoint through the Django test client (see the
+benchmark_api command and tests.py).
+
+Each endpoint is requested a number of times while its SQL queries are
+captured. The report has latency percentiles and the query count of every
+endpoint, and an endpoint fails when it runs more queries than its budget in
+QUERY_BUDGETS. Budgets are fixed numbers that do not grow with the data, so
+an N+1 query shows up as soon as the database holds more rows than the
+budget allows for.
+
+By default the response cache is cleared before every request, so each one
+does its database work; pass cold=False to measure cached responses.
+"""
+import json
+import math
+import time
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from .models import Category, StyledImage, StylePreset, Tag
+
+PERCENTILES = (50, 90, 95, 99)
+PRESET_NAME = 'API benchmark'
+PRESET_IMAGES = 5
+
+# Most SQL queries one request may run, per endpoint, counted from the query
+# plan of the view (transaction and savepoint statements included). Endpoints
+# with a cached response (categories, images, search, tags, trending) start
+# with the read of the cache generations; list endpoints prefetch their tags.
+QUERY_BUDGETS = {
+    'upload_page': 1,  # categories
+    'categories': 2,  # generations, categories
+    'categories_landing': 2,  # categories, top images per category in one windowed query
+    'category_images': 3,  # category, images, tags
+    'category_export': 2,  # category, images
+    'image_stats': 2,  # aggregate, top images
+    'download': 1,
+    'image': 1,
+    'images': 3,  # generations, images, tags
+    'image_data': 2,  # image, tags
+    'uncategorized': 2,  # images, tags
+    'search': 3,  # generations, images, tags
+    'search_tag': 3,
+    'search_export': 1,
+    'tags': 2,  # generations, tags
+    'trending': 2,  # generations, images
+    'most_updated': 3,  # images, aggregate, top images
+    'most_updated_weekly': 3,
+    'render_cache': 0,
+    # Blob lease (ref_count UPDATE; for a new original also the blob INSERT in
+    # a savepoint pair and the UPDATE recording its size and thumbnails),
+    # category, then in one savepoint pair: the image INSERT, its category and
+    # blob counter signals (an UPDATE in a savepoint pair each), the lease
+    # release and the tag assignment (tag lookup, current tags, existing links,
+    # INSERT, count UPDATE in a savepoint pair)
+    'upload_style': 23,
+    # Category and tags once per batch, a lease UPDATE and blob SELECT per
+    # file (2 files), then one bulk INSERT of the images and of their tag links
+    # and one counter UPDATE per category and tag, all in one savepoint pair
+    'bulk_upload_style': 12,
+    # Image, PendingClick INSERT, UPDATE of the text fields, blob
+    'update_text': 4,
+    # Image and tags, PendingClick INSERT, blob, and in one savepoint pair the
+    # UPDATE and the tag replacement: tag lookup, current tags, removed links
+    # (SELECT, DELETE, count UPDATE in a savepoint pair), added links (SELECT,
+    # INSERT, count UPDATE in a savepoint pair); then the tags of the response
+    'update_text_json': 20,
+    # Preset, its images, one UPDATE with a CASE per field
+    'presets_apply': 3,
+    # Admin pages start with the session and user lookups and end with the two
+    # permission queries of the sidebar; changelists add the page COUNT and rows
+    'admin_category_list': 6,
+    'admin_tag_list': 6,
+    'admin_imageblob_list': 6,
+    'admin_stylepreset_list': 6,
+    'admin_renderjob_list': 6,
+    # Category and tag filter choices, estimated row count, COUNT, rows, tags,
+    # date hierarchy range and years, and the font family filter choices
+    'admin_styledimage_list': 13,
+    # Image and tags, category and tag choices of the form, and the content
+    # type of the history link (cached after the first request)
+    'admin_styledimage_change': 9,
+}
+
+
+class Endpoint:
+    """One request of the benchmark. data(run) returns the POST payload of a run."""
+    __slots__ = ('name', 'method', 'path', 'data', 'content_type')
+
+    def __init__(self, name, method, path, data=None, content_type=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.content_type = content_type
+
+    @property
+    def budget(self):
+        return QUERY_BUDGETS[self.name]
+
+
+def pick_target():
+    """
+    The rows the endpoints are pointed at: the largest category, its newest
+    image with an output, the most used tag and a word of that image's text
+    Raises ValueError when there are no images yet.
+    """
+    category = Category.objects.order_by('-image_count', 'pk').first()
+    images = StyledImage.objects.exclude(output_image='').exclude(output_image__isnull=True)
+    if category is not None and category.image_count:
+        images = images.filter(category=category)
+    image = images.order_by('-created_at').first()
+    if image is None:
+        raise ValueError("No images with outputs to benchmark; add some first (e.g. manage.py seed_images 1k)")
+
+    tag = Tag.objects.order_by('-image_count', 'pk').first()
+    return {
+        'image_id': image.id,
+        'category_id': category.id if category else None,
+        'tag': tag.name if tag else '',
+        'query': image.text.split()[0].lower() if image.text.split() else 'a',
+        'preset_image_ids': list(images.order_by('-created_at').values_list('id', flat=True)[:PRESET_IMAGES]),
+    }
+
+
+def sample_upload(name='benchmark.jpg'):
+    """A small JPEG upload; a fresh one per request, as the views read it to the end"""
+    buffer = BytesIO()
+    Image.new('RGB', (800, 600), (90, 120, 160)).save(buffer, 'JPEG', quality=85)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+def build_endpoints(target, writes=True, admin=False):
+    """Endpoint list for a pick_target() result: the read endpoints, then writes, then admin pages"""
+    image_id = target['image_id']
+    category_id = target['category_id']
+    query = target['query']
+    endpoints = [
+        Endpoint('upload_page', 'GET', '/'),
+        Endpoint('categories', 'GET', '/api/categories/'),
+        Endpoint('categories_landing', 'GET', '/api/categories/landing/'),
+        Endpoint('category_images', 'GET', f'/api/categories/{category_id}/'),
+        Endpoint('category_export', 'GET', f'/api/categories/{category_id}/export/'),
+        Endpoint('image_stats', 'GET', '/api/images/stats/'),
+        Endpoint('download', 'GET', f'/download/{image_id}/'),
+        Endpoint('image', 'GET', f'/image/{image_id}/'),
+        Endpoint('images', 'GET', '/api/images/'),
+        Endpoint('image_data', 'GET', f'/api/get-image-data/{image_id}/'),
+        Endpoint('uncategorized', 'GET', '/api/uncategorized/'),
+        Endpoint('search', 'GET', f'/api/search/?q={query}'),
+        Endpoint('search_tag', 'GET', f"/api/search/?q={query}&tag={target['tag']}"),
+        Endpoint('search_export', 'GET', f'/api/search/export/?q={query}'),
+        Endpoint('tags', 'GET', '/api/tags/'),
+        Endpoint('trending', 'GET', '/api/trending/'),
+        Endpoint('most_updated', 'GET', '/api/most-updated/'),
+        Endpoint('most_updated_weekly', 'GET', '/api/most-updated/?timeframe=weekly'),
+        Endpoint('render_cache', 'GET', '/api/render-cache/'),
+    ]
+    if category_id is None:
+        endpoints = [endpoint for endpoint in endpoints if not endpoint.name.startswith('category_')]
+
+    if writes:
+        preset, _ = StylePreset.objects.get_or_create(
+            name=PRESET_NAME, defaults={'description': "Applied by the API benchmark", 'enable_shadow': True}
+        )
+        endpoints += [
+            Endpoint('upload_style', 'POST', '/api/upload-style/', lambda run: {
+                'image': sample_upload(), 'text': f"Benchmark upload {run}",
+                'category': category_id or '', 'tags': target['tag'],
+            }),
+            Endpoint('bulk_upload_style', 'POST', '/api/upload-style/bulk/', lambda run: {
+                'files': [sample_upload('first.jpg'), sample_upload('second.jpg')],
+                'text': f"Benchmark bulk {run}", 'category': category_id or '', 'tags': target['tag'],
+            }),
+            # A different text every run, so each update renders
+            Endpoint('update_text', 'POST', '/api/update-text/', lambda run: json.dumps({
+                'id': image_id, 'text': f"Benchmark update {run}",
+            }), 'application/json'),
+            Endpoint('update_text_json', 'POST', '/api/update-text-json/', lambda run: json.dumps({
+                'id': image_id, 'text': f"Benchmark JSON update {run}", 'tags': target['tag'],
+            }), 'application/json'),
+            Endpoint('presets_apply', 'POST', '/api/presets/apply/', lambda run: json.dumps({
+                'preset_id': preset.id, 'image_ids': target['preset_image_ids'],
+            }), 'application/json'),
+        ]
+
+    if admin:
+        endpoints += [
+            Endpoint('admin_styledimage_list', 'GET', '/admin/styler/styledimage/'),
+            Endpoint('admin_styledimage_change', 'GET', f'/admin/styler/styledimage/{image_id}/change/'),
+            Endpoint('admin_category_list', 'GET', '/admin/styler/category/'),
+            Endpoint('admin_tag_list', 'GET', '/admin/styler/tag/'),
+            Endpoint('admin_imageblob_list', 'GET', '/admin/styler/imageblob/'),
+            Endpoint('admin_stylepreset_list', 'GET', '/admin/styler/stylepreset/'),
+            Endpoint('admin_renderjob_list', 'GET', '/admin/styler/renderjob/'),
+        ]
+    return endpoints
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an ascending list"""
+    index = max(0, math.ceil(len(sorted_values) * percent / 100) - 1)
+    return sorted_values[index]
+
+
+def request_endpoint(client, endpoint, run):
+    """Send one request and read the whole body (streamed responses included); returns the status"""
+    if endpoint.method == 'GET':
+        response = client.get(endpoint.path)
+    elif endpoint.content_type:
+        response = client.post(endpoint.path, endpoint.data(run), content_type=endpoint.content_type)
+    else:
+        response = client.post(endpoint.path, endpoint.data(run))
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    response.close()
+    return response.status_code
+
+
+def run_endpoint(client, endpoint, repeat, cold=True):
+    """Latency percentiles, query counts and statuses of repeat requests to one endpoint"""
+    latencies = []
+    query_counts = []
+    statuses = set()
+    for run in range(repeat):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            statuses.add(request_endpoint(client, endpoint, run))
+            latencies.append(time.perf_counter() - started)
+        query_counts.append(len(queries))
+
+    latencies.sort()
+    return {
+        'method': endpoint.method,
+        'path': endpoint.path,
+        'requests': repeat,
+        'statuses': sorted(statuses),
+        **{f"p{percent}_ms": percentile(latencies, percent) * 1000 for percent in PERCENTILES},
+        'max_ms': latencies[-1] * 1000,
+        'queries': max(query_counts),
+        'min_queries': min(query_counts),
+        'query_budget': endpoint.budget,
+    }
+
+
+def run_api_benchmark(client, endpoints, repeat=10, cold=True, progress=None):
+    """
+    Run every endpoint repeat times with client (logged in for admin pages).
+    progress(name, result) is called after each endpoint. Returns the report.
+    """
+    results = {}
+    for endpoint in endpoints:
+        results[endpoint.name] = run_endpoint(client, endpoint, repeat, cold)
+        if progress:
+            progress(endpoint.name, results[endpoint.name])
+    return {
+        'created_at': timezone.now().isoformat(),
+        'images': StyledImage.objects.count(),
+        'repeat': repeat,
+        'cold': cold,
+        'endpoints': results,
+    }
+
+
+def check_report(report):
+    """(endpoint name, problem) for every endpoint over its query budget or answering with an error"""
+    problems = []
+    for name, result in report['endpoints'].items():
+        if result['queries'] > result['query_budget']:
+            problems.append((name, f"{result['queries']} queries, the budget is {result['query_budget']}"))
+        errors = [status for status in result['statuses'] if status >= 400]
+        if errors:
+            problems.append((name, f"answered with status {', '.join(str(status) for status in errors)}"))
+    return problems
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 class StylerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'styler'
\ No newline at end of file
+    name = 'styler'
+
+    def ready(self):
+        # Register model signal handlers (denormalized counters)
+        from . import signals  # noqa: F401
\ No newline at end of file
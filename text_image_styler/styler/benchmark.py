@@ -0,0 +1,312 @@
+"""
+Renderer micro-benchmark (see the benchmark_renderer command).
+
+add_text_to_image is run over a matrix of image sizes, text lengths and the
+expensive style options with one font, and every font of media/fonts is run
+on the smallest image (laying out a caption does not depend on the image
+size). Each case gets a fresh worker process, so the peak memory it reports
+(resident memory above what the idle worker uses) is its own. The first
+render of a case loads the font and is not measured; the sprite cache is
+cleared before every measured render, so each one lays out and rasterizes
+its caption.
+
+The sources are written to a temporary directory whose paths are passed to
+the workers: a spawned worker cannot read files the parent stored in a
+storage that lives in its memory. Outputs go to the media storage, as in
+production, and are deleted after each render.
+
+Results are plain JSON, written as a baseline and compared with one later.
+"""
+import contextlib
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import PIL
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image
+
+from .rendering import _init_worker
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE_VERSION = 1
+DEFAULT_SIZES = (1, 4, 12, 24)  # megapixels
+DEFAULT_FONT = ('Roboto', '600')
+
+TEXTS = {
+    'short': 'Sale',
+    'medium': 'The quick brown fox jumps over the lazy dog',
+    'long': (
+        'Sphinx of black quartz, judge my vow. Pack my box with five dozen liquor jugs. '
+        'How vexingly quick daft zebras jump! The five boxing wizards jump quickly.'
+    ),
+}
+
+# Style options on top of the case's font, sized and placed relative to the image
+PROFILES = {
+    'plain': {},
+    'letter_spacing': {'letter_spacing': 6},
+    'shadow': {'enable_shadow': True, 'shadow_x': 4, 'shadow_y': 4},
+    'rotation': {'text_rotate': 30},
+    'background': {'enable_background': True, 'text_background': '#00000099'},
+    'all': {
+        'letter_spacing': 6,
+        'enable_shadow': True,
+        'shadow_x': 4,
+        'shadow_y': 4,
+        'text_rotate': 30,
+        'enable_background': True,
+        'text_background': '#00000099',
+    },
+}
+
+
+def list_fonts():
+    """(family, weight) of every font file in MEDIA_ROOT/fonts, named like Work_Sans_600.ttf"""
+    fonts_dir = os.path.join(settings.MEDIA_ROOT, 'fonts')
+    fonts = []
+    if os.path.isdir(fonts_dir):
+        for filename in sorted(os.listdir(fonts_dir)):
+            stem, extension = os.path.splitext(filename)
+            if extension.lower() != '.ttf' or '_' not in stem:
+                continue
+            family, weight = stem.rsplit('_', 1)
+            fonts.append((family.replace('_', ' '), weight))
+    return fonts
+
+
+def image_dimensions(megapixels):
+    """(width, height) of a 3:2 image of about this many megapixels"""
+    width = round(math.sqrt(megapixels * 1_000_000 * 3 / 2))
+    return width, round(width * 2 / 3)
+
+
+def create_source(megapixels, directory):
+    """
+    Write a JPEG source of the given size into directory and return its path.
+    The content is a gradient under noise, so it decodes and encodes like a
+    photo rather than a flat image.
+    """
+    width, height = image_dimensions(megapixels)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 48)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    path = os.path.join(directory, f"source_{megapixels}mp.jpg")
+    image.save(path, 'JPEG', quality=90)
+    return path
+
+
+def build_cases(sizes, fonts, texts, profiles):
+    """
+    Case dicts of the benchmark: the size matrix with the default font (or the
+    first font when it is missing), then every font on the smallest size
+    """
+    if not sizes or not fonts:
+        return []
+    base_font = DEFAULT_FONT if DEFAULT_FONT in fonts else fonts[0]
+
+    combinations = [(megapixels, base_font) for megapixels in sizes]
+    combinations += [(min(sizes), font) for font in fonts if font != base_font]
+
+    cases = []
+    for megapixels, (family, weight) in combinations:
+        for text in texts:
+            for profile in profiles:
+                cases.append({
+                    'name': f"{megapixels}mp/{family.replace(' ', '_')}_{weight}/{text}/{profile}",
+                    'megapixels': megapixels,
+                    'font_family': family,
+                    'font_weight': weight,
+                    'text': text,
+                    'profile': profile,
+                })
+    return cases
+
+
+def case_style(case):
+    """StyleSpec of a case: the profile's options with a font size and position relative to the image"""
+    from .styles import StyleSpec
+
+    width, height = image_dimensions(case['megapixels'])
+    return StyleSpec(
+        font_family=case['font_family'],
+        font_weight=case['font_weight'],
+        font_size=max(12, width // 24),
+        x_position=width // 2,
+        y_position=height // 3,
+        **PROFILES[case['profile']],
+    )
+
+
+def read_process_status(field):
+    """A memory field of /proc/self/status (e.g. VmRSS) in bytes, None where there is none"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_memory():
+    """Restart the peak resident memory count of this process (Linux only); False when not possible"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory():
+    """Peak resident memory of this process in bytes, None where it cannot be read"""
+    peak = read_process_status('VmHWM')
+    if peak is not None or resource is None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other systems kilobytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_case(task):
+    """
+    Worker entry point: render one case repeat times after a warm-up render
+    task: (case, source file path, repeat)
+    Returns the case's result dict.
+    """
+    from .retention import delete_output
+    from .sprites import sprite_cache
+    from .utils import render_text_image, store_render
+
+    case, source_path, repeat = task
+    style = case_style(case)
+    text = TEXTS[case['text']]
+    # Where the peak cannot be reset, the growth of the process peak is all that can be measured
+    memory_before = read_process_status('VmRSS') if reset_peak_memory() else peak_memory()
+
+    totals = []
+    stage_runs = []
+    # The renderer reports every step on stdout
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for run in range(repeat + 1):
+            sprite_cache.clear()
+            timings = {}
+            started = time.perf_counter()
+            # add_text_to_image, reading the source from the local file
+            with open(source_path, 'rb') as source:
+                final_image = render_text_image(source, text, style, timings=timings)
+            output_name = store_render(final_image, source_path, timings)
+            elapsed = time.perf_counter() - started
+            delete_output(output_name)
+            if run:
+                totals.append(elapsed)
+                stage_runs.append(timings)
+
+    memory_after = peak_memory()
+    width, height = image_dimensions(case['megapixels'])
+    return {
+        **case,
+        'width': width,
+        'height': height,
+        'seconds': statistics.median(totals),
+        'min_seconds': min(totals),
+        'stages': {
+            stage: statistics.median(timings.get(stage, 0) for timings in stage_runs)
+            for stage in stage_runs[0]
+        },
+        'peak_memory_bytes': (
+            max(0, memory_after - memory_before) if None not in (memory_before, memory_after) else None
+        ),
+    }
+
+
+def run_benchmark(cases, repeat=3, progress=None):
+    """
+    Run every case in its own worker process, one at a time so cases do not
+    compete for the CPU. progress(result) is called after each case.
+    Returns the results document (see compare_results for its use as a baseline).
+    """
+    source_dir = tempfile.mkdtemp(prefix='styler-benchmark-')
+    sources = {}
+    results = {}
+    try:
+        for megapixels in sorted({case['megapixels'] for case in cases}):
+            sources[megapixels] = create_source(megapixels, source_dir)
+
+        for case in cases:
+            with ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            ) as pool:
+                result = pool.submit(run_case, (case, sources[case['megapixels']], repeat)).result()
+            results[case['name']] = result
+            if progress:
+                progress(result)
+    finally:
+        shutil.rmtree(source_dir, ignore_errors=True)
+
+    return {
+        'version': BASELINE_VERSION,
+        'created_at': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'repeat': repeat,
+        'cases': results,
+    }
+
+
+def compare_results(results, baseline, threshold, memory_threshold, min_seconds=0.002, min_bytes=1024 * 1024):
+    """
+    Regressions of results against baseline: a list of (case name, message).
+    A case regresses when its median time grows by more than threshold (a
+    fraction) and min_seconds, or its peak memory by more than memory_threshold
+    and min_bytes. The absolute floors keep timer noise on tiny cases out.
+    """
+    regressions = []
+    for name, result in results['cases'].items():
+        before = baseline['cases'].get(name)
+        if before is None:
+            continue
+
+        growth = result['seconds'] - before['seconds']
+        if growth > min_seconds and result['seconds'] > before['seconds'] * (1 + threshold):
+            # Name the stage that grew the most, to point at the cause
+            stage_growth = {
+                stage: seconds - before['stages'].get(stage, 0)
+                for stage, seconds in result['stages'].items()
+            }
+            stage = max(stage_growth, key=stage_growth.get)
+            regressions.append((name, (
+                f"{before['seconds'] * 1000:.1f} ms → {result['seconds'] * 1000:.1f} ms "
+                f"(+{growth / before['seconds']:.0%}, mostly {stage} +{stage_growth[stage] * 1000:.1f} ms)"
+            )))
+
+        memory = result.get('peak_memory_bytes')
+        memory_before = before.get('peak_memory_bytes')
+        if memory is not None and memory_before is not None:
+            memory_growth = memory - memory_before
+            if memory_growth > min_bytes and memory > memory_before * (1 + memory_threshold):
+                regressions.append((name, (
+                    f"peak memory {memory_before / 2**20:.1f} MiB → {memory / 2**20:.1f} MiB "
+                    f"(+{memory_growth / max(memory_before, 1):.0%})"
+                )))
+    return regressions
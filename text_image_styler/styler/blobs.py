@@ -0,0 +1,141 @@
+"""
+Content-addressed storage of uploaded originals.
+
+Uploads are hashed while they stream in (HashingUploadHandler) and stored
+once as originals/<aa>/<sha256><ext>. Every StyledImage made from the same
+photo references the same ImageBlob; ref_count is kept by signals and the
+file is only deleted once the last image using it is gone.
+
+store_blob() counts a reference for its caller in the same statement that
+finds or creates the blob, so a blob that is about to be used can never be
+deleted as unused. The caller passes it on to the image it creates (whose
+signal counts its own reference) and then drops it with release_blob(),
+also when creating the image failed.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F, ProtectedError
+
+from .thumbnails import delete_thumbnails
+
+BLOB_DIR = 'originals'
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Computes the SHA-256 of every uploaded file as its chunks pass through to
+    the next handler, so the file never has to be read twice
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        self.size += len(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        # Files of one field arrive in the same order as request.FILES.getlist()
+        digests = getattr(self.request, '_upload_sha256', None)
+        if digests is None:
+            digests = self.request._upload_sha256 = {}
+        digests.setdefault(self.field_name, []).append((self.hasher.hexdigest(), self.size))
+        return None
+
+
+def hash_file(content):
+    """SHA-256 hex digest of a File, read in chunks"""
+    hasher = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+def get_upload_sha256(request, field_name, uploaded_file, index=0):
+    """Digest computed by HashingUploadHandler, hashing the file when it is not available"""
+    recorded = getattr(request, '_upload_sha256', {}).get(field_name, [])
+    if index < len(recorded):
+        digest, size = recorded[index]
+        if size == uploaded_file.size:
+            return digest
+    return hash_file(uploaded_file)
+
+
+def blob_name(sha256, original_name):
+    """Storage name of the blob with this digest"""
+    extension = os.path.splitext(original_name or '')[1].lower()
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256}{extension}"
+
+
+def store_blob(content, sha256=None):
+    """
+    ImageBlob holding content (a File), only writing the file when no blob
+    with the same hash exists yet. The blob has a reference counted for the
+    caller, to be dropped with release_blob().
+    Returns: (blob, created)
+    """
+    from .models import ImageBlob
+
+    if sha256 is None:
+        sha256 = hash_file(content)
+
+    # Taking the reference and finding the blob is one statement, so a
+    # concurrent delete_blob_if_unused() either sees it or has already run
+    if ImageBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1):
+        return ImageBlob.objects.get(sha256=sha256), False
+
+    name = blob_name(sha256, content.name)
+    if not default_storage.exists(name):
+        content.seek(0)
+        name = default_storage.save(name, content)
+
+    try:
+        with transaction.atomic():
+            return ImageBlob.objects.create(sha256=sha256, file=name, size=content.size, ref_count=1), True
+    except IntegrityError:
+        # Another request stored the same content first
+        if not ImageBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1):
+            raise
+        blob = ImageBlob.objects.get(sha256=sha256)
+        if blob.file.name != name:
+            default_storage.delete(name)
+        return blob, False
+
+
+def release_blob(blob_id, count=1):
+    """Drop references taken by store_blob(), deleting the blob after commit when nothing uses it"""
+    from .models import ImageBlob
+
+    ImageBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - count)
+    transaction.on_commit(lambda: delete_blob_if_unused(blob_id))
+
+
+def delete_blob_if_unused(blob_id):
+    """Delete a blob and its file once no image references it"""
+    from .models import ImageBlob
+
+    try:
+        with transaction.atomic():
+            # The lock makes a concurrent store_blob() wait, and find no blob, until the files are gone
+            blob = ImageBlob.objects.select_for_update().filter(pk=blob_id, ref_count=0).first()
+            if blob is None:
+                return
+            blob.delete()
+            default_storage.delete(blob.file.name)
+            if blob.working_file:
+                default_storage.delete(blob.working_file.name)
+            delete_thumbnails(blob.file.name)
+    except ProtectedError:
+        # ref_count drifted, an image still uses this blob
+        print(f"✗ Blob {blob.sha256} has ref_count 0 but is still referenced")
+        return
+    print(f"✓ Deleted unused original: {blob.file.name}")
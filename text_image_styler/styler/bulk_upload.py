@@ -0,0 +1,204 @@
+"""
+Bulk ingestion of many uploads, or ZIP archives of them, with one shared style.
+
+Files are ingested one at a time; ZIP members are read straight from the
+uploaded archive, never extracted as a whole. Every batch of
+STYLER_RENDER_BATCH_SIZE images is rendered in the render pool and inserted
+with bulk_create. bulk_create sends no signals, so the category, tag and blob
+counters and the response caches are updated here instead.
+"""
+import os
+import zipfile
+from collections import Counter
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from .blobs import get_upload_sha256, release_blob
+from .ingest import IngestError, ingest_upload
+from .models import StyledImage
+from .rendering import get_render_batch_size, get_render_pool, render_task
+from .retention import delete_output
+from .signals import adjust_category_count, adjust_tag_counts, invalidate_after_commit
+
+
+def get_bulk_upload_max_files():
+    """Most images accepted by one bulk upload, ZIP members included"""
+    return getattr(settings, 'STYLER_BULK_UPLOAD_MAX_FILES', 500)
+
+
+def get_bulk_upload_max_member_bytes():
+    """Largest uncompressed ZIP member accepted"""
+    return getattr(settings, 'STYLER_BULK_UPLOAD_MAX_MEMBER_BYTES', 50 * 1024 * 1024)
+
+
+def is_skipped_member(info):
+    """Directories and the metadata files archivers add"""
+    if info.is_dir():
+        return True
+    if info.filename.startswith('__MACOSX/'):
+        return True
+    return os.path.basename(info.filename).startswith('.')
+
+
+def iter_upload_members(request, field_name):
+    """
+    Yield (name, File or None, sha256 or None, error or None) for every uploaded
+    file of field_name, expanding ZIP archives one member at a time
+    """
+    for index, uploaded in enumerate(request.FILES.getlist(field_name)):
+        if not zipfile.is_zipfile(uploaded):
+            uploaded.seek(0)
+            yield uploaded.name, uploaded, get_upload_sha256(request, field_name, uploaded, index), None
+            continue
+
+        uploaded.seek(0)
+        try:
+            archive = zipfile.ZipFile(uploaded)
+        except zipfile.BadZipFile as e:
+            yield uploaded.name, None, None, f"Invalid ZIP archive: {e}"
+            continue
+
+        with archive:
+            for info in archive.infolist():
+                if is_skipped_member(info):
+                    continue
+                name = f"{uploaded.name}/{info.filename}"
+                if info.file_size > get_bulk_upload_max_member_bytes():
+                    yield name, None, None, (
+                        f"File is {info.file_size:,} bytes, the limit is {get_bulk_upload_max_member_bytes():,}"
+                    )
+                    continue
+                try:
+                    member = archive.open(info)
+                except (RuntimeError, NotImplementedError, zipfile.BadZipFile) as e:
+                    # Encrypted or unsupported compression
+                    yield name, None, None, f"Cannot read archive member: {e}"
+                    continue
+                content = File(member, name=os.path.basename(info.filename))
+                content.size = info.file_size
+                try:
+                    yield name, content, None, None
+                finally:
+                    member.close()
+
+
+def bulk_ingest(members, text, style, category=None, tags=(), pool=None):
+    """
+    Ingest, render and create one StyledImage per member of iter_upload_members
+    Returns one result dict per member, in order, and a single one for all
+    members past STYLER_BULK_UPLOAD_MAX_FILES.
+    """
+    pool = pool or get_render_pool()
+    batch_size = get_render_batch_size()
+    max_files = get_bulk_upload_max_files()
+
+    results = []
+    batch = []
+    for name, content, sha256, error in members:
+        if len(results) >= max_files:
+            # One result stands for this and every later file, which are not read
+            results.append({
+                'name': name,
+                'success': False,
+                'error': f"Only {max_files} images are accepted per upload; this file and any after it were skipped",
+            })
+            break
+        result = {'name': name, 'success': False}
+        results.append(result)
+        if error:
+            result['error'] = error
+            continue
+
+        try:
+            blob, _, _ = ingest_upload(content, sha256)
+        except IngestError as e:
+            result['error'] = str(e)
+            continue
+        except Exception as e:
+            result['error'] = f"Error saving image: {e}"
+            continue
+
+        batch.append((result, blob))
+        if len(batch) >= batch_size:
+            create_batch(batch, text, style, category, tags, pool)
+            batch = []
+
+    if batch:
+        create_batch(batch, text, style, category, tags, pool)
+    return results
+
+
+def create_batch(batch, text, style, category, tags, pool):
+    """
+    Render a batch of (result, blob) in the pool and insert the images that
+    rendered. The references ingest took on the blobs become those of the new
+    images; the others are dropped (originals whose images all failed are deleted).
+    """
+    leases = Counter(blob.id for _, blob in batch)
+    try:
+        leases.subtract(image.blob_id for image in insert_batch(batch, text, style, category, tags, pool))
+    finally:
+        for blob_id, count in leases.items():
+            if count:
+                release_blob(blob_id, count)
+
+
+def insert_batch(batch, text, style, category, tags, pool):
+    """Render and insert the images of create_batch(); returns the inserted images"""
+    tasks = []
+    for index, (_, blob) in enumerate(batch):
+        source_name, scale = blob.get_render_source()
+        tasks.append((index, source_name, text, style, scale))
+
+    images = []
+    rendered = []
+    for index, output_name, seconds, error in pool.map(render_task, tasks):
+        result, blob = batch[index]
+        if error:
+            result['error'] = f"Image processing failed: {error}"
+            continue
+        image = StyledImage(
+            original_image=blob.file.name,
+            blob=blob,
+            text=text,
+            **style.as_fields(),
+            output_image=output_name,
+            output_has_thumbnails=True,
+            category=category,
+            update_clicks=0,
+        )
+        image.output_signature = image.get_render_signature(text, style)
+        images.append(image)
+        rendered.append(result)
+
+    if not images:
+        return []
+
+    try:
+        with transaction.atomic():
+            images = StyledImage.objects.bulk_create(images)
+            if tags:
+                links = StyledImage.tags.through
+                links.objects.bulk_create([
+                    links(styledimage_id=image.id, tag_id=tag.id) for image in images for tag in tags
+                ])
+
+            # The counters and caches the post_save and m2m_changed signals would update
+            adjust_category_count(category.id if category else None, len(images))
+            adjust_tag_counts([tag.id for tag in tags], len(images))
+            invalidate_after_commit(generations=('image', 'tag'), stats=True, landing=True)
+    except Exception as e:
+        for image, result in zip(images, rendered):
+            delete_output(image.output_image.name)
+            result['error'] = f"Database save failed: {e}"
+        return []
+
+    for image, result in zip(images, rendered):
+        result.update({
+            'success': True,
+            'styled_image_id': image.id,
+            'output_image_url': image.output_image.url,
+        })
+    return images
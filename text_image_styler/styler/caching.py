@@ -0,0 +1,149 @@
+"""
+Response caching helpers for the styler read endpoints.
+"""
+import hashlib
+import secrets
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.http import HttpResponse
+
+from .models import CacheGeneration
+
+# Each site's payload has its own key, which includes a version token;
+# replacing the token invalidates the payloads of every site at once
+LANDING_KEY_PREFIX = 'styler:landing:'
+LANDING_VERSION_KEY = 'styler:landing-version'
+# (version, ids of the images the payloads of that version feature), so click
+# flushes can tell whether they change the landing page
+LANDING_IMAGES_KEY = 'styler:landing-images'
+
+
+def get_landing_cache_ttl():
+    """Backstop expiry for writes made by processes that do not share this cache"""
+    return getattr(settings, 'STYLER_LANDING_CACHE_TTL', 300)
+
+
+def get_landing_version():
+    """
+    Version token the landing payloads are currently stored under. Read it
+    before building a payload, so a write made meanwhile is never cached.
+    """
+    cache.add(LANDING_VERSION_KEY, secrets.token_hex(8), None)
+    return cache.get(LANDING_VERSION_KEY)
+
+
+def get_cached_landing(version, site):
+    """Encoded landing payload for site, or None"""
+    if version is None:
+        return None
+    return cache.get(f"{LANDING_KEY_PREFIX}{version}:{site}")
+
+
+def set_cached_landing(version, site, content, image_ids):
+    """Store the encoded landing payload for site, which features image_ids"""
+    if version is None:
+        return
+    cache.set_many({
+        f"{LANDING_KEY_PREFIX}{version}:{site}": content,
+        LANDING_IMAGES_KEY: (version, set(image_ids)),
+    }, get_landing_cache_ttl())
+
+
+def invalidate_landing_cache(image_ids=None):
+    """
+    Drop the landing payloads after categories or images change. With image_ids
+    (images whose clicks changed), only when the landing page features one of them.
+    """
+    if image_ids is not None:
+        values = cache.get_many([LANDING_VERSION_KEY, LANDING_IMAGES_KEY])
+        version = values.get(LANDING_VERSION_KEY)
+        if version is None:
+            # No payload can be read without a version
+            return
+        featured_version, featured_ids = values.get(LANDING_IMAGES_KEY, (None, None))
+        if featured_version == version and featured_ids.isdisjoint(image_ids):
+            return
+    cache.set(LANDING_VERSION_KEY, secrets.token_hex(8), None)
+
+
+# =================== VERSIONED RESPONSE CACHE ===================
+# Every model has a generation counter that is bumped after each committed
+# write. Cached responses are keyed by the generations of the models they
+# read, so a write invalidates them all with one counter increment. The
+# counters are CacheGeneration rows: an UPDATE with F() + 1 is atomic across
+# processes (the file cache's incr is a get and a set), and culling the cache
+# can never evict one and send it back to an old value.
+
+RESPONSE_KEY_PREFIX = 'styler:response:'
+
+
+def get_response_cache_ttl():
+    """Backstop expiry for cached responses"""
+    return getattr(settings, 'STYLER_RESPONSE_CACHE_TTL', 600)
+
+
+def _fresh_generation():
+    # Starting from the clock means a recreated counter never reuses an old value
+    return time.time_ns() // 1000
+
+
+def get_generations(*names):
+    """
+    Current generation of every named model (one query). A counter that does
+    not exist yet is created and reported as None, which callers treat as a miss.
+    """
+    generations = dict(CacheGeneration.objects.filter(name__in=names).values_list('name', 'value'))
+    missing = [name for name in names if name not in generations]
+    if missing:
+        CacheGeneration.objects.bulk_create(
+            [CacheGeneration(name=name, value=_fresh_generation()) for name in missing],
+            ignore_conflicts=True
+        )
+    return {name: generations.get(name) for name in names}
+
+
+def bump_generation(*names):
+    """Invalidate every cached response that depends on the named models"""
+    if names:
+        CacheGeneration.objects.filter(name__in=names).update(value=F('value') + 1)
+
+
+def cache_response(*model_names, timeout=None):
+    """
+    Cache successful GET responses of a view until one of model_names
+    ('image', 'category', 'tag') is written
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_func(request, *args, **kwargs)
+
+            generations = get_generations(*model_names)
+            if None in generations.values():
+                return view_func(request, *args, **kwargs)
+            versions = ':'.join(f"{name}={generations[name]}" for name in model_names)
+            digest = hashlib.md5(
+                f"{request.build_absolute_uri()}|{versions}".encode('utf-8')
+            ).hexdigest()
+            key = f"{RESPONSE_KEY_PREFIX}{view_func.__name__}:{digest}"
+
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(
+                    key,
+                    (response.content, response['Content-Type']),
+                    timeout if timeout is not None else get_response_cache_ttl()
+                )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,212 @@
+"""
+Write-behind aggregation for StyledImage.update_clicks.
+
+Update requests only insert a PendingClick row, so a click is part of the
+request's transaction and survives the process that recorded it, even when
+that one is killed. A flush, started by a timer in the process that recorded
+the click (or by the next flush of any process), reads up to
+STYLER_CLICK_FLUSH_MAX_PENDING pending rows and writes them with
+UPDATE ... SET update_clicks = update_clicks + CASE ... statements, then
+deletes them in the same transaction, so increments coming from several
+worker processes are never lost or counted twice. Statements cover at most
+FLUSH_CHUNK_SIZE images or buckets (SQLite rejects expressions nested 1000
+deep). The same flush adds the clicks to the hourly ClickRollup buckets that
+back the timeframe rankings and to the time-decayed trending scores.
+"""
+import atexit
+import threading
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Case, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from .caching import bump_generation, invalidate_landing_cache
+from .stats import invalidate_stats_snapshot
+from .trending import click_weight
+
+# Images or (image, bucket) pairs per UPDATE statement
+FLUSH_CHUNK_SIZE = 250
+
+
+def get_flush_interval():
+    """Seconds between flushes; 0 writes every click immediately"""
+    return getattr(settings, 'STYLER_CLICK_FLUSH_INTERVAL', 5)
+
+
+def get_max_pending():
+    """Pending rows written per flush, and clicks recorded by a process that force an early flush"""
+    return getattr(settings, 'STYLER_CLICK_FLUSH_MAX_PENDING', 1000)
+
+
+def chunked(items, size):
+    """Lists of at most size items"""
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def hour_bucket(moment):
+    """Start of the hour containing moment"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class ClickAggregator:
+    """Records clicks as PendingClick rows and flushes them in bulk updates"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recorded = 0
+        self._timer = None
+
+    def record(self, image_id, count=1):
+        """Store count clicks for image_id (in the current transaction) and schedule a flush"""
+        from .models import PendingClick
+
+        PendingClick.objects.create(image_id=image_id, bucket=hour_bucket(timezone.now()), count=count)
+        with self._lock:
+            self._recorded += 1
+            flush_now = get_flush_interval() <= 0 or self._recorded >= get_max_pending()
+            if not flush_now:
+                self._schedule_flush()
+
+        if flush_now:
+            # The clicks only exist for other connections once the transaction commits
+            transaction.on_commit(self.flush)
+
+    def _schedule_flush(self):
+        # Called with the lock held
+        if self._timer is None:
+            self._timer = threading.Timer(get_flush_interval(), self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def pending(self, image_id):
+        """Clicks recorded by any process that are not written yet"""
+        from .models import PendingClick
+
+        return PendingClick.objects.filter(image_id=image_id).aggregate(total=Sum('count'))['total'] or 0
+
+    def flush(self):
+        """
+        Write up to STYLER_CLICK_FLUSH_MAX_PENDING pending rows with F()-based
+        UPDATEs and delete them. Returns the number of clicks written.
+        """
+        from .models import PendingClick, StyledImage
+
+        with self._lock:
+            self._recorded = 0
+        limit = get_max_pending()
+        weight = click_weight()
+        with transaction.atomic():
+            # Concurrent flushes on databases with row locks take disjoint rows
+            rows = list(
+                PendingClick.objects.select_for_update(skip_locked=True)
+                .order_by('pk').values_list('pk', 'image_id', 'bucket', 'count')[:limit]
+            )
+            if not rows:
+                return 0
+
+            pending = {}
+            pending_buckets = {}
+            for _, image_id, bucket, count in rows:
+                pending[image_id] = pending.get(image_id, 0) + count
+                pending_buckets[(image_id, bucket)] = pending_buckets.get((image_id, bucket), 0) + count
+
+            for chunk in chunked(pending.items(), FLUSH_CHUNK_SIZE):
+                StyledImage.objects.filter(pk__in=[image_id for image_id, _ in chunk]).update(
+                    update_clicks=F('update_clicks') + Case(
+                        *[When(pk=image_id, then=Value(count)) for image_id, count in chunk],
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    ),
+                    trending_score=F('trending_score') + Case(
+                        *[When(pk=image_id, then=Value(count * weight)) for image_id, count in chunk],
+                        default=Value(0.0),
+                        output_field=FloatField(),
+                    ),
+                )
+            self._flush_rollups(pending_buckets)
+            for chunk in chunked([pk for pk, _, _, _ in rows], FLUSH_CHUNK_SIZE):
+                PendingClick.objects.filter(pk__in=chunk).delete()
+
+        if len(rows) == limit:
+            # More than one flush worth of rows; the timer picks up the rest
+            with self._lock:
+                self._schedule_flush()
+        invalidate_stats_snapshot()
+        # The landing page only shows the clicks of the images it features
+        invalidate_landing_cache(pending.keys())
+        bump_generation('image')
+        return sum(pending.values())
+
+    def _flush_rollups(self, pending_buckets):
+        """Add buffered clicks to the hourly rollup rows"""
+        from .models import ClickRollup, StyledImage
+
+        # Images deleted since the click was recorded have nothing to roll up into
+        existing_ids = set(StyledImage.objects.filter(
+            pk__in={image_id for image_id, _ in pending_buckets}
+        ).values_list('pk', flat=True))
+        pending_buckets = {
+            key: count for key, count in pending_buckets.items() if key[0] in existing_ids
+        }
+        if not pending_buckets:
+            return
+
+        # Make sure every bucket row exists, then increment them all at once
+        ClickRollup.objects.bulk_create([
+            ClickRollup(image_id=image_id, granularity=ClickRollup.HOUR, bucket=bucket, count=0)
+            for image_id, bucket in pending_buckets
+        ], ignore_conflicts=True)
+
+        for chunk in chunked(pending_buckets.items(), FLUSH_CHUNK_SIZE):
+            bucket_filter = Q()
+            whens = []
+            for (image_id, bucket), count in chunk:
+                bucket_filter |= Q(image_id=image_id, bucket=bucket)
+                whens.append(When(image_id=image_id, bucket=bucket, then=Value(count)))
+            ClickRollup.objects.filter(bucket_filter, granularity=ClickRollup.HOUR).update(
+                count=F('count') + Case(*whens, default=Value(0), output_field=IntegerField())
+            )
+
+    def reset(self, image_ids):
+        """Zero the clicks, trending scores and rollups of image_ids and drop their pending clicks"""
+        from .models import ClickRollup, PendingClick, StyledImage
+
+        image_ids = list(image_ids)
+        with transaction.atomic():
+            PendingClick.objects.filter(image_id__in=image_ids).delete()
+            ClickRollup.objects.filter(image_id__in=image_ids).delete()
+            updated = StyledImage.objects.filter(pk__in=image_ids).update(update_clicks=0, trending_score=0)
+        invalidate_stats_snapshot()
+        invalidate_landing_cache(image_ids)
+        bump_generation('image')
+        return updated
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            close_old_connections()
+            self.flush()
+        except Exception as e:
+            print(f"✗ Error flushing click counters: {e}")
+        finally:
+            connections.close_all()
+
+
+click_aggregator = ClickAggregator()
+
+
+@atexit.register
+def _flush_on_exit():
+    # Rows of processes that exit without flushing wait for the next flush of any process
+    if click_aggregator._timer is None:
+        return
+    try:
+        while click_aggregator.flush():
+            pass
+    except Exception as e:
+        print(f"✗ Error flushing click counters on exit: {e}")
@@ -0,0 +1,297 @@
+"""
+Streaming ZIP export of styled outputs.
+
+Archives are written on the fly with STORED entries (outputs are JPEGs, so
+compressing them again gains nothing) and never held in memory. The layout
+only depends on the names and sizes of the files, so the length is known
+before the first byte is sent and the same outputs always produce the same
+bytes, which is what lets clients resume a download with Range / If-Range.
+
+CRCs are not known up front: each one is computed while its file streams and
+written in a data descriptor after it. The central directory at the end needs
+all of them, so a resumed download re-reads the files it skipped to checksum
+them. Archives over 4 GiB or 65535 entries use the ZIP64 records.
+"""
+import hashlib
+import os
+import re
+import struct
+import zlib
+
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.text import slugify
+
+CHUNK_SIZE = 64 * 1024
+
+# General purpose flags: sizes and CRC follow the data, names are UTF-8
+DATA_DESCRIPTOR_FLAG = 0x0008
+UTF8_FLAG = 0x0800
+ENTRY_FLAGS = DATA_DESCRIPTOR_FLAG | UTF8_FLAG
+
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+# Values of the 32/16-bit fields whose real value is in the ZIP64 records
+ZIP64_MARKER = 0xFFFFFFFF
+ZIP64_COUNT_MARKER = 0xFFFF
+UNIX_FILE_ATTRIBUTES = 0o100644 << 16
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+ZIP64_OFFSET_EXTRA = struct.Struct('<HHQ')
+ZIP64_END = struct.Struct('<IQHHIIQQQQ')
+ZIP64_END_LOCATOR = struct.Struct('<IIQI')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class ExportEntry:
+    """One output file in an archive"""
+    __slots__ = ('name', 'storage_name', 'size', 'dos_time', 'dos_date', 'offset', 'crc')
+
+    def __init__(self, name, storage_name, size, modified):
+        self.name = name.encode('utf-8')
+        self.storage_name = storage_name
+        self.size = size
+        self.dos_time, self.dos_date = dos_date_time(modified)
+        self.offset = 0
+        self.crc = None
+
+    @property
+    def needs_zip64(self):
+        return self.offset >= ZIP64_LIMIT
+
+
+def dos_date_time(value):
+    """(time, date) fields of a datetime in the MS-DOS format ZIP uses"""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    if value.year < 1980:
+        return 0, (1 << 5) | 1
+    return (
+        (value.hour << 11) | (value.minute << 5) | (value.second // 2),
+        ((value.year - 1980) << 9) | (value.month << 5) | value.day,
+    )
+
+
+def entry_name(image):
+    """Archive name of an image's output: id plus a slug of its name or text"""
+    extension = os.path.splitext(image.output_image.name)[1] or '.jpg'
+    slug = slugify(image.image_name or image.text)[:60]
+    return f"{image.id}_{slug}{extension}" if slug else f"{image.id}{extension}"
+
+
+def build_entries(images):
+    """ExportEntry for every image whose output file exists, in queryset order"""
+    entries = []
+    for image in images:
+        if not image.output_image:
+            continue
+        try:
+            size = default_storage.size(image.output_image.name)
+        except OSError:
+            print(f"⚠ Export skipped missing output: {image.output_image.name}")
+            continue
+        entries.append(ExportEntry(entry_name(image), image.output_image.name, size, image.last_updated))
+    return entries
+
+
+class ZipExport:
+    """
+    A STORED ZIP of ExportEntry files whose bytes are produced on demand,
+    for the whole archive or any byte range of it
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        # (kind, entry, length) in archive order
+        self.segments = []
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            for kind, length in (
+                ('local', LOCAL_HEADER.size + len(entry.name)),
+                ('data', entry.size),
+                ('descriptor', DATA_DESCRIPTOR.size),
+            ):
+                self.segments.append((kind, entry, length))
+                offset += length
+
+        self.central_offset = offset
+        for entry in entries:
+            length = CENTRAL_HEADER.size + len(entry.name)
+            if entry.needs_zip64:
+                length += ZIP64_OFFSET_EXTRA.size
+            self.segments.append(('central', entry, length))
+            offset += length
+        self.central_size = offset - self.central_offset
+
+        self.zip64 = (
+            len(entries) >= ZIP64_COUNT_LIMIT
+            or self.central_offset >= ZIP64_LIMIT
+            or self.central_size >= ZIP64_LIMIT
+        )
+        end_length = END_OF_CENTRAL_DIRECTORY.size
+        if self.zip64:
+            end_length += ZIP64_END.size + ZIP64_END_LOCATOR.size
+        self.segments.append(('end', None, end_length))
+        self.total_size = offset + end_length
+
+    @property
+    def etag(self):
+        """Strong ETag: equal tags mean byte-identical archives"""
+        digest = hashlib.md5()
+        for entry in self.entries:
+            digest.update(entry.name + b'\0' + entry.storage_name.encode('utf-8'))
+            digest.update(struct.pack('<QHH', entry.size, entry.dos_time, entry.dos_date))
+        return f'"{digest.hexdigest()}"'
+
+    def iter_bytes(self, start=0, end=None):
+        """Yield the archive bytes from start to end (inclusive)"""
+        end = self.total_size - 1 if end is None else end
+        position = 0
+        for kind, entry, length in self.segments:
+            segment_start = position
+            position += length
+            if position <= start:
+                continue
+            if segment_start > end:
+                break
+            low = max(start, segment_start) - segment_start
+            high = min(end + 1, position) - segment_start
+            if kind == 'data':
+                yield from self.read_data(entry, low, high)
+            else:
+                yield self.segment_bytes(kind, entry)[low:high]
+
+    def read_data(self, entry, low, high):
+        """Yield bytes low:high of an entry's file, computing its CRC on the way when needed"""
+        with default_storage.open(entry.storage_name, 'rb') as f:
+            if entry.crc is not None:
+                f.seek(low)
+                remaining = high - low
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise OSError(f"{entry.storage_name} is shorter than when the export started")
+                    remaining -= len(chunk)
+                    yield chunk
+                return
+
+            # The whole file is read for the checksum, only low:high is sent
+            crc = 0
+            position = 0
+            while position < entry.size:
+                chunk = f.read(min(CHUNK_SIZE, entry.size - position))
+                if not chunk:
+                    raise OSError(f"{entry.storage_name} is shorter than when the export started")
+                crc = zlib.crc32(chunk, crc)
+                chunk_start = position
+                position += len(chunk)
+                if position > low and chunk_start < high:
+                    yield chunk[max(low - chunk_start, 0):high - chunk_start]
+            entry.crc = crc
+
+    def checksum(self, entry):
+        """CRC-32 of an entry, reading its file when it has not been streamed"""
+        if entry.crc is None:
+            for _ in self.read_data(entry, 0, 0):
+                pass
+        return entry.crc
+
+    def segment_bytes(self, kind, entry):
+        if kind == 'local':
+            return LOCAL_HEADER.pack(
+                0x04034b50, ZIP_VERSION, ENTRY_FLAGS, 0, entry.dos_time, entry.dos_date,
+                0, entry.size, entry.size, len(entry.name), 0,
+            ) + entry.name
+        if kind == 'descriptor':
+            return DATA_DESCRIPTOR.pack(0x08074b50, self.checksum(entry), entry.size, entry.size)
+        if kind == 'central':
+            version = ZIP64_VERSION if entry.needs_zip64 else ZIP_VERSION
+            extra = ZIP64_OFFSET_EXTRA.pack(0x0001, 8, entry.offset) if entry.needs_zip64 else b''
+            return CENTRAL_HEADER.pack(
+                0x02014b50, (3 << 8) | version, version, ENTRY_FLAGS, 0, entry.dos_time, entry.dos_date,
+                self.checksum(entry), entry.size, entry.size, len(entry.name), len(extra), 0, 0, 0,
+                UNIX_FILE_ATTRIBUTES, ZIP64_MARKER if entry.needs_zip64 else entry.offset,
+            ) + entry.name + extra
+        return self.end_bytes()
+
+    def end_bytes(self):
+        """End of central directory record, preceded by the ZIP64 records when needed"""
+        count = len(self.entries)
+        if not self.zip64:
+            return END_OF_CENTRAL_DIRECTORY.pack(
+                0x06054b50, 0, 0, count, count, self.central_size, self.central_offset, 0
+            )
+        zip64_end_offset = self.central_offset + self.central_size
+        return (
+            ZIP64_END.pack(
+                0x06064b50, ZIP64_END.size - 12, ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+                count, count, self.central_size, self.central_offset,
+            )
+            + ZIP64_END_LOCATOR.pack(0x07064b50, 0, zip64_end_offset, 1)
+            + END_OF_CENTRAL_DIRECTORY.pack(
+                0x06054b50, 0, 0, ZIP64_COUNT_MARKER, ZIP64_COUNT_MARKER, ZIP64_MARKER, ZIP64_MARKER, 0,
+            )
+        )
+
+
+def parse_range(header, total_size):
+    """
+    (start, end) of a single-range Range header, or None when it should be
+    ignored (malformed or multiple ranges)
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(total_size - length, 0), total_size - 1
+    start = int(first)
+    end = min(int(last), total_size - 1) if last else total_size - 1
+    if start >= total_size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def export_response(request, images, filename):
+    """Streaming ZIP response of the outputs of images, honouring Range and If-Range"""
+    archive = ZipExport(build_entries(images))
+    start, end = 0, archive.total_size - 1
+    status = 200
+
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    # A stale If-Range means the archive changed, so the whole of it is sent
+    if range_header and (if_range is None or if_range == archive.etag):
+        try:
+            byte_range = parse_range(range_header, archive.total_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{archive.total_size}"
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+
+    response = StreamingHttpResponse(
+        archive.iter_bytes(start, end), status=status, content_type='application/zip'
+    )
+    response['Content-Length'] = str(end - start + 1)
+    if status == 206:
+        response['Content-Range'] = f"bytes {start}-{end}/{archive.total_size}"
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = archive.etag
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
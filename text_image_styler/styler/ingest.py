@@ -0,0 +1,129 @@
+"""
+Ingest-time normalization of uploaded originals.
+
+An upload is checked against STYLER_MAX_UPLOAD_PIXELS from its header alone,
+before any pixel is decoded. Once stored, its EXIF orientation is applied and,
+when it is larger than STYLER_WORKING_MAX_PIXELS, a downscaled working copy is
+written. Renders read the working copy and scale style coordinates, which the
+client gives in pixels of the full-size image, by ImageBlob.working_scale. The
+uploaded file itself is kept untouched for archival.
+"""
+import math
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .blobs import release_blob, store_blob
+from .thumbnails import generate_thumbnails
+
+WORKING_DIR = 'working'
+EXIF_ORIENTATION = 0x0112
+
+
+class IngestError(ValueError):
+    """An upload that is not an image or is too large to process"""
+
+
+def get_max_upload_pixels():
+    """Largest accepted upload, in pixels"""
+    return getattr(settings, 'STYLER_MAX_UPLOAD_PIXELS', 50_000_000)
+
+
+def get_working_max_pixels():
+    """Pixel budget of the working copy renders are made from"""
+    return getattr(settings, 'STYLER_WORKING_MAX_PIXELS', 8_000_000)
+
+
+def check_upload(content):
+    """
+    Reject files that are not images or exceed the pixel limit, reading only
+    the image header
+    Returns: (width, height) as stored in the file
+    """
+    content.seek(0)
+    try:
+        with Image.open(content) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        raise IngestError(f"Image exceeds the limit of {get_max_upload_pixels():,} pixels")
+    except (UnidentifiedImageError, OSError) as e:
+        raise IngestError(f"Not a supported image: {e}")
+    finally:
+        content.seek(0)
+
+    if width * height > get_max_upload_pixels():
+        raise IngestError(
+            f"Image is {width}x{height} ({width * height:,} pixels), "
+            f"the limit is {get_max_upload_pixels():,} pixels"
+        )
+    return width, height
+
+
+def normalize_blob(blob):
+    """
+    Record the oriented size of a stored blob and write its working copy when
+    it needs rotating or downscaling. Thumbnails are made from the result.
+    Returns the decoded working image.
+    """
+    with default_storage.open(blob.file.name) as f:
+        image = Image.open(f)
+        stored_width, stored_height = image.size
+        scale = min(1.0, math.sqrt(get_working_max_pixels() / (stored_width * stored_height)))
+        if scale < 1:
+            # Let the JPEG decoder downscale while decoding
+            image.draft('RGB', (max(1, int(stored_width * scale)), max(1, int(stored_height * scale))))
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+        working = ImageOps.exif_transpose(image)
+
+    # Orientations 5-8 swap the axes
+    if orientation in (5, 6, 7, 8):
+        width, height = stored_height, stored_width
+    else:
+        width, height = stored_width, stored_height
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if working.size != target:
+        working = working.resize(target, Image.LANCZOS)
+
+    blob.width, blob.height = width, height
+    if scale < 1 or orientation != 1:
+        buffer = BytesIO()
+        working.convert('RGB').save(buffer, 'JPEG', quality=95)
+        name = f"{WORKING_DIR}/{blob.sha256[:2]}/{blob.sha256}.jpg"
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        blob.working_file = default_storage.save(name, ContentFile(buffer.getvalue()))
+        blob.working_scale = target[0] / width
+    else:
+        blob.working_file = None
+        blob.working_scale = 1.0
+
+    # Listings only link the variants once they are known to exist
+    try:
+        generate_thumbnails(blob.file.name, working)
+        blob.has_thumbnails = True
+    except Exception as e:
+        blob.has_thumbnails = False
+        print(f"✗ Error generating thumbnails for {blob.file.name}: {e}")
+    blob.save(update_fields=['width', 'height', 'working_file', 'working_scale', 'has_thumbnails'])
+    return working
+
+
+def ingest_upload(content, sha256=None):
+    """
+    Validate an uploaded image and store it as a normalized blob, holding the
+    reference store_blob() takes (drop it with release_blob())
+    Returns: (blob, created, decoded working image or None when the blob already existed)
+    """
+    check_upload(content)
+    blob, created = store_blob(content, sha256)
+    working = None
+    if created:
+        try:
+            working = normalize_blob(blob)
+        except Exception as e:
+            release_blob(blob.id)
+            raise IngestError(f"Could not process image: {e}")
+    return blob, created, working
@@ -0,0 +1,76 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from styler.api_benchmark import build_endpoints, check_report, pick_target, run_api_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every styler endpoint through the test client, report latency percentiles and "
+        "SQL query counts, and fail when an endpoint exceeds its query budget. Write endpoints "
+        "add and change images and the response cache is cleared between requests, so run it "
+        "against a scratch database (see seed_images)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10, help="Requests per endpoint")
+        parser.add_argument('--warm', action='store_true', help="Keep the response cache between requests")
+        parser.add_argument('--read-only', action='store_true', help="Skip the endpoints that write")
+        parser.add_argument(
+            '--admin-user',
+            help="Also request the admin pages, logged in as this existing staff user",
+        )
+        parser.add_argument('--output', help="Write the report JSON to this file")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1")
+
+        client = Client()
+        if options['admin_user']:
+            user = get_user_model().objects.filter(
+                username=options['admin_user'], is_staff=True
+            ).first()
+            if user is None:
+                raise CommandError(f"No staff user '{options['admin_user']}'")
+            client.force_login(user)
+
+        try:
+            target = pick_target()
+        except ValueError as e:
+            raise CommandError(str(e))
+        endpoints = build_endpoints(
+            target, writes=not options['read_only'], admin=bool(options['admin_user'])
+        )
+
+        self.stdout.write(
+            f"Requesting {len(endpoints)} endpoints {options['repeat']} times each "
+            f"({'warm' if options['warm'] else 'cold'} cache)"
+        )
+        report = run_api_benchmark(
+            client, endpoints, options['repeat'], cold=not options['warm'], progress=self.report_endpoint
+        )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        problems = check_report(report)
+        if problems:
+            for name, problem in problems:
+                self.stderr.write(f"{name}: {problem}")
+            raise CommandError(f"{len(problems)} endpoint problems with {report['images']} images")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"All {len(endpoints)} endpoints within their query budgets with {report['images']} images."
+        ))
+
+    def report_endpoint(self, name, result):
+        self.stdout.write(
+            f"  {name:<26} p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  "
+            f"p99 {result['p99_ms']:8.1f} ms  queries {result['queries']:>3}/{result['query_budget']:<3} "
+            f"status {','.join(str(status) for status in result['statuses'])}"
+        )
@@ -0,0 +1,162 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from styler.benchmark import (
+    BASELINE_VERSION, DEFAULT_SIZES, PROFILES, TEXTS, build_cases, compare_results, list_fonts, run_benchmark,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark add_text_to_image over image sizes, fonts, text lengths and style options, "
+        "and fail when it got slower or hungrier than a saved baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default=','.join(str(size) for size in DEFAULT_SIZES),
+            help="Comma separated image sizes in megapixels",
+        )
+        parser.add_argument(
+            '--fonts',
+            default='all',
+            help="Comma separated font files of media/fonts without .ttf (e.g. Roboto_600), or 'all'",
+        )
+        parser.add_argument('--texts', default=','.join(TEXTS), help="Comma separated text lengths")
+        parser.add_argument('--profiles', default=','.join(PROFILES), help="Comma separated style profiles")
+        parser.add_argument('--repeat', type=int, default=3, help="Measured renders per case (median reported)")
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(settings.BASE_DIR, 'render_benchmark_baseline.json'),
+            help="Baseline JSON to compare with (or to write with --save-baseline)",
+        )
+        parser.add_argument('--save-baseline', action='store_true', help="Write the results as the new baseline")
+        parser.add_argument('--output', help="Also write the results JSON to this file")
+        parser.add_argument(
+            '--threshold', type=float, default=0.15,
+            help="Allowed growth of a case's median time, as a fraction",
+        )
+        parser.add_argument(
+            '--memory-threshold', type=float, default=0.10,
+            help="Allowed growth of a case's peak memory, as a fraction",
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1")
+
+        cases = build_cases(
+            self.parse_sizes(options['sizes']),
+            self.parse_fonts(options['fonts']),
+            self.parse_choices(options['texts'], TEXTS, '--texts'),
+            self.parse_choices(options['profiles'], PROFILES, '--profiles'),
+        )
+        if not cases:
+            raise CommandError("Nothing to benchmark: no sizes or no fonts in media/fonts")
+
+        baseline = None
+        if not options['save_baseline']:
+            baseline = self.load_baseline(options['baseline'])
+
+        self.stdout.write(f"Benchmarking {len(cases)} cases, {options['repeat']} renders each")
+        results = run_benchmark(cases, options['repeat'], progress=self.report_case)
+
+        if options['output']:
+            self.write_json(options['output'], results)
+        if options['save_baseline']:
+            self.write_json(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline of {len(cases)} cases to {options['baseline']}"))
+            return
+        if baseline is None:
+            self.stdout.write(self.style.WARNING(
+                f"No baseline at {options['baseline']}; run with --save-baseline to create one"
+            ))
+            return
+
+        self.compare(results, baseline, options)
+
+    def parse_sizes(self, value):
+        sizes = []
+        for size in value.split(','):
+            try:
+                size = float(size)
+            except ValueError:
+                raise CommandError(f"Invalid size '{size}', expected megapixels like 1 or 0.5")
+            if size <= 0:
+                raise CommandError(f"Invalid size '{size}', it must be positive")
+            sizes.append(int(size) if size.is_integer() else size)
+        return sizes
+
+    def parse_fonts(self, value):
+        fonts = list_fonts()
+        if value == 'all':
+            return fonts
+        by_name = {f"{family.replace(' ', '_')}_{weight}": (family, weight) for family, weight in fonts}
+        selected = []
+        for name in value.split(','):
+            name = name.strip().removesuffix('.ttf')
+            if name not in by_name:
+                raise CommandError(f"No font file {name}.ttf in media/fonts")
+            selected.append(by_name[name])
+        return selected
+
+    def parse_choices(self, value, choices, option):
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in choices]
+        if unknown:
+            raise CommandError(f"Unknown {option} {', '.join(unknown)}; choose from {', '.join(choices)}")
+        return names
+
+    def load_baseline(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            baseline = json.load(f)
+        if baseline.get('version') != BASELINE_VERSION:
+            raise CommandError(
+                f"Baseline {path} has format version {baseline.get('version')}, expected {BASELINE_VERSION}; "
+                f"re-create it with --save-baseline"
+            )
+        return baseline
+
+    def write_json(self, path, results):
+        # Write then rename, so an interruption never leaves a half-written file
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def report_case(self, result):
+        stages = ', '.join(f"{stage} {seconds * 1000:.1f}" for stage, seconds in result['stages'].items())
+        memory = result['peak_memory_bytes']
+        memory = f"{memory / 2**20:.1f} MiB" if memory is not None else "n/a"
+        self.stdout.write(
+            f"  {result['name']}: {result['seconds'] * 1000:.1f} ms ({stages}), peak memory {memory}"
+        )
+
+    def compare(self, results, baseline, options):
+        before, after = baseline['environment'], results['environment']
+        for key in ('pillow', 'python', 'platform'):
+            if before.get(key) != after.get(key):
+                self.stdout.write(f"Baseline {key}: {before.get(key)}, now: {after.get(key)}")
+
+        missing = [name for name in results['cases'] if name not in baseline['cases']]
+        if missing:
+            self.stdout.write(self.style.WARNING(f"{len(missing)} cases are not in the baseline and were not compared"))
+
+        regressions = compare_results(results, baseline, options['threshold'], options['memory_threshold'])
+        if regressions:
+            for name, message in regressions:
+                self.stderr.write(f"{name}: {message}")
+            raise CommandError(
+                f"{len(regressions)} regressions beyond {options['threshold']:.0%} time / "
+                f"{options['memory_threshold']:.0%} memory against {options['baseline']}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"No regressions in {len(results['cases']) - len(missing)} cases against {options['baseline']}"
+        ))
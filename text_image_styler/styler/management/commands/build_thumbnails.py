@@ -0,0 +1,60 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+
+from styler.caching import bump_generation
+from styler.models import ImageBlob, StyledImage
+from styler.thumbnails import generate_thumbnails, has_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Generate missing thumbnail variants for existing originals and outputs and record that they exist"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Regenerate variants that already exist",
+        )
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+
+        blobs = ImageBlob.objects.exclude(width__isnull=True).order_by('pk')
+        if not options['force']:
+            blobs = blobs.filter(has_thumbnails=False)
+        for blob in blobs.iterator(chunk_size=500):
+            try:
+                if options['force'] or not has_thumbnails(blob.file.name):
+                    # Made from the oriented working image, like at ingest
+                    source_name, _ = blob.get_render_source()
+                    with default_storage.open(source_name, 'rb') as f:
+                        generate_thumbnails(blob.file.name, ImageOps.exif_transpose(Image.open(f)))
+                    generated += 1
+                ImageBlob.objects.filter(pk=blob.pk).update(has_thumbnails=True)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Original {blob.file.name}: could not thumbnail: {e}")
+
+        # Images without a blob have no known source width, so their variants are never linked
+        images = StyledImage.objects.filter(blob__isnull=False, output_image__isnull=False).exclude(output_image='')
+        if not options['force']:
+            images = images.filter(output_has_thumbnails=False)
+        for image in images.only('id', 'output_image').order_by('pk').iterator(chunk_size=500):
+            try:
+                if options['force'] or not has_thumbnails(image.output_image.name):
+                    generate_thumbnails(image.output_image.name)
+                    generated += 1
+                # Unless the output was replaced meanwhile
+                StyledImage.objects.filter(pk=image.pk, output_image=image.output_image.name).update(
+                    output_has_thumbnails=True
+                )
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Image {image.id}: could not thumbnail {image.output_image.name}: {e}")
+
+        # The updates above send no signals
+        bump_generation('image')
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated thumbnails for {generated} files ({failed} failed)."
+        ))
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from styler.models import ClickRollup
+
+
+class Command(BaseCommand):
+    help = "Roll old hourly click buckets up into daily buckets and delete expired buckets"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hourly-days',
+            type=int,
+            default=getattr(settings, 'STYLER_CLICK_HOURLY_RETENTION_DAYS', 8),
+            help="Keep hourly buckets for this many days before rolling them into days",
+        )
+        parser.add_argument(
+            '--daily-days',
+            type=int,
+            default=getattr(settings, 'STYLER_CLICK_DAILY_RETENTION_DAYS', 400),
+            help="Delete daily buckets older than this many days",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        # Only whole days are rolled up, so the cutoff is the start of a day
+        hourly_cutoff = (now - timedelta(days=options['hourly_days'])).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        daily_cutoff = now - timedelta(days=options['daily_days'])
+
+        old_hours = ClickRollup.objects.filter(granularity=ClickRollup.HOUR, bucket__lt=hourly_cutoff)
+        days = old_hours.annotate(day=TruncDay('bucket')).values_list('day', flat=True).distinct()
+
+        rolled_up = 0
+        for day in sorted(days):
+            rolled_up += self.compact_day(day)
+
+        expired, _ = ClickRollup.objects.filter(
+            granularity=ClickRollup.DAY, bucket__lt=daily_cutoff
+        ).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled {rolled_up} hourly buckets into days, deleted {expired} expired daily buckets."
+        ))
+
+    def compact_day(self, day):
+        """Move all hourly buckets of one day into daily buckets"""
+        hours = ClickRollup.objects.filter(
+            granularity=ClickRollup.HOUR,
+            bucket__gte=day,
+            bucket__lt=day + timedelta(days=1),
+        )
+        with transaction.atomic():
+            totals = dict(hours.values('image_id').annotate(total=Sum('count')).values_list('image_id', 'total'))
+            existing = ClickRollup.objects.filter(
+                granularity=ClickRollup.DAY, bucket=day, image_id__in=totals.keys()
+            )
+
+            to_update = []
+            for rollup in existing:
+                rollup.count += totals.pop(rollup.image_id)
+                to_update.append(rollup)
+            ClickRollup.objects.bulk_update(to_update, ['count'], batch_size=500)
+            ClickRollup.objects.bulk_create([
+                ClickRollup(image_id=image_id, granularity=ClickRollup.DAY, bucket=day, count=total)
+                for image_id, total in totals.items()
+            ], batch_size=500)
+
+            deleted, _ = hours.delete()
+        return deleted
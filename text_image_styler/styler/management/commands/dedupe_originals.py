@@ -0,0 +1,80 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from styler.blobs import hash_file, release_blob, store_blob
+from styler.ingest import normalize_blob
+from styler.models import ImageBlob, StyledImage
+from styler.thumbnails import delete_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Move originals uploaded before deduplication into normalized, content-addressed blobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report the duplicates without changing anything")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        images = StyledImage.objects.filter(blob__isnull=True).exclude(original_image='').order_by('pk')
+
+        seen = {}
+        migrated = duplicates = reclaimed = missing = 0
+        for image in images.iterator(chunk_size=500):
+            old_name = image.original_image.name
+            if not default_storage.exists(old_name):
+                missing += 1
+                self.stderr.write(f"Image {image.id}: original {old_name} is missing")
+                continue
+
+            with default_storage.open(old_name) as content:
+                digest = hash_file(content)
+                size = content.size
+                if digest in seen and seen[digest] != old_name:
+                    duplicates += 1
+                    reclaimed += size
+                seen.setdefault(digest, old_name)
+                if dry_run:
+                    continue
+                blob, created = store_blob(content, digest)
+
+            if created:
+                self.normalize(blob)
+
+            image.blob = blob
+            image.original_image = blob.file.name
+            try:
+                image.save(update_fields=['blob', 'original_image'])
+            finally:
+                release_blob(blob.id)
+            migrated += 1
+
+            # The old upload is now a copy of the blob
+            if not StyledImage.objects.filter(original_image=old_name).exists():
+                default_storage.delete(old_name)
+                delete_thumbnails(old_name)
+
+        # Blobs stored before ingest normalization existed have no working copy yet
+        normalized = 0
+        if not dry_run:
+            for blob in ImageBlob.objects.filter(width__isnull=True).iterator(chunk_size=500):
+                normalized += self.normalize(blob)
+
+        summary = (
+            f"{duplicates} duplicate originals, {reclaimed / (1024 * 1024):.1f} MB reclaimable"
+            if dry_run else
+            f"Moved {migrated} images to {len(seen)} blobs, "
+            f"{duplicates} duplicates removed ({reclaimed / (1024 * 1024):.1f} MB reclaimed)"
+        )
+        if normalized:
+            summary += f", {normalized} earlier blobs normalized"
+        if missing:
+            summary += f", {missing} originals missing"
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def normalize(self, blob):
+        try:
+            normalize_blob(blob)
+            return 1
+        except Exception as e:
+            self.stderr.write(f"Normalizing {blob.file.name} failed: {e}")
+            return 0
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from styler.rendering import fail_stale_render_jobs, get_render_job_stale_seconds
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark render jobs without progress for STYLER_RENDER_JOB_STALE_SECONDS as failed "
+        "(their thread died with the process running it); run it periodically, e.g. from cron"
+    )
+
+    def handle(self, *args, **options):
+        marked = fail_stale_render_jobs()
+        self.stdout.write(self.style.SUCCESS(
+            f"Marked {marked} render jobs without progress for {get_render_job_stale_seconds()}s as failed."
+        ))
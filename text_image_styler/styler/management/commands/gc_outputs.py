@@ -0,0 +1,101 @@
+import os
+import time
+from itertools import groupby, islice
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management.base import BaseCommand
+
+from styler.retention import (
+    OUTPUT_DIR, delete_output, get_keep_versions, output_file_size, output_source_stem, referenced_outputs,
+)
+
+
+def source_stem(item):
+    """output_source_stem() of a (media name, mtime) item"""
+    return output_source_stem(os.path.basename(item[0]))
+
+
+class Command(BaseCommand):
+    help = "Delete output files that no StyledImage references any more"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted without deleting")
+        parser.add_argument(
+            '--keep', type=int, default=None,
+            help="Newest versions of each source to keep even when unreferenced (default: STYLER_OUTPUT_KEEP_VERSIONS)",
+        )
+        parser.add_argument(
+            '--min-age-hours', type=float, default=1,
+            help="Leave files younger than this alone, they may belong to a render still in progress",
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000, help="File names checked per database query")
+
+    def handle(self, *args, **options):
+        keep = options['keep'] if options['keep'] is not None else get_keep_versions()
+        cutoff = time.time() - options['min_age_hours'] * 3600
+        dry_run = options['dry_run']
+
+        outputs = self.sorted_outputs()
+        deleted = reclaimed = 0
+        for chunk in self.scan_chunks(self.unkept_outputs(outputs, keep), options['chunk_size']):
+            referenced = referenced_outputs([name for name, _ in chunk])
+            for name, mtime in chunk:
+                if name in referenced or mtime > cutoff:
+                    continue
+                deleted += 1
+                if dry_run:
+                    reclaimed += output_file_size(name)
+                    self.stdout.write(f"  would delete {name}")
+                else:
+                    reclaimed += delete_output(name)
+
+        verb = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {deleted} of {len(outputs)} output files, "
+            f"reclaiming {reclaimed / (1024 * 1024):.1f} MB"
+        ))
+
+    def scan_outputs(self):
+        """Yield (media name, mtime) of every output file"""
+        if not isinstance(default_storage, FileSystemStorage):
+            # Storage without local files: list through the Storage API
+            try:
+                _, files = default_storage.listdir(OUTPUT_DIR)
+            except FileNotFoundError:
+                return
+            for filename in files:
+                name = f"{OUTPUT_DIR}/{filename}"
+                yield name, default_storage.get_modified_time(name).timestamp()
+            return
+
+        # Local storage: scandir gives the mtimes without a storage call per file
+        output_dir = default_storage.path(OUTPUT_DIR)
+        if not os.path.isdir(output_dir):
+            return
+        with os.scandir(output_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    yield f"{OUTPUT_DIR}/{entry.name}", entry.stat().st_mtime
+
+    def sorted_outputs(self):
+        """(media name, mtime) of every output file, ordered by source, newest first"""
+        return sorted(self.scan_outputs(), key=lambda item: (source_stem(item), -item[1]))
+
+    def unkept_outputs(self, outputs, keep):
+        """
+        The sorted_outputs() but the `keep` newest versions of each source; only
+        the versions of the current source are counted at any time
+        """
+        for _, versions in groupby(outputs, key=source_stem):
+            yield from islice(versions, keep, None)
+
+    def scan_chunks(self, outputs, chunk_size):
+        """Yield lists of (media name, mtime) to check against the database together"""
+        chunk = []
+        for item in outputs:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from styler.models import Category, Tag
+
+
+class Command(BaseCommand):
+    help = "Recount Category.image_count and Tag.image_count and fix any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report drifted counters, do not write them",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        with transaction.atomic():
+            fixed = self.reconcile(Category, dry_run) + self.reconcile(Tag, dry_run)
+
+        if dry_run:
+            self.stdout.write(f"{fixed} counters out of date (dry run, nothing written).")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} counters."))
+
+    def reconcile(self, model, dry_run):
+        """Compare stored counts with real counts for one model and correct them"""
+        drifted = []
+        for obj in model.objects.annotate(actual_count=Count('styled_images')).order_by('pk'):
+            if obj.image_count != obj.actual_count:
+                self.stdout.write(
+                    f"{model.__name__} {obj.pk} ({obj.name}): stored {obj.image_count}, actual {obj.actual_count}"
+                )
+                obj.image_count = obj.actual_count
+                drifted.append(obj)
+
+        if drifted and not dry_run:
+            model.objects.bulk_update(drifted, ['image_count'], batch_size=500)
+        return len(drifted)
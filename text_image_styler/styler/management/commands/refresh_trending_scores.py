@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from styler.models import ClickRollup, StyledImage
+from styler.trending import click_weight
+
+
+class Command(BaseCommand):
+    help = "Recompute StyledImage.trending_score from the click rollups (also after changing the trending epoch)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        bucket_middle = {
+            ClickRollup.HOUR: timedelta(minutes=30),
+            ClickRollup.DAY: timedelta(hours=12),
+        }
+
+        last_id = 0
+        refreshed = 0
+        while True:
+            with transaction.atomic():
+                images = list(
+                    StyledImage.objects.select_for_update()
+                    .filter(pk__gt=last_id)
+                    .order_by('pk')
+                    .only('pk', 'update_clicks', 'last_updated', 'trending_score')[:options['batch_size']]
+                )
+                if not images:
+                    break
+
+                scores = {image.pk: 0.0 for image in images}
+                tracked = {image.pk: 0 for image in images}
+                for image_id, granularity, bucket, count in ClickRollup.objects.filter(
+                    image_id__in=scores.keys()
+                ).values_list('image_id', 'granularity', 'bucket', 'count'):
+                    scores[image_id] += count * click_weight(min(bucket + bucket_middle[granularity], now))
+                    tracked[image_id] += count
+
+                for image in images:
+                    # Clicks from before the rollups existed count as made at last_updated
+                    untracked = image.update_clicks - tracked[image.pk]
+                    if untracked > 0:
+                        scores[image.pk] += untracked * click_weight(image.last_updated)
+                    image.trending_score = scores[image.pk]
+
+                StyledImage.objects.bulk_update(images, ['trending_score'])
+
+            refreshed += len(images)
+            last_id = images[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed trending scores of {refreshed} images."))
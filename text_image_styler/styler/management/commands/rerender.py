@@ -0,0 +1,152 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from styler.models import StyledImage
+from styler.rendering import _init_worker, get_render_workers, render_batch
+
+
+class Command(BaseCommand):
+    help = "Re-render stored images in id order across a process pool, resumable from a checkpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', help="Category id or name")
+        parser.add_argument('--font-family', help="Only images using this font family")
+        parser.add_argument('--since', help="Only images created on or after this date (YYYY-MM-DD)")
+        parser.add_argument('--until', help="Only images created before this date (YYYY-MM-DD)")
+        parser.add_argument('--chunk-size', type=int, default=200, help="Rows fetched and written per chunk")
+        parser.add_argument('--workers', type=int, default=None, help="Render processes (default: STYLER_RENDER_WORKERS)")
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, 'rerender_checkpoint.json'),
+            help="File that records progress so an interrupted run can resume",
+        )
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint")
+
+    def handle(self, *args, **options):
+        filters = {
+            'category': options['category'],
+            'font_family': options['font_family'],
+            'since': options['since'],
+            'until': options['until'],
+        }
+        queryset = self.build_queryset(filters)
+
+        checkpoint_path = options['checkpoint']
+        checkpoint = self.load_checkpoint(checkpoint_path, filters, options['restart'])
+        if checkpoint['last_id']:
+            self.stdout.write(
+                f"Resuming after image {checkpoint['last_id']} "
+                f"({checkpoint['rendered']} rendered, {checkpoint['failed']} failed so far)"
+            )
+
+        remaining = queryset.filter(pk__gt=checkpoint['last_id']).count()
+        workers = options['workers'] or get_render_workers()
+        self.stdout.write(f"Re-rendering {remaining} images with {workers} workers")
+
+        processed = 0
+        render_times = []
+        started = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        ) as pool:
+            while True:
+                chunk = list(
+                    queryset.filter(pk__gt=checkpoint['last_id']).order_by('pk')[:options['chunk_size']]
+                )
+                if not chunk:
+                    break
+
+                for image_id, _, elapsed, error in render_batch(chunk, pool=pool):
+                    processed += 1
+                    render_times.append(elapsed)
+                    if error:
+                        checkpoint['failed'] += 1
+                        self.stderr.write(f"Image {image_id}: {error}")
+                    else:
+                        checkpoint['rendered'] += 1
+
+                checkpoint['last_id'] = chunk[-1].pk
+                self.save_checkpoint(checkpoint_path, checkpoint)
+
+                self.stdout.write(
+                    f"  {processed}/{remaining} images, "
+                    f"{processed / (time.perf_counter() - started):.1f} images/sec"
+                )
+
+        elapsed = time.perf_counter() - started
+        self.report(processed, render_times, elapsed, checkpoint)
+        # A run that matched nothing never saved a checkpoint
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(checkpoint_path)
+
+    def build_queryset(self, filters):
+        """StyledImage rows matching the command line filters"""
+        queryset = StyledImage.objects.exclude(original_image='').select_related('blob')
+
+        if filters['category']:
+            if filters['category'].isdigit():
+                queryset = queryset.filter(category_id=int(filters['category']))
+            else:
+                queryset = queryset.filter(category__name=filters['category'])
+        if filters['font_family']:
+            queryset = queryset.filter(font_family=filters['font_family'])
+        if filters['since']:
+            queryset = queryset.filter(created_at__gte=self.parse_date(filters['since']))
+        if filters['until']:
+            queryset = queryset.filter(created_at__lt=self.parse_date(filters['until']))
+        return queryset
+
+    def parse_date(self, value):
+        try:
+            return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+    def load_checkpoint(self, path, filters, restart):
+        """Checkpoint of a previous run with the same filters, or a fresh one"""
+        fresh = {'filters': filters, 'last_id': 0, 'rendered': 0, 'failed': 0}
+        if restart or not os.path.exists(path):
+            return fresh
+
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('filters') != filters:
+            raise CommandError(
+                f"Checkpoint {path} belongs to a run with different filters "
+                f"({checkpoint.get('filters')}); use --restart to discard it"
+            )
+        return checkpoint
+
+    def save_checkpoint(self, path, checkpoint):
+        # Write then rename, so an interruption never leaves a half-written file
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, path)
+
+    def report(self, processed, render_times, elapsed, checkpoint):
+        if not processed:
+            self.stdout.write("Nothing to re-render.")
+            return
+
+        p95 = "n/a"
+        if render_times:
+            render_times.sort()
+            p95 = f"{render_times[min(len(render_times) - 1, int(len(render_times) * 0.95))] * 1000:.0f} ms"
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} images in {elapsed:.1f}s "
+            f"({checkpoint['rendered']} succeeded, {checkpoint['failed']} failed in total): "
+            f"{processed / elapsed:.2f} images/sec, "
+            f"p95 render time {p95}"
+        ))
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from styler.seeding import SEED_SIZES, seed_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Add synthetic images with categories, tags and click history for scale testing "
+        "(adds rows to the configured database, so point it at a scratch one)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'size',
+            help=f"Number of images to create: {', '.join(SEED_SIZES)} or any count",
+        )
+        parser.add_argument('--categories', type=int, default=20, help="Seed categories to spread images over")
+        parser.add_argument('--tags', type=int, default=200, help="Seed tags to draw from (0-4 per image)")
+        parser.add_argument('--sources', type=int, default=8, help="Distinct originals shared by the images")
+        parser.add_argument(
+            '--uncategorized', type=float, default=0.1,
+            help="Fraction of images without a category",
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible data")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Images inserted per transaction")
+
+    def handle(self, *args, **options):
+        count = SEED_SIZES.get(options['size'])
+        if count is None:
+            try:
+                count = int(options['size'])
+            except ValueError:
+                raise CommandError(f"Invalid size '{options['size']}', use {', '.join(SEED_SIZES)} or a number")
+        if count < 1:
+            raise CommandError("The number of images must be positive")
+        if options['categories'] < 1 or options['sources'] < 1:
+            raise CommandError("--categories and --sources must be at least 1")
+        if not 0 <= options['uncategorized'] <= 1:
+            raise CommandError("--uncategorized must be between 0 and 1")
+
+        started = time.perf_counter()
+
+        def progress(created):
+            self.stdout.write(f"  {created}/{count} images, {created / (time.perf_counter() - started):.0f} images/sec")
+
+        self.stdout.write(
+            f"Seeding {count} images over {options['categories']} categories and {options['tags']} tags"
+        )
+        created = seed_images(
+            count,
+            categories=options['categories'],
+            tags=options['tags'],
+            sources=options['sources'],
+            uncategorized=options['uncategorized'],
+            random_seed=options['seed'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} images in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,37 @@
+"""
+Media file access through Django's default storage.
+
+Originals, working copies, outputs and thumbnails are only ever read and
+written through the Storage API, so media can live on any backend selected
+in STORAGES (see STYLER_MEDIA_STORAGE in settings). Fonts are the exception:
+FreeType needs them as local files, so they stay under MEDIA_ROOT/fonts.
+"""
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+
+def open_image(name):
+    """Decode a stored image (fully loaded, so the storage file is closed again)"""
+    with default_storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    return image
+
+
+def write_file(name, content, overwrite=False):
+    """
+    Store bytes under name and return the name the storage actually used
+    (it may differ when the name is taken and overwrite is False)
+    """
+    if overwrite and default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(content))
+
+
+def file_size(name):
+    """Size of a stored file in bytes, 0 when it does not exist"""
+    try:
+        return default_storage.size(name)
+    except (OSError, KeyError, ValueError):
+        return 0
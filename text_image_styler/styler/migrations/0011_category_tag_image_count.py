@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_image_counts(apps, schema_editor):
+    Category = apps.get_model('styler', 'Category')
+    Tag = apps.get_model('styler', 'Tag')
+    StyledImage = apps.get_model('styler', 'StyledImage')
+    TagLink = StyledImage.tags.through
+
+    category_counts = StyledImage.objects.filter(
+        category=OuterRef('pk')
+    ).values('category').annotate(total=Count('pk')).values('total')
+    Category.objects.update(image_count=Coalesce(Subquery(category_counts), 0))
+
+    tag_counts = TagLink.objects.filter(
+        tag=OuterRef('pk')
+    ).values('tag').annotate(total=Count('pk')).values('total')
+    Tag.objects.update(image_count=Coalesce(Subquery(tag_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0010_tag_styledimage_image_name_styledimage_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of images in this category (maintained by signals)'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of images with this tag (maintained by signals)'),
+        ),
+        migrations.RunPython(populate_image_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0011_category_tag_image_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], default='hour', max_length=4)),
+                ('bucket', models.DateTimeField(help_text='Start of the hour or day (UTC)')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='click_rollups', to='styler.styledimage')),
+            ],
+            options={
+                'ordering': ['-bucket'],
+                'indexes': [models.Index(fields=['bucket', 'image'], name='click_rollup_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('image', 'granularity', 'bucket'), name='unique_click_rollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0012_clickrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='styledimage',
+            name='trending_score',
+            field=models.FloatField(db_index=True, default=0, editable=False, help_text='Time-decayed click score, scaled to STYLER_TRENDING_EPOCH (see trending.py)'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0014_renderjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.ImageField(upload_to='originals/')),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0, help_text='Number of images using this original (maintained by signals)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='styledimage',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Deduplicated original; original_image points at its file', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='styled_images', to='styler.imageblob'),
+        ),
+    ]
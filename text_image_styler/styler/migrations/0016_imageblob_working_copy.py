@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0015_imageblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, help_text='Height after EXIF orientation', null=True),
+        ),
+        migrations.AddField(
+            model_name='imageblob',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, help_text='Width after EXIF orientation', null=True),
+        ),
+        migrations.AddField(
+            model_name='imageblob',
+            name='working_file',
+            field=models.ImageField(blank=True, help_text='Oriented, downscaled copy renders are made from (see ingest.py)', null=True, upload_to='working/'),
+        ),
+        migrations.AddField(
+            model_name='imageblob',
+            name='working_scale',
+            field=models.FloatField(default=1.0, help_text='Working copy width / original width'),
+        ),
+    ]
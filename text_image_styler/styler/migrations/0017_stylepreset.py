@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0016_imageblob_working_copy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StylePreset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('font_size', models.IntegerField(default=36)),
+                ('font_color', models.CharField(default='#FFFFFF', max_length=7)),
+                ('font_family', models.CharField(default='Roboto', max_length=100)),
+                ('x_position', models.IntegerField(default=50)),
+                ('y_position', models.IntegerField(default=50)),
+                ('text_alignment', models.CharField(choices=[('left', 'Left'), ('center', 'Center'), ('right', 'Right')], default='center', max_length=10)),
+                ('font_weight', models.CharField(choices=[('100', 'Thin'), ('200', 'Extra Light'), ('300', 'Light'), ('400', 'Regular'), ('500', 'Medium'), ('600', 'Semi Bold'), ('700', 'Bold'), ('800', 'Extra Bold'), ('900', 'Black')], default='600', max_length=10)),
+                ('text_rotate', models.IntegerField(default=0)),
+                ('text_opacity', models.IntegerField(default=100)),
+                ('enable_shadow', models.BooleanField(default=False)),
+                ('shadow_x', models.IntegerField(default=2)),
+                ('shadow_y', models.IntegerField(default=2)),
+                ('shadow_blur', models.IntegerField(default=4)),
+                ('shadow_color', models.CharField(default='#000000', max_length=7)),
+                ('enable_background', models.BooleanField(default=False)),
+                ('text_background', models.CharField(default='#00000000', max_length=9)),
+                ('letter_spacing', models.FloatField(default=0.0)),
+                ('line_height', models.FloatField(default=1.2)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
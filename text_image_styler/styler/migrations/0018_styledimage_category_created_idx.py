@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0017_stylepreset'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='styledimage',
+            index=models.Index(fields=['category', '-created_at'], name='styled_image_category_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0018_styledimage_category_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='renderjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last progress of the job; running jobs without progress for long are marked failed', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0019_renderjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='styledimage',
+            name='output_signature',
+            field=models.CharField(blank=True, default='', editable=False, help_text='get_render_signature() of the render output_image holds (blank when unknown)', max_length=32),
+        ),
+    ]
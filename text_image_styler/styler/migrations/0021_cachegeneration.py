@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:09
+
+import time
+
+from django.db import migrations, models
+
+
+def create_generations(apps, schema_editor):
+    # Start from the clock, so responses cached under the old cache counters are never served
+    CacheGeneration = apps.get_model('styler', 'CacheGeneration')
+    start = time.time_ns() // 1000
+    CacheGeneration.objects.bulk_create(
+        [CacheGeneration(name=name, value=start) for name in ('image', 'category', 'tag')],
+        ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0020_styledimage_output_signature'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_generations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0021_cachegeneration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingClick',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the hour the clicks were made in (UTC)')),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_clicks', to='styler.styledimage')),
+            ],
+        ),
+    ]
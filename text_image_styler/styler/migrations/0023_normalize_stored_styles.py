@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:18
+
+from django.db import migrations
+
+from styler.styles import FIELD_NAMES, StyleSpec
+
+
+def normalize_stored_styles(apps, schema_editor):
+    """
+    Replace styling values saved before StyleSpec validation existed with what
+    they are rendered as: their default (colors are also given their #)
+    """
+    for model_name in ('StyledImage', 'StylePreset'):
+        model = apps.get_model('styler', model_name)
+        changed = []
+        for obj in model.objects.only('pk', *FIELD_NAMES).iterator(chunk_size=1000):
+            fields = StyleSpec.from_stored(obj).as_fields()
+            if any(getattr(obj, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(obj, name, value)
+                changed.append(obj)
+        model.objects.bulk_update(changed, FIELD_NAMES, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0022_pendingclick'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_stored_styles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:24
+
+from django.db import migrations, models
+
+from styler.thumbnails import has_thumbnails
+
+
+def record_existing_thumbnails(apps, schema_editor):
+    """Flag the originals and outputs whose variants are all in storage"""
+    ImageBlob = apps.get_model('styler', 'ImageBlob')
+    StyledImage = apps.get_model('styler', 'StyledImage')
+
+    outputs = StyledImage.objects.filter(blob__isnull=False, output_image__isnull=False).exclude(output_image='')
+    for queryset, field, flag in (
+        (ImageBlob.objects.all(), 'file', 'has_thumbnails'),
+        (outputs, 'output_image', 'output_has_thumbnails'),
+    ):
+        names = [name for name in queryset.values_list(field, flat=True).iterator(chunk_size=1000) if name]
+        found = [name for name in dict.fromkeys(names) if has_thumbnails(name)]
+        for start in range(0, len(found), 500):
+            queryset.filter(**{f'{field}__in': found[start:start + 500]}).update(**{flag: True})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('styler', '0023_normalize_stored_styles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='has_thumbnails',
+            field=models.BooleanField(default=False, help_text='Whether the variants of file were generated'),
+        ),
+        migrations.AddField(
+            model_name='styledimage',
+            name='output_has_thumbnails',
+            field=models.BooleanField(default=False, editable=False, help_text='Whether the variants of output_image were generated'),
+        ),
+        migrations.RunPython(record_existing_thumbnails, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
+import hashlib
+
 from django.db import models
 
+from .styles import FIELD_NAMES as STYLE_FIELD_NAMES, StyleSpec
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -15,6 +19,11 @@ class Category(models.Model):
         default=False,
         help_text="Show this category in the landing page"
     )
+    image_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Number of images in this category (maintained by signals)"
+    )
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -32,6 +41,11 @@ class Tag(models.Model):
     """Tag model for images"""
     name = models.CharField(max_length=50, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    image_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Number of images with this tag (maintained by signals)"
+    )
 
     class Meta:
         ordering = ['name']
@@ -40,7 +54,55 @@ class Tag(models.Model):
         return self.name
 
 
+class ImageBlob(models.Model):
+    """An uploaded original stored once under its content hash (see blobs.py)"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.ImageField(upload_to='originals/')
+    size = models.PositiveBigIntegerField(default=0)
+    width = models.PositiveIntegerField(blank=True, null=True, help_text="Width after EXIF orientation")
+    height = models.PositiveIntegerField(blank=True, null=True, help_text="Height after EXIF orientation")
+    working_file = models.ImageField(
+        upload_to='working/',
+        blank=True,
+        null=True,
+        help_text="Oriented, downscaled copy renders are made from (see ingest.py)"
+    )
+    working_scale = models.FloatField(default=1.0, help_text="Working copy width / original width")
+    has_thumbnails = models.BooleanField(default=False, help_text="Whether the variants of file were generated")
+    ref_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of images using this original (maintained by signals)"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+    @property
+    def working_width(self):
+        """Width of the image renders are made from, and so of its outputs (None before normalization)"""
+        return round(self.width * self.working_scale) if self.width else None
+
+    def get_render_source(self):
+        """Media-relative name renders read from, and the factor style coordinates are scaled by"""
+        if self.working_file:
+            return self.working_file.name, self.working_scale
+        return self.file.name, 1.0
+
+
 class StyledImage(models.Model):
+    # Counters that are only written as F() increments by the click aggregator
+    WRITE_BEHIND_FIELDS = ('update_clicks', 'trending_score')
+    # Styling fields (shared with StylePreset, see styles.StyleSpec)
+    STYLE_FIELDS = STYLE_FIELD_NAMES
+    # Fields that change what add_text_to_image draws
+    VISUAL_FIELDS = ('text',) + STYLE_FIELDS
+    # Fields the update endpoints can change
+    EDITABLE_FIELDS = VISUAL_FIELDS + ('image_name', 'category')
+
     # Basic information
     image_name = models.CharField(
         max_length=200,
@@ -77,9 +139,24 @@ class StyledImage(models.Model):
         verbose_name="Last Updated",
         help_text="Last time the image was updated"
     )
+    trending_score = models.FloatField(
+        default=0,
+        db_index=True,
+        editable=False,
+        help_text="Time-decayed click score, scaled to STYLER_TRENDING_EPOCH (see trending.py)"
+    )
 
     # Existing fields
     original_image = models.ImageField(upload_to='uploads/')
+    blob = models.ForeignKey(
+        ImageBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='styled_images',
+        help_text="Deduplicated original; original_image points at its file"
+    )
     text = models.TextField()
     font_size = models.IntegerField(default=36)
     font_color = models.CharField(max_length=7, default='#FFFFFF')
@@ -87,6 +164,18 @@ class StyledImage(models.Model):
     x_position = models.IntegerField(default=50)
     y_position = models.IntegerField(default=50)
     output_image = models.ImageField(upload_to='outputs/', blank=True, null=True)
+    output_signature = models.CharField(
+        max_length=32,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="get_render_signature() of the render output_image holds (blank when unknown)"
+    )
+    output_has_thumbnails = models.BooleanField(
+        default=False,
+        editable=False,
+        help_text="Whether the variants of output_image were generated"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     # Text styling fields
@@ -132,6 +221,22 @@ class StyledImage(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Newest images of a category (category covers, landing page)
+            models.Index(fields=['category', '-created_at'], name='styled_image_category_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded category, output and blob so signals can detect changes to them"""
+        instance = super().from_db(db, field_names, values)
+        if 'category_id' in field_names:
+            instance._loaded_category_id = values[field_names.index('category_id')]
+        if 'output_image' in field_names:
+            instance._loaded_output_name = values[field_names.index('output_image')]
+        if 'blob_id' in field_names:
+            instance._loaded_blob_id = values[field_names.index('blob_id')]
+        return instance
 
     def __str__(self):
         category_info = f" ({self.category.name})" if self.category else ""
@@ -146,7 +251,222 @@ class StyledImage(models.Model):
         """Get formatted tags display"""
         return ", ".join([tag.name for tag in self.tags.all()])
 
+    def save(self, *args, **kwargs):
+        # Click counters are only ever written as F() increments (see clicks.py),
+        # so a save without update_fields must not write back a possibly stale
+        # in-memory value; _do_update leaves them out of the UPDATE
+        self._skip_write_behind = kwargs.get('update_fields') is None
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self._skip_write_behind = False
+
+    def _do_update(self, base_qs, using, pk_val, values, *args, **kwargs):
+        # Only the UPDATE changes: deferred fields are still left alone, and a
+        # row deleted meanwhile is still inserted again with every field
+        if getattr(self, '_skip_write_behind', False):
+            values = [value for value in values if value[0].name not in self.WRITE_BEHIND_FIELDS]
+        return super()._do_update(base_qs, using, pk_val, values, *args, **kwargs)
+
+    def get_render_source(self):
+        """Media-relative name of the image to render from, and the style coordinate scale"""
+        if self.blob_id:
+            return self.blob.get_render_source()
+        return self.original_image.name, 1.0
+
+    def get_original_thumbnail_width(self):
+        """Width the original's thumbnails were made from, None when it has none (blob must be loaded)"""
+        return self.blob.working_width if self.blob_id and self.blob.has_thumbnails else None
+
+    def get_output_thumbnail_width(self):
+        """Width the output's thumbnails were made from, None when it has none (blob must be loaded)"""
+        return self.blob.working_width if self.blob_id and self.output_has_thumbnails else None
+
+    def snapshot_fields(self):
+        """Current values of EDITABLE_FIELDS, to find what an update changed"""
+        return {name: getattr(self, self._meta.get_field(name).attname) for name in self.EDITABLE_FIELDS}
+
+    def get_changed_fields(self, snapshot):
+        """Names of the fields whose value differs from a snapshot_fields() result"""
+        return [
+            name for name, value in snapshot.items()
+            if getattr(self, self._meta.get_field(name).attname) != value
+        ]
+
+    def get_style_spec(self):
+        """
+        The stored styling fields as a StyleSpec, used by every path that renders
+        a stored image; values that do not validate fall back to their defaults
+        """
+        return StyleSpec.from_stored(self)
+
+    def get_render_signature(self, text, style):
+        """Digest of what a render is made from: this image's original, text and style"""
+        key = f"{self.original_image.name}\0{style.digest}\0{text}"
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+    def has_current_output(self, text, style):
+        """Whether the stored output is a render of text in style (unknown outputs are not)"""
+        return bool(self.output_image) and self.output_signature == self.get_render_signature(text, style)
+
     def increment_clicks(self):
-        """Increment the update clicks counter"""
+        """
+        Increment the update clicks counter (written in batches by the click
+        aggregator). Unlike the save it used to make, this does not touch
+        last_updated; the update endpoints save that with the fields they change.
+        """
+        from .clicks import click_aggregator
+
+        click_aggregator.record(self.pk)
         self.update_clicks += 1
-        self.save(update_fields=['update_clicks', 'last_updated'])
\ No newline at end of file
+
+
+class StylePreset(models.Model):
+    """A named set of styling fields that can be applied to many images at once"""
+    name = models.CharField(max_length=100, unique=True)
+    description = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Same styling fields and defaults as StyledImage
+    font_size = models.IntegerField(default=36)
+    font_color = models.CharField(max_length=7, default='#FFFFFF')
+    font_family = models.CharField(max_length=100, default='Roboto')
+    x_position = models.IntegerField(default=50)
+    y_position = models.IntegerField(default=50)
+    text_alignment = models.CharField(
+        max_length=10,
+        choices=[('left', 'Left'), ('center', 'Center'), ('right', 'Right')],
+        default='center'
+    )
+    font_weight = models.CharField(
+        max_length=10,
+        choices=[
+            ('100', 'Thin'),
+            ('200', 'Extra Light'),
+            ('300', 'Light'),
+            ('400', 'Regular'),
+            ('500', 'Medium'),
+            ('600', 'Semi Bold'),
+            ('700', 'Bold'),
+            ('800', 'Extra Bold'),
+            ('900', 'Black')
+        ],
+        default='600'
+    )
+    text_rotate = models.IntegerField(default=0)
+    text_opacity = models.IntegerField(default=100)
+    enable_shadow = models.BooleanField(default=False)
+    shadow_x = models.IntegerField(default=2)
+    shadow_y = models.IntegerField(default=2)
+    shadow_blur = models.IntegerField(default=4)
+    shadow_color = models.CharField(max_length=7, default='#000000')
+    enable_background = models.BooleanField(default=False)
+    text_background = models.CharField(max_length=9, default='#00000000')
+    letter_spacing = models.FloatField(default=0.0)
+    line_height = models.FloatField(default=1.2)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def get_style_spec(self):
+        """The preset as a StyleSpec, to render with and to copy onto images (StyleSpec.as_fields())"""
+        return StyleSpec.from_instance(self)
+
+
+class ClickRollup(models.Model):
+    """Update clicks of one image summed per hour or per day"""
+    HOUR = 'hour'
+    DAY = 'day'
+
+    image = models.ForeignKey(
+        StyledImage,
+        on_delete=models.CASCADE,
+        related_name='click_rollups'
+    )
+    granularity = models.CharField(
+        max_length=4,
+        choices=[(HOUR, 'Hour'), (DAY, 'Day')],
+        default=HOUR
+    )
+    bucket = models.DateTimeField(help_text="Start of the hour or day (UTC)")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['image', 'granularity', 'bucket'],
+                name='unique_click_rollup_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['bucket', 'image'], name='click_rollup_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"Image {self.image_id} @ {self.bucket:%Y-%m-%d %H:00} ({self.granularity}): {self.count}"
+
+
+class PendingClick(models.Model):
+    """Update clicks recorded but not yet added to the counters (see clicks.py)"""
+    image = models.ForeignKey(
+        StyledImage,
+        on_delete=models.CASCADE,
+        related_name='pending_clicks'
+    )
+    bucket = models.DateTimeField(help_text="Start of the hour the clicks were made in (UTC)")
+    count = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return f"Image {self.image_id} @ {self.bucket:%Y-%m-%d %H:00}: {self.count} pending"
+
+
+class RenderJob(models.Model):
+    """A background re-render of many images, with per-batch progress"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    status = models.CharField(
+        max_length=10,
+        choices=[(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')],
+        default=QUEUED
+    )
+    total = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="Last progress of the job; running jobs without progress for long are marked failed"
+    )
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Render job {self.id} ({self.status})"
+
+    def get_progress_display(self):
+        """Get formatted progress for admin display"""
+        processed = self.completed + self.failed
+        percent = int(processed * 100 / self.total) if self.total else 100
+        return f"{processed}/{self.total} ({percent}%)"
+
+
+class CacheGeneration(models.Model):
+    """Generation counter of one model for the versioned response cache (see caching.py)"""
+    name = models.CharField(max_length=20, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
@@ -0,0 +1,105 @@
+"""
+Applying a StylePreset to many images in one call.
+
+Images are sent to the render pool in batches that share the preset's
+StyleSpec, validated and with its colors parsed once. Workers keep font files
+and sizes loaded, so every image of a batch renders without parsing anything
+again. The styling fields, texts and outputs of a batch are written with one
+bulk_update.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import StyledImage
+from .rendering import get_render_batch_size, get_render_pool, get_render_workers
+from .retention import schedule_superseded_cleanup
+from .signals import invalidate_after_commit
+
+
+def get_preset_max_images():
+    """Most images one apply request may render"""
+    return getattr(settings, 'STYLER_PRESET_APPLY_MAX_IMAGES', 1000)
+
+
+def render_preset_batch(task):
+    """
+    Worker entry point: render a batch of images with one style
+    task: (StyleSpec, [(image_id, source_name, text, scale), ...])
+    Returns: [(image_id, output relative path or None, seconds spent, error message or None), ...]
+    """
+    from .utils import add_text_to_image
+
+    style, items = task
+    results = []
+    for image_id, source_name, text, scale in items:
+        started = time.perf_counter()
+        try:
+            output_path = add_text_to_image(source_name, text, style, scale)
+            results.append((image_id, output_path, time.perf_counter() - started, None))
+        except Exception as e:
+            results.append((image_id, None, time.perf_counter() - started, str(e)))
+    return results
+
+
+def apply_preset(preset, images, texts=None, pool=None):
+    """
+    Restyle images (StyledImage objects, blob selected) with a preset, optionally
+    replacing the text of some of them ({image_id: text})
+    Returns: {image_id: (output relative path or None, error message or None)}
+    Raises ValueError when the preset does not validate.
+    """
+    pool = pool or get_render_pool()
+    texts = texts or {}
+    style = preset.get_style_spec()
+    style_fields = style.as_fields()
+
+    results = {}
+    by_id = {}
+    for image in images:
+        if image.original_image:
+            by_id[image.id] = image
+        else:
+            results[image.id] = (None, 'Original image not found')
+
+    # Small selections are split so every worker gets a batch
+    batch_size = max(1, min(get_render_batch_size(), math.ceil(len(by_id) / get_render_workers())))
+    ids = list(by_id)
+    tasks = []
+    for start in range(0, len(ids), batch_size):
+        items = []
+        for image_id in ids[start:start + batch_size]:
+            source_name, scale = by_id[image_id].get_render_source()
+            items.append((image_id, source_name, texts.get(image_id, by_id[image_id].text), scale))
+        tasks.append((style, items))
+
+    for batch_results in pool.map(render_preset_batch, tasks):
+        rendered = []
+        superseded = []
+        now = timezone.now()
+        for image_id, output_path, _, error in batch_results:
+            results[image_id] = (output_path, error)
+            if error is not None:
+                continue
+            image = by_id[image_id]
+            superseded.append(image.output_image.name)
+            for name, value in style_fields.items():
+                setattr(image, name, value)
+            image.text = texts.get(image_id, image.text)
+            image.output_image = output_path
+            image.output_signature = image.get_render_signature(image.text, style)
+            image.output_has_thumbnails = True
+            # bulk_update does not apply auto_now
+            image.last_updated = now
+            rendered.append(image)
+
+        if rendered:
+            StyledImage.objects.bulk_update(
+                rendered, StyledImage.VISUAL_FIELDS + ('output_image', 'output_signature', 'output_has_thumbnails', 'last_updated')
+            )
+            # bulk_update sends no signals, so drop the cached responses here
+            invalidate_after_commit(generations=('image',), stats=True, landing=True)
+            schedule_superseded_cleanup(superseded)
+    return results
@@ -0,0 +1,264 @@
+"""
+Parallel re-rendering of stored images, and background publishing of outputs.
+
+Rendering is CPU bound, so batches are spread over a process pool. Workers
+only render and write the output file; the database is updated by the caller
+with one bulk update per batch.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+_pool = None
+_pool_lock = threading.Lock()
+# One thread, so outputs of the same image are published in request order
+_publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='styler-publish')
+
+
+def get_render_workers():
+    """Number of render processes (defaults to the CPU count)"""
+    return getattr(settings, 'STYLER_RENDER_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_render_batch_size():
+    """Images rendered and written per batch"""
+    return getattr(settings, 'STYLER_RENDER_BATCH_SIZE', 25)
+
+
+def get_render_job_stale_seconds():
+    """Seconds without progress after which a queued or running RenderJob counts as lost"""
+    return getattr(settings, 'STYLER_RENDER_JOB_STALE_SECONDS', 600)
+
+
+def _init_worker():
+    # Workers are spawned fresh, so Django has to be set up before rendering
+    import django
+    django.setup()
+
+
+def get_render_pool():
+    """Shared process pool used for all background rendering"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=get_render_workers(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def build_render_task(styled_image):
+    """Picklable description of everything needed to re-render one image"""
+    source_name, scale = styled_image.get_render_source()
+    return (
+        styled_image.id,
+        source_name,
+        styled_image.text,
+        styled_image.get_style_spec(),
+        scale,
+    )
+
+
+def render_task(task):
+    """
+    Worker entry point: render one task
+    Returns: (image_id, output relative path or None, seconds spent, error message or None)
+    """
+    from .utils import add_text_to_image
+
+    image_id, source_name, text, style, scale = task
+    started = time.perf_counter()
+    try:
+        output_path = add_text_to_image(source_name, text, style, scale)
+        return image_id, output_path, time.perf_counter() - started, None
+    except Exception as e:
+        return image_id, None, time.perf_counter() - started, str(e)
+
+
+def render_batch(styled_images, pool=None, on_result=None):
+    """
+    Render a batch of StyledImage objects in the pool and store the new outputs
+    with one bulk update. on_result(result) is called as each image is done.
+    Returns the per-image results of render_task.
+    """
+    from .models import StyledImage
+    from .retention import schedule_superseded_cleanup
+    from .signals import invalidate_after_commit
+
+    pool = pool or get_render_pool()
+    by_id = {image.id: image for image in styled_images if image.original_image}
+    tasks = [build_render_task(image) for image in by_id.values()]
+    signatures = {task[0]: by_id[task[0]].get_render_signature(task[2], task[3]) for task in tasks}
+    results = []
+    for result in pool.map(render_task, tasks):
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    rendered = []
+    superseded = []
+    for image_id, output_path, _, error in results:
+        if error is None:
+            superseded.append(by_id[image_id].output_image.name)
+            by_id[image_id].output_image = output_path
+            by_id[image_id].output_signature = signatures[image_id]
+            by_id[image_id].output_has_thumbnails = True
+            rendered.append(by_id[image_id])
+    if rendered:
+        StyledImage.objects.bulk_update(rendered, ['output_image', 'output_signature', 'output_has_thumbnails'])
+        # bulk_update sends no signals, so drop the cached responses here
+        invalidate_after_commit(generations=('image',), stats=True, landing=True)
+        schedule_superseded_cleanup(superseded)
+    return results
+
+
+def start_render_job(image_ids):
+    """
+    Create a RenderJob for image_ids and run it in a background thread once
+    the current transaction commits, so the thread never reads a job that is
+    not committed or was rolled back. Jobs do not survive a restart of the
+    process; fail_stale_render_jobs() marks the ones that were lost that way as failed.
+    """
+    from .models import RenderJob
+
+    job = RenderJob.objects.create(total=len(image_ids))
+    image_ids = list(image_ids)
+    transaction.on_commit(
+        lambda: threading.Thread(target=run_render_job, args=(job.id, image_ids), daemon=True).start()
+    )
+    return job
+
+
+def run_render_job(job_id, image_ids):
+    """
+    Render image_ids batch by batch, recording progress on the RenderJob after
+    each batch and a heartbeat after each image. A job that fail_stale_render_jobs()
+    marked as failed stays failed.
+    """
+    from .models import RenderJob, StyledImage
+
+    close_old_connections()
+    jobs = RenderJob.objects.filter(pk=job_id)
+    if not jobs.filter(status=RenderJob.QUEUED).update(
+        status=RenderJob.RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now()
+    ):
+        connections.close_all()
+        return
+
+    def heartbeat(result):
+        jobs.update(heartbeat_at=timezone.now())
+
+    try:
+        batch_size = get_render_batch_size()
+        for start in range(0, len(image_ids), batch_size):
+            batch_ids = image_ids[start:start + batch_size]
+            batch = list(StyledImage.objects.filter(pk__in=batch_ids).select_related('blob'))
+
+            results = render_batch(batch, on_result=heartbeat)
+            succeeded = sum(1 for _, _, _, error in results if error is None)
+            failures = [f"Image {image_id}: {error}" for image_id, _, _, error in results if error]
+            # Images deleted meanwhile or without an original count as failed too
+            skipped = len(batch_ids) - len(results)
+            if skipped:
+                failures.append(f"{skipped} images missing or without an original")
+
+            jobs.update(
+                completed=F('completed') + succeeded,
+                failed=F('failed') + len(batch_ids) - succeeded,
+                heartbeat_at=timezone.now(),
+            )
+            if failures:
+                job = jobs.get()
+                job.errors += '\n'.join(failures) + '\n'
+                job.save(update_fields=['errors'])
+
+        jobs.exclude(status=RenderJob.FAILED).update(status=RenderJob.DONE, finished_at=timezone.now())
+    except Exception as e:
+        print(f"✗ Render job {job_id} failed: {e}")
+        job = jobs.get()
+        job.status = RenderJob.FAILED
+        job.finished_at = timezone.now()
+        job.errors += f"{e}\n"
+        job.save(update_fields=['status', 'finished_at', 'errors'])
+    finally:
+        connections.close_all()
+
+
+def fail_stale_render_jobs():
+    """
+    Mark queued or running jobs without progress for STYLER_RENDER_JOB_STALE_SECONDS
+    as failed; their thread died with a restart of the process that ran them.
+    Run by `manage.py fail_stale_render_jobs`. Returns the number of jobs marked.
+    """
+    from .models import RenderJob
+
+    cutoff = timezone.now() - timedelta(seconds=get_render_job_stale_seconds())
+    stale = RenderJob.objects.filter(status__in=[RenderJob.QUEUED, RenderJob.RUNNING]).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, created_at__lt=cutoff)
+    )
+    marked = stale.update(
+        status=RenderJob.FAILED,
+        finished_at=timezone.now(),
+        errors=Concat(F('errors'), Value("Stopped making progress (the process running it was restarted?)\n")),
+    )
+    if marked:
+        print(f"⚠ Marked {marked} stale render jobs as failed")
+    return marked
+
+
+def persist_outputs_in_background():
+    """Whether publish_output_later writes outputs after the response instead of inline"""
+    return getattr(settings, 'STYLER_PERSIST_OUTPUTS_IN_BACKGROUND', True)
+
+
+def publish_output(image_id, output_name, content, image=None, signature=''):
+    """Write an encoded output, then point the StyledImage at it and record its render signature"""
+    from .models import StyledImage
+    from .retention import delete_output
+    from .utils import save_output
+
+    output_name = save_output(output_name, content, image)
+    styled_image = StyledImage.objects.filter(pk=image_id).first()
+    if styled_image is None:
+        # Deleted while the output was being written
+        delete_output(output_name)
+        return
+    styled_image.output_image = output_name
+    styled_image.output_signature = signature
+    styled_image.output_has_thumbnails = True
+    styled_image.save(update_fields=['output_image', 'output_signature', 'output_has_thumbnails'])
+
+
+def _publish_in_thread(*args, **kwargs):
+    close_old_connections()
+    try:
+        publish_output(*args, **kwargs)
+    except Exception as e:
+        print(f"✗ Error publishing output {args[1]}: {e}")
+    finally:
+        close_old_connections()
+
+
+def publish_output_later(image_id, output_name, content, image=None, signature=''):
+    """
+    Publish a rendered output once the current transaction commits. The
+    database keeps pointing at the previous output, and its signature, until
+    the new file exists.
+    """
+    if not persist_outputs_in_background():
+        transaction.on_commit(lambda: publish_output(image_id, output_name, content, image, signature))
+        return
+    transaction.on_commit(
+        lambda: _publisher.submit(_publish_in_thread, image_id, output_name, content, image, signature)
+    )
@@ -0,0 +1,76 @@
+"""
+Retention of rendered output files.
+
+Every regenerate writes a new outputs/<source>_styled_<timestamp>.jpg, so old
+versions pile up. `manage.py gc_outputs` removes the ones no StyledImage
+references any more; with STYLER_DELETE_SUPERSEDED_OUTPUTS the previous output
+is also deleted as soon as the write replacing it is committed.
+"""
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .media import file_size
+from .thumbnails import delete_thumbnails, get_thumbnail_widths, thumbnail_name
+
+OUTPUT_DIR = 'outputs'
+
+
+def get_keep_versions():
+    """Unreferenced versions of each source kept by the GC command"""
+    return getattr(settings, 'STYLER_OUTPUT_KEEP_VERSIONS', 0)
+
+
+def delete_superseded_outputs_inline():
+    """Whether replaced outputs are deleted right away instead of by gc_outputs"""
+    return getattr(settings, 'STYLER_DELETE_SUPERSEDED_OUTPUTS', False)
+
+
+def output_source_stem(filename):
+    """Group key for the versions of one source: the file name up to '_styled'"""
+    stem = os.path.splitext(filename)[0]
+    return stem.rsplit('_styled', 1)[0]
+
+
+def referenced_outputs(names):
+    """The subset of output names still referenced by a StyledImage (one query)"""
+    from .models import StyledImage
+
+    return set(
+        StyledImage.objects.filter(output_image__in=names).values_list('output_image', flat=True)
+    )
+
+
+def output_file_size(name):
+    """Bytes used by an output and its thumbnails"""
+    names = [name] + [thumbnail_name(name, width) for width in get_thumbnail_widths()]
+    return sum(file_size(path) for path in names)
+
+
+def delete_output(name):
+    """Remove an output file and its thumbnails, returning the bytes freed"""
+    freed = output_file_size(name)
+    default_storage.delete(name)
+    delete_thumbnails(name)
+    return freed
+
+
+def delete_outputs_if_unreferenced(names):
+    """Delete the outputs in names that no StyledImage references"""
+    names = [name for name in set(names) if name and name.startswith(f"{OUTPUT_DIR}/")]
+    if not names:
+        return
+    referenced = referenced_outputs(names)
+    for name in names:
+        if name not in referenced:
+            delete_output(name)
+            print(f"✓ Deleted superseded output: {name}")
+
+
+def schedule_superseded_cleanup(names):
+    """With inline cleanup enabled, delete names once the current transaction commits"""
+    names = [name for name in names if name]
+    if names and delete_superseded_outputs_inline():
+        transaction.on_commit(lambda: delete_outputs_if_unreferenced(names))
@@ -0,0 +1,170 @@
+"""
+Synthetic data for scale testing (see the seed_images command).
+
+Images are spread over categories and tags, with click counts, trending
+scores and click rollups drawn from a skewed distribution, so every read
+endpoint has realistic work to do at 1k, 10k or 100k rows. A handful of real
+originals and outputs are stored once and shared by all seeded images;
+only their database rows scale.
+
+Rows are written with bulk_create in batches. bulk_create sends no signals,
+so the counters and caches are updated here, as in bulk_upload.py.
+"""
+import random
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from .blobs import release_blob
+from .clicks import hour_bucket
+from .ingest import ingest_upload
+from .models import Category, ClickRollup, StyledImage
+from .signals import adjust_blob_ref_count, adjust_category_count, adjust_tag_counts, invalidate_after_commit
+from .styles import StyleSpec
+from .tagging import get_or_create_tags
+from .trending import click_weight
+
+# Named sizes accepted by the seed_images command
+SEED_SIZES = {'1k': 1_000, '10k': 10_000, '100k': 100_000}
+
+CATEGORY_PREFIX = 'Seed category'
+TAG_PREFIX = 'seed-'
+WORDS = (
+    'summer', 'sale', 'coffee', 'morning', 'quote', 'travel', 'sunset', 'launch', 'weekly', 'offer',
+    'birthday', 'wedding', 'team', 'update', 'event', 'music', 'festival', 'recipe', 'fitness', 'garden',
+)
+SOURCE_COLORS = (
+    (200, 60, 60), (60, 140, 200), (60, 170, 90), (230, 180, 40),
+    (120, 80, 170), (30, 30, 30), (240, 240, 240), (200, 110, 50),
+)
+HOURLY_ROLLUP_DAYS = 8
+
+
+def create_sources(count, text='Seed'):
+    """
+    Store count small originals through the upload pipeline, with one rendered
+    output each. Returns [(blob, output name), ...]; every blob holds the
+    reference ingest took until it is dropped with release_blob().
+    """
+    from .utils import add_text_to_image
+
+    sources = []
+    for index in range(count):
+        color = SOURCE_COLORS[index % len(SOURCE_COLORS)]
+        image = Image.new('RGB', (1200, 800), color)
+        # A per-index band keeps the originals distinct, so they are separate blobs
+        image.paste((255 - color[0], 255 - color[1], 255 - color[2]), (0, 40 * index, 1200, 40 * index + 40))
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+
+        blob, _, _ = ingest_upload(ContentFile(buffer.getvalue(), name=f"seed_{index}.jpg"))
+        source_name, scale = blob.get_render_source()
+        sources.append((blob, add_text_to_image(source_name, text, StyleSpec(), scale)))
+    return sources
+
+
+def get_or_create_categories(count, landing=5):
+    """count seed categories, the first `landing` of them shown on the landing page"""
+    names = [f"{CATEGORY_PREFIX} {index:03d}" for index in range(count)]
+    Category.objects.bulk_create([
+        Category(name=name, description=f"Synthetic {name.lower()}", show_in_landing=index < landing)
+        for index, name in enumerate(names)
+    ], ignore_conflicts=True)
+    return list(Category.objects.filter(name__in=names).order_by('name'))
+
+
+def seed_images(count, categories=20, tags=200, sources=8, uncategorized=0.1, random_seed=0,
+                batch_size=2000, progress=None):
+    """
+    Create count StyledImages with their tag links and click rollups.
+    The same arguments always produce the same data (apart from ids and dates).
+    progress(created) is called after each batch. Returns the number created.
+    """
+    rng = random.Random(random_seed)
+    now = timezone.now()
+
+    category_objects = get_or_create_categories(categories)
+    tag_objects = get_or_create_tags([f"{TAG_PREFIX}{index:04d}" for index in range(tags)])
+    source_pairs = create_sources(sources)
+
+    created = 0
+    try:
+        while created < count:
+            size = min(batch_size, count - created)
+            create_seed_batch(rng, now, created, size, category_objects, tag_objects, source_pairs, uncategorized)
+            created += size
+            if progress:
+                progress(created)
+    finally:
+        for blob, _ in source_pairs:
+            release_blob(blob.id)
+    return created
+
+
+def create_seed_batch(rng, now, offset, size, categories, tags, sources, uncategorized):
+    """Insert one batch of seeded images with their tags and click rollups, and adjust the counters"""
+    images = []
+    for number in range(offset, offset + size):
+        blob, output_name = rng.choice(sources)
+        words = rng.sample(WORDS, rng.randint(2, 6))
+        # Most images are never updated, a few are updated a lot
+        clicks = int(rng.paretovariate(1.2)) - 1 if rng.random() < 0.4 else 0
+        images.append(StyledImage(
+            image_name=f"Seed image {number}" if rng.random() < 0.5 else None,
+            category=None if rng.random() < uncategorized else rng.choice(categories),
+            original_image=blob.file.name,
+            blob=blob,
+            output_image=output_name,
+            output_has_thumbnails=True,
+            text=' '.join(words).capitalize(),
+            font_size=rng.choice((24, 36, 48, 64)),
+            font_color=rng.choice(('#FFFFFF', '#000000', '#FFCC00')),
+            enable_shadow=rng.random() < 0.3,
+            text_rotate=rng.choice((0, 0, 0, 15, -30)),
+            update_clicks=clicks,
+        ))
+
+    with transaction.atomic():
+        images = StyledImage.objects.bulk_create(images)
+
+        # created_at / last_updated are set to now on insert, so spread them over the last year afterwards
+        rollups = []
+        for image in images:
+            image.created_at = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            image.last_updated = image.created_at + (now - image.created_at) * rng.random()
+            if image.update_clicks:
+                image.trending_score = image.update_clicks * click_weight(image.last_updated)
+                rollups.append(seed_rollup(image, now))
+        StyledImage.objects.bulk_update(images, ['created_at', 'last_updated', 'trending_score'], batch_size=500)
+        ClickRollup.objects.bulk_create(rollups, batch_size=1000)
+
+        links = StyledImage.tags.through
+        tag_counts = Counter()
+        link_rows = []
+        for image in images:
+            for tag in rng.sample(tags, rng.randint(0, min(4, len(tags)))):
+                link_rows.append(links(styledimage_id=image.id, tag_id=tag.id))
+                tag_counts[tag.id] += 1
+        links.objects.bulk_create(link_rows, batch_size=1000)
+
+        # The counters and caches the post_save and m2m_changed signals would update
+        for category_id, delta in Counter(image.category_id for image in images).items():
+            adjust_category_count(category_id, delta)
+        for tag_id, delta in tag_counts.items():
+            adjust_tag_counts([tag_id], delta)
+        for blob_id, delta in Counter(image.blob_id for image in images).items():
+            adjust_blob_ref_count(blob_id, delta)
+        invalidate_after_commit(generations=('image', 'category', 'tag'), stats=True, landing=True)
+
+
+def seed_rollup(image, now):
+    """All clicks of a seeded image in the bucket of its last update, hourly while recent"""
+    bucket = hour_bucket(image.last_updated)
+    if now - image.last_updated < timedelta(days=HOURLY_ROLLUP_DAYS):
+        return ClickRollup(image=image, granularity=ClickRollup.HOUR, bucket=bucket, count=image.update_clicks)
+    return ClickRollup(image=image, granularity=ClickRollup.DAY, bucket=bucket.replace(hour=0), count=image.update_clicks)
@@ -0,0 +1,219 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .caching import bump_generation, invalidate_landing_cache
+from .blobs import delete_blob_if_unused
+from .models import Category, ImageBlob, StyledImage, Tag
+from .retention import schedule_superseded_cleanup
+from .stats import invalidate_stats_snapshot
+
+
+# =================== DENORMALIZED IMAGE COUNTERS ===================
+# Category.image_count and Tag.image_count are kept in step with the
+# StyledImage rows here. Writes that bypass signals (queryset.update,
+# bulk_create) can drift them; `manage.py reconcile_image_counts` fixes that.
+
+def adjust_category_count(category_id, delta):
+    """Add delta to a category's stored image count"""
+    if category_id and delta:
+        Category.objects.filter(pk=category_id).update(image_count=F('image_count') + delta)
+
+
+def adjust_tag_counts(tag_ids, delta):
+    """Add delta to the stored image count of every tag in tag_ids"""
+    if tag_ids and delta:
+        Tag.objects.filter(pk__in=tag_ids).update(image_count=F('image_count') + delta)
+
+
+@receiver(pre_save, sender=StyledImage)
+def remember_previous_category(sender, instance, update_fields=None, **kwargs):
+    """Make sure we know which category the row had before this save"""
+    if instance._state.adding or hasattr(instance, '_loaded_category_id'):
+        return
+    if update_fields is not None and 'category' not in update_fields:
+        return
+    instance._loaded_category_id = (
+        StyledImage.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=StyledImage)
+def update_category_counts_on_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Count new images and move counts when an image changes category"""
+    if raw:
+        return
+    if not created and update_fields is not None and 'category' not in update_fields:
+        return
+
+    previous_category_id = None if created else getattr(instance, '_loaded_category_id', None)
+    if previous_category_id != instance.category_id:
+        with transaction.atomic():
+            adjust_category_count(previous_category_id, -1)
+            adjust_category_count(instance.category_id, 1)
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(pre_delete, sender=StyledImage)
+def remember_tags_before_delete(sender, instance, **kwargs):
+    """Tag links are removed by cascade without m2m_changed, so capture them first"""
+    instance._tag_ids_before_delete = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=StyledImage)
+def update_counts_on_delete(sender, instance, **kwargs):
+    """Decrement the category and tag counts of a deleted image"""
+    with transaction.atomic():
+        adjust_category_count(instance.category_id, -1)
+        adjust_tag_counts(getattr(instance, '_tag_ids_before_delete', []), -1)
+
+
+@receiver(m2m_changed, sender=StyledImage.tags.through)
+def update_tag_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Tag.image_count in step with tag links added or removed from either side"""
+    if action == 'pre_remove':
+        # pk_set holds every requested id, including ones that were never linked
+        if reverse:
+            links = sender.objects.filter(tag_id=instance.pk, styledimage_id__in=pk_set)
+        else:
+            links = sender.objects.filter(styledimage_id=instance.pk, tag_id__in=pk_set)
+        instance._tag_links_removed = list(links.values_list('tag_id', flat=True))
+        return
+    if action == 'pre_clear':
+        if reverse:
+            links = sender.objects.filter(tag_id=instance.pk)
+        else:
+            links = sender.objects.filter(styledimage_id=instance.pk)
+        instance._tag_links_removed = list(links.values_list('tag_id', flat=True))
+        return
+
+    if action == 'post_add' and pk_set:
+        # Django only reports the links that were actually created
+        with transaction.atomic():
+            if reverse:
+                adjust_tag_counts([instance.pk], len(pk_set))
+            else:
+                adjust_tag_counts(pk_set, 1)
+    elif action in ('post_remove', 'post_clear'):
+        removed = getattr(instance, '_tag_links_removed', [])
+        instance._tag_links_removed = []
+        with transaction.atomic():
+            if reverse:
+                adjust_tag_counts([instance.pk], -len(removed))
+            else:
+                adjust_tag_counts(removed, -1)
+
+
+# =================== ORIGINAL BLOB REFERENCES ===================
+# ImageBlob.ref_count counts the images using each deduplicated original. A
+# blob whose count drops to zero is deleted with its file after commit.
+
+def adjust_blob_ref_count(blob_id, delta):
+    """Add delta to a blob's reference count, deleting it after commit when unused"""
+    if not blob_id or not delta:
+        return
+    ImageBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') + delta)
+    if delta < 0:
+        transaction.on_commit(lambda: delete_blob_if_unused(blob_id))
+
+
+@receiver(pre_save, sender=StyledImage)
+def remember_previous_blob(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or hasattr(instance, '_loaded_blob_id'):
+        return
+    if update_fields is not None and 'blob' not in update_fields:
+        return
+    instance._loaded_blob_id = (
+        StyledImage.objects.filter(pk=instance.pk).values_list('blob_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=StyledImage)
+def update_blob_refs_on_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Count the new reference when an image is created or switches to another original"""
+    if raw:
+        return
+    if not created and update_fields is not None and 'blob' not in update_fields:
+        return
+
+    previous_blob_id = None if created else getattr(instance, '_loaded_blob_id', None)
+    if previous_blob_id != instance.blob_id:
+        with transaction.atomic():
+            adjust_blob_ref_count(instance.blob_id, 1)
+            adjust_blob_ref_count(previous_blob_id, -1)
+    instance._loaded_blob_id = instance.blob_id
+
+
+@receiver(post_delete, sender=StyledImage)
+def update_blob_refs_on_delete(sender, instance, **kwargs):
+    adjust_blob_ref_count(instance.blob_id, -1)
+
+
+# =================== CACHE INVALIDATION ===================
+# Caches are only invalidated once the write is committed, otherwise a read
+# racing the transaction could cache the old data under the new generation.
+
+def invalidate_after_commit(generations=(), stats=False, landing=False):
+    """Bump response cache generations and drop derived caches after commit"""
+    def invalidate():
+        bump_generation(*generations)
+        if stats:
+            invalidate_stats_snapshot()
+        if landing:
+            invalidate_landing_cache()
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=StyledImage)
+def invalidate_image_caches(sender, **kwargs):
+    """Image writes change listings, totals, the top-10 list and the landing page"""
+    invalidate_after_commit(generations=('image',), stats=True, landing=True)
+
+
+@receiver(post_delete, sender=StyledImage)
+def invalidate_deleted_image_caches(sender, instance, **kwargs):
+    """A deleted image also lowers its tags' counts (the cascade sends no m2m_changed)"""
+    generations = ('image', 'tag') if getattr(instance, '_tag_ids_before_delete', None) else ('image',)
+    invalidate_after_commit(generations=generations, stats=True, landing=True)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_caches(sender, **kwargs):
+    invalidate_after_commit(generations=('category',), landing=True)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_caches(sender, **kwargs):
+    invalidate_after_commit(generations=('tag',))
+
+
+@receiver(m2m_changed, sender=StyledImage.tags.through)
+def invalidate_tag_link_caches(sender, action, **kwargs):
+    """Tag links show up in image listings and in the tag counts"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_after_commit(generations=('image', 'tag'))
+
+
+# =================== SUPERSEDED OUTPUTS ===================
+# Only active with STYLER_DELETE_SUPERSEDED_OUTPUTS; otherwise old outputs
+# are left for `manage.py gc_outputs`.
+
+@receiver(post_save, sender=StyledImage)
+def cleanup_replaced_output(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Delete the previous output file once a new one has been saved"""
+    if raw or created or (update_fields is not None and 'output_image' not in update_fields):
+        return
+    previous_output = getattr(instance, '_loaded_output_name', None)
+    current_output = instance.output_image.name if instance.output_image else None
+    if previous_output != current_output:
+        schedule_superseded_cleanup([previous_output])
+    instance._loaded_output_name = current_output
+
+
+@receiver(post_delete, sender=StyledImage)
+def cleanup_deleted_output(sender, instance, **kwargs):
+    if instance.output_image:
+        schedule_superseded_cleanup([instance.output_image.name])
@@ -0,0 +1,211 @@
+"""
+Cache of rasterized text sprites.
+
+Laying out and rasterizing the caption (and its shadow and background box)
+is the expensive part of a render, but it only depends on the text and its
+geometry. A TextSprite holds those pieces as alpha masks in a small tile, so
+a render whose position or colors changed becomes a fill through the cached
+masks and a paste, instead of a new layout. Rotated captions also rotate the
+painted tile, which is still far cheaper than rotating a full-size layer.
+
+Each process has its own cache, bounded by STYLER_TEXT_SPRITE_CACHE_BYTES and
+evicted least recently used first.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from PIL import Image, ImageDraw
+
+# Room around the ink for antialiasing and resampling
+TILE_MARGIN = 2
+
+
+def get_sprite_cache_bytes():
+    """Memory budget of the sprite cache in bytes (0 disables it)"""
+    return getattr(settings, 'STYLER_TEXT_SPRITE_CACHE_BYTES', 64 * 1024 * 1024)
+
+
+def glyph_runs(text, font, letter_spacing):
+    """
+    (x offset, text) pieces in drawing order. With letter spacing every
+    character is placed on its own, advanced by its ink width plus the spacing.
+    """
+    if letter_spacing == 0:
+        return [(0, text)]
+
+    measure = ImageDraw.Draw(Image.new('L', (1, 1)))
+    runs = []
+    current_x = 0
+    for char in text:
+        char_bbox = measure.textbbox((0, 0), char, font=font)
+        runs.append((current_x, char))
+        current_x += (char_bbox[2] - char_bbox[0]) + letter_spacing
+    return runs
+
+
+class TextSprite:
+    """
+    Alpha masks of a caption's background box, shadow and text in one tile.
+    The tile sits at (offset_x, offset_y) from the text anchor, the point the
+    text is drawn at.
+    """
+    __slots__ = (
+        'text_width', 'offset_x', 'offset_y', 'size', 'center',
+        'background_mask', 'shadow_mask', 'text_mask',
+    )
+
+    def __init__(self, text, font, letter_spacing, background_height, rotatable, shadow_offset, padding):
+        measure = ImageDraw.Draw(Image.new('L', (1, 1)))
+        bbox = measure.textbbox((0, 0), text, font=font)
+        self.text_width = bbox[2] - bbox[0]
+        if letter_spacing != 0 and len(text) > 1:
+            self.text_width += letter_spacing * (len(text) - 1)
+
+        runs = glyph_runs(text, font, letter_spacing)
+
+        # Box around everything that gets drawn, relative to the anchor
+        boxes = [measure.textbbox((x, 0), chunk, font=font) for x, chunk in runs]
+        if shadow_offset is not None:
+            dx, dy = shadow_offset
+            boxes += [(left + dx, top + dy, right + dx, bottom + dy) for left, top, right, bottom in boxes]
+        if padding is not None:
+            boxes.append((-padding, -padding, self.text_width + padding, background_height + padding))
+        left = math.floor(min(box[0] for box in boxes)) - TILE_MARGIN
+        top = math.floor(min(box[1] for box in boxes)) - TILE_MARGIN
+        right = math.ceil(max(box[2] for box in boxes)) + TILE_MARGIN
+        bottom = math.ceil(max(box[3] for box in boxes)) + TILE_MARGIN
+
+        # Rotation is around the middle of the text box
+        center_x = self.text_width // 2
+        center_y = background_height // 2
+        if rotatable:
+            # Grow the tile to a square around the center so rotated ink stays inside
+            radius = math.ceil(max(
+                math.hypot(x - center_x, y - center_y) for x in (left, right) for y in (top, bottom)
+            )) + TILE_MARGIN
+            left = math.floor(center_x) - radius
+            top = math.floor(center_y) - radius
+            right = left + 2 * radius
+            bottom = top + 2 * radius
+
+        self.offset_x, self.offset_y = left, top
+        self.size = (right - left, bottom - top)
+
+        def new_mask():
+            return Image.new('L', self.size, 0)
+
+        self.background_mask = None
+        if padding is not None:
+            self.background_mask = new_mask()
+            ImageDraw.Draw(self.background_mask).rectangle([
+                -padding - left,
+                -padding - top,
+                self.text_width + padding - left,
+                background_height + padding - top
+            ], fill=255)
+
+        self.text_mask = new_mask()
+        draw = ImageDraw.Draw(self.text_mask)
+        for x, chunk in runs:
+            draw.text((x - left, -top), chunk, fill=255, font=font)
+
+        self.shadow_mask = None
+        if shadow_offset is not None:
+            self.shadow_mask = new_mask()
+            self.shadow_mask.paste(self.text_mask, shadow_offset)
+
+        self.center = (center_x - left, center_y - top)
+
+    @property
+    def nbytes(self):
+        masks = [mask for mask in (self.background_mask, self.shadow_mask, self.text_mask) if mask is not None]
+        return len(masks) * self.size[0] * self.size[1]
+
+    def paint(self, text_rgba, shadow_rgba=None, background_rgba=None, rotate=0):
+        """RGBA tile with the masks filled in their colors (background first), then rotated"""
+        tile = Image.new('RGBA', self.size, (0, 0, 0, 0))
+        if background_rgba is not None and self.background_mask is not None:
+            tile.paste(background_rgba, (0, 0), self.background_mask)
+        if shadow_rgba is not None and self.shadow_mask is not None:
+            tile.paste(shadow_rgba, (0, 0), self.shadow_mask)
+        tile.paste(text_rgba, (0, 0), self.text_mask)
+        # Rotating the painted tile (not the masks) matches rotating the whole text layer exactly
+        if rotate != 0:
+            tile = tile.rotate(rotate, center=self.center, resample=Image.BICUBIC)
+        return tile
+
+
+class SpriteCache:
+    """Thread-safe LRU of TextSprites, bounded by total mask bytes"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sprites = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build):
+        """Cached sprite for key, calling build() to make it on a miss"""
+        with self.lock:
+            sprite = self.sprites.get(key)
+            if sprite is not None:
+                self.sprites.move_to_end(key)
+                self.hits += 1
+                return sprite
+            self.misses += 1
+
+        sprite = build()
+        limit = get_sprite_cache_bytes()
+        if sprite.nbytes > limit:
+            return sprite
+
+        with self.lock:
+            if key not in self.sprites:
+                self.sprites[key] = sprite
+                self.bytes += sprite.nbytes
+            while self.bytes > limit:
+                _, evicted = self.sprites.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+        return sprite
+
+    def clear(self):
+        with self.lock:
+            self.sprites.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.sprites),
+                'bytes': self.bytes,
+                'max_bytes': get_sprite_cache_bytes(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0,
+            }
+
+
+sprite_cache = SpriteCache()
+
+
+def get_text_sprite(text, font_key, load_font, font_size, letter_spacing, line_height,
+                    rotate=0, shadow_offset=None, padding=None):
+    """
+    Sprite for a caption, from the cache when the same text was laid out with
+    the same geometry before. load_font() is only called on a miss.
+    shadow_offset / padding are None when the shadow / background box is off.
+    """
+    background_height = int(font_size * line_height)
+    # Any angle fits in the same square tile, so the angle itself is not part of the key
+    rotatable = rotate != 0
+    key = (text, font_key, font_size, letter_spacing, background_height, rotatable, shadow_offset, padding)
+    return sprite_cache.get(key, lambda: TextSprite(
+        text, load_font(), letter_spacing, background_height, rotatable, shadow_offset, padding
+    ))
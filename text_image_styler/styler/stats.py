@@ -0,0 +1,70 @@
+"""
+Cached statistics snapshot used by the stats and most-updated endpoints.
+
+The snapshot is built with one aggregate query (plus the top-10 list) and
+kept in the cache. Writes to StyledImage and click flushes drop it; the short
+TTL bounds staleness from writes made by other processes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+STATS_SNAPSHOT_CACHE_KEY = 'styler:stats-snapshot'
+
+
+def get_snapshot_ttl():
+    """Seconds a snapshot may be served before it is rebuilt"""
+    return getattr(settings, 'STYLER_STATS_SNAPSHOT_TTL', 30)
+
+
+def compute_stats_snapshot():
+    """Build the statistics snapshot from the database"""
+    from .models import StyledImage
+
+    totals = StyledImage.objects.aggregate(
+        total_images=Count('pk'),
+        images_with_clicks=Count('pk', filter=Q(update_clicks__gt=0)),
+        total_clicks=Coalesce(Sum('update_clicks'), 0),
+    )
+
+    top_images = StyledImage.objects.select_related('category').only(
+        'id', 'text', 'update_clicks', 'last_updated', 'output_image', 'category__name'
+    ).order_by('-update_clicks')[:10]
+
+    top_images_data = []
+    for image in top_images:
+        top_images_data.append({
+            'id': image.id,
+            'text': image.text[:30] + '...' if len(image.text) > 30 else image.text,
+            'update_clicks': image.update_clicks,
+            'last_updated': image.last_updated.isoformat(),
+            'category': image.category.name if image.category else 'Uncategorized',
+            # Relative URL, the views make it absolute for the current request
+            'output_image_url': image.output_image.url if image.output_image else None,
+        })
+
+    total_images = totals['total_images']
+    return {
+        'total_images': total_images,
+        'images_with_clicks': totals['images_with_clicks'],
+        'total_clicks': totals['total_clicks'],
+        'average_clicks_per_image': totals['total_clicks'] / total_images if total_images > 0 else 0,
+        'top_updated_images': top_images_data,
+        'computed_at': timezone.now().isoformat(),
+    }
+
+
+def get_stats_snapshot():
+    """Return the cached snapshot, rebuilding it when missing or expired"""
+    snapshot = cache.get(STATS_SNAPSHOT_CACHE_KEY)
+    if snapshot is None:
+        snapshot = compute_stats_snapshot()
+        cache.set(STATS_SNAPSHOT_CACHE_KEY, snapshot, get_snapshot_ttl())
+    return snapshot
+
+
+def invalidate_stats_snapshot():
+    """Drop the snapshot after a write so the next read rebuilds it"""
+    cache.delete(STATS_SNAPSHOT_CACHE_KEY)
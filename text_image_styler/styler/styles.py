@@ -0,0 +1,211 @@
+"""
+StyleSpec: the validated, immutable styling of a render.
+
+Request data, presets and stored images are converted to a StyleSpec once;
+the renderer, the render pool and the caches take it as it is, so no option
+is parsed twice. Colors are turned into RGBA when the spec is built. Specs
+compare and hash by value and `digest` is the same in every process, which
+makes a spec usable as a key of in-process and shared caches alike.
+"""
+import hashlib
+import math
+import re
+
+COLOR_PATTERN = re.compile(r'^#?[0-9a-fA-F]{6}$')
+ALPHA_COLOR_PATTERN = re.compile(r'^#?(?:[0-9a-fA-F]{6}|[0-9a-fA-F]{8})$')
+TRUE_VALUES = ('on', 'true', '1', 'yes')
+# Choices of StyledImage/StylePreset.text_alignment and font_weight
+TEXT_ALIGNMENTS = ('left', 'center', 'right')
+FONT_WEIGHTS = ('100', '200', '300', '400', '500', '600', '700', '800', '900')
+
+
+def parse_bool(value):
+    """Checkbox style flag: 'on' (form data), true/false (JSON) or 1/0"""
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_VALUES
+    return bool(value)
+
+
+def parse_float(value):
+    """Finite float (NaN and infinity would pass float() but break the layout)"""
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"could not convert string to a finite float: {value!r}")
+    return value
+
+
+def parse_alignment(value):
+    """One of TEXT_ALIGNMENTS"""
+    value = str(value).strip()
+    if value not in TEXT_ALIGNMENTS:
+        raise ValueError(f"{value!r} is not one of {', '.join(TEXT_ALIGNMENTS)}")
+    return value
+
+
+def parse_font_weight(value):
+    """One of FONT_WEIGHTS, given as a string or a number"""
+    value = str(value).strip()
+    if value not in FONT_WEIGHTS:
+        raise ValueError(f"{value!r} is not one of {', '.join(FONT_WEIGHTS)}")
+    return value
+
+
+def parse_color(value, pattern=COLOR_PATTERN):
+    """#RRGGBB (or what pattern accepts), always with the #"""
+    value = str(value).strip()
+    if not pattern.match(value):
+        raise ValueError(f"Invalid color: {value!r}")
+    return '#' + value.lstrip('#')
+
+
+def parse_alpha_color(value):
+    """#RRGGBB or #RRGGBBAA, always with the # (only the background stores an alpha)"""
+    return parse_color(value, ALPHA_COLOR_PATTERN)
+
+
+def hex_to_rgba(hex_color, opacity=255):
+    """RGBA tuple of a parsed color; opacity scales the alpha of #RRGGBBAA colors"""
+    hex_color = hex_color.lstrip('#')
+    r = int(hex_color[0:2], 16)
+    g = int(hex_color[2:4], 16)
+    b = int(hex_color[4:6], 16)
+    if len(hex_color) == 8:  # With alpha
+        return (r, g, b, int(int(hex_color[6:8], 16) * (opacity / 255)))
+    return (r, g, b, opacity)
+
+
+# (field, converter, default) in a fixed order; the defaults are those of the upload API
+FIELDS = (
+    ('font_size', int, 48),
+    ('font_color', parse_color, '#FFFFFF'),
+    ('x_position', int, 250),
+    ('y_position', int, 250),
+    ('font_family', str, 'Roboto'),
+    ('text_alignment', parse_alignment, 'center'),
+    ('font_weight', parse_font_weight, '600'),
+    ('text_rotate', int, 0),
+    ('text_opacity', int, 100),
+    ('enable_shadow', parse_bool, False),
+    ('shadow_x', int, 2),
+    ('shadow_y', int, 2),
+    ('shadow_blur', int, 4),
+    ('shadow_color', parse_color, '#000000'),
+    ('enable_background', parse_bool, False),
+    ('text_background', parse_alpha_color, '#00000000'),
+    ('letter_spacing', parse_float, 0.0),
+    ('line_height', parse_float, 1.2),
+)
+FIELD_NAMES = tuple(name for name, _, _ in FIELDS)
+
+
+def _unpickle_spec(values):
+    return StyleSpec(**dict(zip(FIELD_NAMES, values)))
+
+
+class StyleSpec:
+    """
+    Validated, immutable styling options with the colors precomputed as RGBA
+    Raises ValueError with a message for the client when a value is invalid.
+    """
+    __slots__ = FIELD_NAMES + ('font_color_rgba', 'shadow_color_rgba', 'background_rgba', 'digest', '_hash')
+
+    def __init__(self, **values):
+        unknown = set(values) - set(FIELD_NAMES)
+        if unknown:
+            raise TypeError(f"Unknown style fields: {', '.join(sorted(unknown))}")
+
+        for name, convert, default in FIELDS:
+            value = values.get(name)
+            if value is None:
+                value = default
+            try:
+                value = convert(value)
+            except (TypeError, ValueError) as e:
+                if convert in (int, parse_float):
+                    raise ValueError(f'Invalid numeric values: {str(e)}')
+                raise ValueError(f'Invalid {name}: {str(e)}')
+            object.__setattr__(self, name, value)
+
+        # Validate ranges
+        if self.text_opacity < 0 or self.text_opacity > 100:
+            raise ValueError('Text opacity must be between 0 and 100')
+        if self.text_rotate < -180 or self.text_rotate > 180:
+            raise ValueError('Text rotation must be between -180 and 180 degrees')
+
+        # Opacity percentage as 0-255 alpha; the shadow is slightly transparent
+        object.__setattr__(self, 'font_color_rgba', hex_to_rgba(self.font_color, int(self.text_opacity * 2.55)))
+        object.__setattr__(self, 'shadow_color_rgba', hex_to_rgba(self.shadow_color, 200))
+        object.__setattr__(self, 'background_rgba', hex_to_rgba(self.text_background))
+
+        digest = hashlib.blake2b(repr(self.values()).encode('utf-8'), digest_size=8).hexdigest()
+        object.__setattr__(self, 'digest', digest)
+        object.__setattr__(self, '_hash', int(digest, 16))
+
+    @classmethod
+    def from_options(cls, data):
+        """Spec from request data or a style options dict, using the defaults for missing fields"""
+        return cls(**{name: data.get(name) for name in FIELD_NAMES})
+
+    @classmethod
+    def from_instance(cls, obj):
+        """Spec from a StyledImage or StylePreset"""
+        return cls(**{name: getattr(obj, name) for name in FIELD_NAMES})
+
+    @classmethod
+    def from_stored(cls, obj, **changes):
+        """
+        Spec of a StyledImage or StylePreset with changes applied (None values are
+        ignored). Stored values that do not validate, such as colors saved before
+        validation existed, fall back to their defaults; invalid changes raise ValueError.
+        """
+        values = {name: value for name, value in changes.items() if value is not None}
+        for name in FIELD_NAMES:
+            if name in values:
+                continue
+            value = getattr(obj, name)
+            try:
+                cls(**{name: value})
+            except ValueError:
+                continue
+            values[name] = value
+        return cls(**values)
+
+    @classmethod
+    def coerce(cls, style):
+        """A StyleSpec as it is, or the spec of a style options dict"""
+        if isinstance(style, cls):
+            return style
+        return cls.from_options(style)
+
+    def values(self):
+        """Field values in FIELD_NAMES order"""
+        return tuple(getattr(self, name) for name in FIELD_NAMES)
+
+    def as_fields(self):
+        """{field name: value}, ready to assign to a StyledImage or StylePreset"""
+        return dict(zip(FIELD_NAMES, self.values()))
+
+    def replace(self, **changes):
+        """New spec with some fields changed (and validated)"""
+        return StyleSpec(**{**self.as_fields(), **changes})
+
+    def __setattr__(self, name, value):
+        raise AttributeError('StyleSpec is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('StyleSpec is immutable')
+
+    def __eq__(self, other):
+        if not isinstance(other, StyleSpec):
+            return NotImplemented
+        return self._hash == other._hash and self.values() == other.values()
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # Rebuilt through __init__, as the slots cannot be set directly
+        return _unpickle_spec, (self.values(),)
+
+    def __repr__(self):
+        return f"StyleSpec({self.digest}: {self.font_family} {self.font_weight} {self.font_size}px {self.font_color})"
@@ -0,0 +1,44 @@
+"""
+Assigning tags to images with a fixed number of queries.
+
+Names are resolved with one IN query, missing tags are created with a single
+bulk insert, and the links are changed with one diff-based set().
+"""
+from .models import Tag
+
+
+def parse_tag_names(value):
+    """Lowercased, de-duplicated tag names from a comma separated string or a list"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    names = []
+    for name in value:
+        name = str(name).strip().lower()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def get_or_create_tags(names):
+    """Tag objects for every name, creating the missing ones in one insert"""
+    if not names:
+        return []
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = [name for name in names if name not in tags]
+    if missing:
+        # Another request may create the same tags meanwhile, so ignore conflicts and re-read
+        Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+        tags.update((tag.name, tag) for tag in Tag.objects.filter(name__in=missing))
+    return [tags[name] for name in names if name in tags]
+
+
+def assign_tags(styled_image, value):
+    """
+    Make the tags of styled_image exactly the names in value
+    Only the links that differ are added or removed. Returns the tag objects.
+    """
+    tags = get_or_create_tags(parse_tag_names(value))
+    styled_image.tags.set(tags)
+    return tags
@@ -1,3 +1,1321 @@
-from django.test import TestCase
+import importlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.forms.models import model_to_dict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from . import rendering, trending
+from .admin import StylePresetAdminForm
+from .api_benchmark import build_endpoints, check_report, pick_target, run_api_benchmark, sample_upload
+from .benchmark import build_cases, compare_results, image_dimensions, run_benchmark
+from .blobs import release_blob
+from .caching import bump_generation, get_generations
+from .clicks import ClickAggregator, click_aggregator, hour_bucket
+from .ingest import ingest_upload
+from .models import (
+    CacheGeneration, Category, ClickRollup, ImageBlob, PendingClick, RenderJob, StyledImage, StylePreset, Tag,
+)
+from .seeding import create_sources, seed_images
+from .sprites import SpriteCache, glyph_runs, sprite_cache
+from .styles import StyleSpec
+from .tagging import assign_tags, parse_tag_names
+from .thumbnails import get_thumbnail_widths, thumbnail_name
+from .utils import load_font, render_text_image, resolve_font_path
+
+TEST_FONT = 'Roboto_600.ttf'
+
+
+def create_image(**fields):
+    """A StyledImage row without files, for tests that only need the database"""
+    fields.setdefault('text', 'Test image')
+    fields.setdefault('original_image', 'uploads/test.jpg')
+    return StyledImage.objects.create(**fields)
+
+
+class StylerTestCase(TestCase):
+    """
+    Runs against a temporary MEDIA_ROOT and renders in a thread instead of the
+    spawned process pool, whose workers would not see the test settings or database.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls.media_root, 'fonts'))
+        shutil.copy(
+            os.path.join(settings.BASE_DIR, 'media', 'fonts', TEST_FONT),
+            os.path.join(cls.media_root, 'fonts', TEST_FONT),
+        )
+        cls.settings_override = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            STYLER_CLICK_FLUSH_INTERVAL=0,
+            STYLER_PERSIST_OUTPUTS_IN_BACKGROUND=False,
+        )
+        cls.settings_override.enable()
+        cls.saved_pool = rendering._pool
+        rendering._pool = ThreadPoolExecutor(max_workers=1)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        rendering._pool.shutdown()
+        rendering._pool = cls.saved_pool
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        # Clicks are flushed on commit, which never comes in a TestCase; write them
+        # in the test transaction so none are left for the exit hook
+        while click_aggregator.flush():
+            pass
+
+
+class ImageCountTests(StylerTestCase):
+
+    def assertCounts(self, category_counts, tag_counts):
+        self.assertEqual(dict(Category.objects.values_list('name', 'image_count')), category_counts)
+        self.assertEqual(dict(Tag.objects.values_list('name', 'image_count')), tag_counts)
+
+    def test_counts_follow_saves_deletes_and_tag_links(self):
+        travel, food = Category.objects.create(name='Travel'), Category.objects.create(name='Food')
+        beach, city = Tag.objects.create(name='beach'), Tag.objects.create(name='city')
+
+        first = create_image(category=travel)
+        second = create_image(category=travel)
+        first.tags.add(beach, city)
+        second.tags.add(beach)
+        self.assertCounts({'Travel': 2, 'Food': 0}, {'beach': 2, 'city': 1})
+
+        first.category = food
+        first.save()
+        second.save()
+        city.styled_images.remove(first)
+        self.assertCounts({'Travel': 1, 'Food': 1}, {'beach': 2, 'city': 0})
+
+        second.tags.clear()
+        self.assertCounts({'Travel': 1, 'Food': 1}, {'beach': 1, 'city': 0})
+
+        first.delete()
+        second.delete()
+        self.assertCounts({'Travel': 0, 'Food': 0}, {'beach': 0, 'city': 0})
+
+    def test_category_cover_is_the_newest_image(self):
+        travel = Category.objects.create(name='Travel')
+        Category.objects.create(name='Empty')
+        older = create_image(category=travel, output_image='outputs/old.jpg')
+        create_image(category=travel, original_image='uploads/new.jpg')
+        StyledImage.objects.filter(pk=older.pk).update(created_at=timezone.now() - timedelta(days=1))
+
+        # The cache generations and the categories with their covers
+        with self.assertNumQueries(2):
+            categories = {
+                category['name']: category for category in self.client.get('/api/categories/').json()['categories']
+            }
+        self.assertTrue(categories['Travel']['category_image'].endswith('/uploads/new.jpg'))
+        self.assertEqual(categories['Travel']['total_images'], 2)
+        self.assertIsNone(categories['Empty']['category_image'])
+
+
+class TrendingWeightTests(StylerTestCase):
+
+    def test_weights_are_clamped_long_after_the_epoch(self):
+        now = timezone.now()
+        with override_settings(STYLER_TRENDING_EPOCH=(now - timedelta(days=365 * 20)).isoformat()):
+            with mock.patch('styler.trending._epoch_warned', False), mock.patch('builtins.print') as log:
+                weight = trending.click_weight(now)
+                trending.click_weight(now)
+
+        self.assertEqual(weight, math.exp(trending.MAX_EXPONENT))
+        self.assertTrue(math.isfinite(weight * 1_000_000))
+        log.assert_called_once()
+
+    def test_recent_clicks_outweigh_older_ones(self):
+        now = timezone.now()
+        self.assertGreater(trending.click_weight(now), trending.click_weight(now - timedelta(days=3)))
+        self.assertAlmostEqual(trending.decayed_score(trending.click_weight(now), now), 1.0)
+
+
+class BlobReferenceTests(StylerTestCase):
+
+    def ref_counts(self, *blobs):
+        return tuple(ImageBlob.objects.get(pk=blob.pk).ref_count for blob in blobs)
+
+    def test_ref_counts_follow_replace_and_delete(self):
+        first_blob, second_blob = [blob for blob, _ in create_sources(2)]
+        same_blob, created, _ = ingest_upload(default_storage.open(first_blob.file.name))
+        self.assertEqual((same_blob.pk, created), (first_blob.pk, False))
+        # Every store holds a reference until it is handed to an image
+        self.assertEqual(self.ref_counts(first_blob, second_blob), (2, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image = create_image(blob=first_blob, original_image=first_blob.file.name)
+            other = create_image(blob=first_blob, original_image=first_blob.file.name)
+            image.blob = second_blob
+            image.save()
+            for blob in (first_blob, first_blob, second_blob):
+                release_blob(blob.id)
+        self.assertEqual(self.ref_counts(first_blob, second_blob), (1, 1))
+
+        # The last reference going away deletes the blob and its file after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertFalse(ImageBlob.objects.filter(pk=first_blob.pk).exists())
+        self.assertFalse(default_storage.exists(first_blob.file.name))
+        self.assertEqual(self.ref_counts(second_blob), (1,))
+
+    def test_a_blob_being_reused_is_not_deleted(self):
+        blob = create_sources(1)[0][0]
+        image = create_image(blob=blob, original_image=blob.file.name)
+        release_blob(blob.id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            image.delete()
+
+        # An upload of the same content finds the blob before the delete runs
+        same_blob, created, _ = ingest_upload(default_storage.open(blob.file.name))
+        for callback in callbacks:
+            callback()
+        self.assertEqual((same_blob.pk, created), (blob.pk, False))
+        self.assertTrue(default_storage.exists(blob.file.name))
+
+        # Its image failed, so dropping the upload's reference deletes the blob
+        with self.captureOnCommitCallbacks(execute=True):
+            release_blob(blob.id)
+        self.assertFalse(ImageBlob.objects.filter(pk=blob.pk).exists())
+        self.assertFalse(default_storage.exists(blob.file.name))
+
+
+def jpeg_upload(size, orientation=1, name='upload.jpg'):
+    """A JPEG upload of size (as stored) with an EXIF orientation"""
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = BytesIO()
+    Image.new('RGB', size, (90, 120, 160)).save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class IngestTests(StylerTestCase):
+
+    def output_size(self, image_id):
+        with default_storage.open(StyledImage.objects.get(pk=image_id).output_image.name) as f:
+            return Image.open(f).size
+
+    @override_settings(STYLER_MAX_UPLOAD_PIXELS=10_000)
+    def test_oversized_uploads_are_rejected_without_decoding(self):
+        with mock.patch('PIL.ImageFile.ImageFile.load') as load:
+            response = self.client.post('/api/upload-style/', {'image': jpeg_upload((200, 100)), 'text': 'Big'})
+        load.assert_not_called()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('limit is 10,000 pixels', response.json()['error'])
+        self.assertFalse(ImageBlob.objects.exists())
+
+    @override_settings(STYLER_WORKING_MAX_PIXELS=20_000)
+    def test_originals_are_oriented_and_downscaled_once(self):
+        upload = jpeg_upload((400, 200), orientation=6)
+        blob, created, working = ingest_upload(upload)
+        self.assertTrue(created)
+        # Rotated a quarter turn, then halved to fit the working pixel budget
+        self.assertEqual((blob.width, blob.height, blob.working_scale), (200, 400, 0.5))
+        self.assertEqual(working.size, (100, 200))
+        source_name, scale = blob.get_render_source()
+        with default_storage.open(source_name) as f:
+            self.assertEqual((Image.open(f).size, scale), ((100, 200), 0.5))
+        # The original is archived as uploaded
+        with default_storage.open(blob.file.name) as f:
+            self.assertEqual(f.read(), upload.open().read())
+
+        blob, created, working = ingest_upload(jpeg_upload((100, 50)))
+        self.assertEqual((blob.working_file.name, blob.working_scale), (None, 1.0))
+
+    @override_settings(STYLER_WORKING_MAX_PIXELS=20_000)
+    def test_renders_are_made_from_the_working_copy(self):
+        data = self.client.post('/api/upload-style/', {
+            'image': jpeg_upload((400, 200), orientation=6), 'text': 'Hello', 'x_position': 100, 'y_position': 300,
+        }).json()
+        self.assertEqual(self.output_size(data['styled_image_id']), (100, 200))
+
+        response = self.client.post('/api/update-text-json/', json.dumps(
+            {'id': data['styled_image_id'], 'text': 'Again'}
+        ), content_type='application/json')
+        self.assertTrue(response.json()['regenerated'])
+        self.assertEqual(self.output_size(data['styled_image_id']), (100, 200))
+
+
+class RenderFromMemoryTests(StylerTestCase):
+
+    def test_new_uploads_render_from_the_decoded_upload(self):
+        with mock.patch('styler.views.open_image') as open_image:
+            data = self.client.post('/api/upload-style/', {'image': jpeg_upload((320, 240)), 'text': 'Hello'}).json()
+        open_image.assert_not_called()
+        self.assertTrue(default_storage.exists(StyledImage.objects.get(pk=data['styled_image_id']).output_image.name))
+
+    def test_update_answers_with_the_render_and_writes_it_after_commit(self):
+        image_id = self.client.post(
+            '/api/upload-style/', {'image': jpeg_upload((320, 240)), 'text': 'Hello'}
+        ).json()['styled_image_id']
+        previous = StyledImage.objects.get(pk=image_id).output_image.name
+        _, outputs = default_storage.listdir('outputs')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/update-text/', json.dumps(
+                {'id': image_id, 'text': 'Updated'}
+            ), content_type='application/json')
+        self.assertEqual(Image.open(BytesIO(response.content)).size, (320, 240))
+        # Nothing is written before the response
+        self.assertEqual(default_storage.listdir('outputs')[1], outputs)
+        self.assertEqual(StyledImage.objects.get(pk=image_id).output_image.name, previous)
+
+        for callback in callbacks:
+            callback()
+        with default_storage.open(StyledImage.objects.get(pk=image_id).output_image.name) as f:
+            self.assertEqual(f.read(), response.content)
+
+
+@override_settings(STORAGES={**settings.STORAGES, 'default': settings.MEDIA_STORAGE_BACKENDS['memory']})
+class MemoryStorageTests(StylerTestCase):
+
+    def media_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media_root)
+            for directory, _, names in os.walk(self.media_root) for name in names
+        )
+
+    def test_the_render_pipeline_runs_without_local_media(self):
+        self.assertEqual(self.media_files(), [os.path.join('fonts', TEST_FONT)])
+        image_id = self.client.post(
+            '/api/upload-style/', {'image': jpeg_upload((320, 240)), 'text': 'Hello', 'tags': 'memory'}
+        ).json()['styled_image_id']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/update-text-json/', json.dumps(
+                {'id': image_id, 'text': 'Updated', 'font_size': 60}
+            ), content_type='application/json')
+        self.assertTrue(response.json()['regenerated'])
+
+        image = StyledImage.objects.get(pk=image_id)
+        updated_output = image.output_image.name
+        rendering.render_batch([image])
+        image.refresh_from_db()
+        self.assertNotEqual(image.output_image.name, updated_output)
+        for name in (image.original_image.name, image.output_image.name):
+            self.assertTrue(all(
+                default_storage.exists(thumbnail_name(name, width)) for width in get_thumbnail_widths()
+            ))
+        response = self.client.get(f'/download/{image_id}/')
+        self.assertEqual(Image.open(BytesIO(b''.join(response.streaming_content))).size, (320, 240))
+
+        # Only the font is read from the local media directory
+        self.assertEqual(self.media_files(), [os.path.join('fonts', TEST_FONT)])
+
+
+class ThumbnailTests(StylerTestCase):
+
+    def get_thumbnail_urls(self, image):
+        with mock.patch.object(default_storage, 'exists', side_effect=AssertionError("storage was checked")):
+            data = self.client.get(f'/api/get-image-data/{image.id}/').json()
+        return {int(width): url for width, url in data['image_data']['thumbnail_urls'].items()}, data['image_data']['srcset']
+
+    def test_variant_urls_are_derived_with_their_real_widths(self):
+        blob, output_name = create_sources(1)[0]
+        image = create_image(
+            blob=blob, original_image=blob.file.name, output_image=output_name, output_has_thumbnails=True
+        )
+
+        urls, srcset = self.get_thumbnail_urls(image)
+        self.assertEqual(sorted(urls), [64, 320, 1024])
+        self.assertTrue(srcset.endswith('1024w'))
+        for width, url in urls.items():
+            with default_storage.open(url.split(settings.MEDIA_URL, 1)[1]) as f:
+                self.assertEqual(Image.open(f).width, width)
+
+        # A source narrower than the widest variants lists it once, at its own width
+        ImageBlob.objects.filter(pk=blob.pk).update(width=300, working_scale=1.0)
+        cache.clear()
+        urls, srcset = self.get_thumbnail_urls(image)
+        self.assertEqual(sorted(urls), [64, 300])
+        self.assertTrue(srcset.endswith(' 300w'))
+
+    def test_images_without_a_blob_have_no_variants(self):
+        self.assertEqual(self.get_thumbnail_urls(create_image(output_image='outputs/legacy.jpg')), ({}, ''))
+
+    def test_variants_are_only_linked_once_generated(self):
+        blob, rendered_name = create_sources(1)[0]
+        output_name = default_storage.save('outputs/by_hand.jpg', default_storage.open(rendered_name))
+        image = create_image(blob=blob, original_image=blob.file.name, output_image=output_name)
+        self.assertEqual(self.get_thumbnail_urls(image), ({}, ''))
+
+        call_command('build_thumbnails', stdout=StringIO())
+        urls, _ = self.get_thumbnail_urls(image)
+        self.assertEqual(sorted(urls), [64, 320, 1024])
+        for url in urls.values():
+            self.assertTrue(default_storage.exists(url.split(settings.MEDIA_URL, 1)[1]))
+
+    def test_failed_original_variants_are_not_linked(self):
+        with mock.patch('styler.ingest.generate_thumbnails', side_effect=OSError("disk full")), \
+                mock.patch('builtins.print'):
+            blob = create_sources(1)[0][0]
+        image = create_image(blob=blob, original_image=blob.file.name)
+        self.assertFalse(blob.has_thumbnails)
+        self.assertIsNone(image.get_original_thumbnail_width())
+
+        call_command('build_thumbnails', stdout=StringIO())
+        blob.refresh_from_db()
+        self.assertTrue(blob.has_thumbnails)
+        self.assertTrue(default_storage.exists(thumbnail_name(blob.file.name, 64)))
+
+
+class ClickAggregatorTests(StylerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.aggregator = ClickAggregator()
+
+    def test_clicks_are_written_behind(self):
+        image = create_image()
+        stale = StyledImage.objects.get(pk=image.pk)
+        with mock.patch('styler.clicks.click_aggregator', self.aggregator):
+            image.increment_clicks()
+            image.increment_clicks()
+        self.assertEqual(StyledImage.objects.get(pk=image.pk).update_clicks, 0)
+        self.assertEqual(self.aggregator.pending(image.id), 2)
+
+        self.aggregator.flush()
+        # A full save of an instance loaded before the flush keeps the flushed count
+        stale.text = 'Renamed'
+        stale.save()
+        image.refresh_from_db()
+        self.assertEqual((image.update_clicks, image.text), (2, 'Renamed'))
+
+    def test_saves_keep_deferred_fields_and_deleted_rows(self):
+        image = create_image(text='Original')
+        self.aggregator.record(image.id)
+        self.aggregator.flush()
+
+        partial = StyledImage.objects.only('text').get(pk=image.pk)
+        partial.text = 'Renamed'
+        with self.assertNumQueries(1):
+            partial.save()
+        image.refresh_from_db()
+        self.assertEqual((image.text, image.update_clicks), ('Renamed', 1))
+
+        # A plain save of a row deleted meanwhile inserts it again
+        StyledImage.objects.filter(pk=image.pk).delete()
+        image.save()
+        self.assertTrue(StyledImage.objects.filter(pk=image.pk, text='Renamed').exists())
+
+    def test_clicks_outlive_the_process_that_recorded_them(self):
+        image = create_image()
+        self.aggregator.record(image.id)
+        with transaction.atomic():
+            self.aggregator.record(image.id)
+            transaction.set_rollback(True)
+
+        # Another process (a fresh aggregator) flushes what was recorded and committed
+        self.assertEqual(ClickAggregator().flush(), 1)
+        self.assertEqual(self.aggregator.flush(), 0)
+        self.assertEqual((StyledImage.objects.get(pk=image.pk).update_clicks, PendingClick.objects.count()), (1, 0))
+
+    def test_flush_adds_clicks_and_rollups(self):
+        first, second = create_image(), create_image()
+        for image_id in (first.id, first.id, second.id):
+            self.aggregator.record(image_id)
+        self.assertEqual(self.aggregator.pending(first.id), 2)
+
+        self.assertEqual(self.aggregator.flush(), 3)
+        self.aggregator.record(first.id)
+        self.assertEqual(self.aggregator.flush(), 1)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.update_clicks, second.update_clicks), (3, 1))
+        self.assertGreater(first.trending_score, second.trending_score)
+        self.assertEqual(self.aggregator.pending(first.id), 0)
+        rollup = ClickRollup.objects.get(image=first)
+        self.assertEqual((rollup.granularity, rollup.bucket), (ClickRollup.HOUR, hour_bucket(timezone.now())))
+        self.assertEqual(rollup.count, 3)
+
+    def test_admin_reset_clears_scores_rollups_and_pending_clicks(self):
+        image, other = create_image(), create_image()
+        for image_id in (image.id, image.id, other.id):
+            self.aggregator.record(image_id)
+        self.aggregator.flush()
+        self.aggregator.record(image.id)
+
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        with mock.patch('styler.clicks.click_aggregator', self.aggregator):
+            self.client.post(reverse('admin:styler_styledimage_changelist'), {
+                'action': 'reset_clicks', '_selected_action': [image.id],
+            })
+        self.assertEqual(self.aggregator.flush(), 0)
+
+        image.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((image.update_clicks, image.trending_score), (0, 0))
+        self.assertFalse(ClickRollup.objects.filter(image=image).exists())
+        self.assertEqual(other.update_clicks, 1)
+        self.assertGreater(other.trending_score, 0)
+        self.assertTrue(ClickRollup.objects.filter(image=other).exists())
+
+    @override_settings(STYLER_CLICK_FLUSH_MAX_PENDING=2000)
+    def test_flush_of_many_images(self):
+        # More (image, hour) pairs than SQLite allows in one expression tree
+        images = StyledImage.objects.bulk_create([
+            StyledImage(text=f"Image {index}", original_image='uploads/test.jpg') for index in range(1200)
+        ])
+        for image in images:
+            self.aggregator.record(image.id, 2)
+
+        self.assertEqual(self.aggregator.flush(), 2400)
+        self.assertEqual(StyledImage.objects.filter(update_clicks=2).count(), 1200)
+        self.assertEqual(ClickRollup.objects.filter(count=2).count(), 1200)
+
+    @override_settings(STYLER_CLICK_FLUSH_MAX_PENDING=3)
+    def test_flush_is_capped(self):
+        images = [create_image() for _ in range(5)]
+        with mock.patch.object(self.aggregator, '_schedule_flush') as schedule_flush:
+            for image in images:
+                self.aggregator.record(image.id)
+            self.assertEqual(self.aggregator.flush(), 3)
+            schedule_flush.assert_called_once()
+            self.assertEqual(self.aggregator.flush(), 2)
+
+        self.assertEqual(sum(StyledImage.objects.values_list('update_clicks', flat=True)), 5)
+        self.assertEqual(sum(ClickRollup.objects.values_list('count', flat=True)), 5)
+
+
+class CacheInvalidationTests(StylerTestCase):
+
+    def assertBumps(self, names, write):
+        """write() bumps exactly the named response cache generations once it commits"""
+        before = get_generations('image', 'category', 'tag')
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        after = get_generations('image', 'category', 'tag')
+        self.assertEqual({name for name in after if after[name] != before[name]}, set(names))
+
+    def test_every_write_kind(self):
+        category = Category.objects.create(name='Travel')
+        tag = Tag.objects.create(name='beach')
+        image = create_image(category=category)
+        tagged = create_image()
+        tagged.tags.add(tag)
+
+        self.assertBumps({'image'}, lambda: create_image())
+        self.assertBumps({'image'}, lambda: image.save())
+        self.assertBumps({'image', 'tag'}, lambda: image.tags.add(tag))
+        self.assertBumps({'image', 'tag'}, lambda: image.tags.remove(tag))
+        self.assertBumps({'image', 'tag'}, lambda: tagged.tags.clear())
+        self.assertBumps({'image'}, lambda: image.delete())
+        self.assertBumps({'category'}, lambda: category.save())
+        self.assertBumps({'category'}, lambda: category.delete())
+        self.assertBumps({'tag'}, lambda: tag.save())
+        self.assertBumps({'tag'}, lambda: tag.delete())
+
+    def test_generations_are_counted_in_the_database(self):
+        before = get_generations('image', 'tag')
+        bump_generation('image')
+        bump_generation('image', 'tag')
+        after = get_generations('image', 'tag')
+        self.assertEqual((after['image'] - before['image'], after['tag'] - before['tag']), (2, 1))
+
+    def test_missing_generation_is_a_cache_miss(self):
+        tag = Tag.objects.create(name='beach')
+        self.assertEqual(self.client.get('/api/tags/').json()['tags'][0]['name'], 'beach')
+
+        # Neither a write without signals nor a lost counter may serve the cached response
+        Tag.objects.filter(pk=tag.pk).update(name='coast')
+        CacheGeneration.objects.filter(name='tag').delete()
+        self.assertEqual(get_generations('tag'), {'tag': None})
+        self.assertEqual(self.client.get('/api/tags/').json()['tags'][0]['name'], 'coast')
+        self.assertIsNotNone(get_generations('tag')['tag'])
+
+    def test_tag_counts_after_deleting_a_tagged_image(self):
+        tag = Tag.objects.create(name='beach')
+        image = create_image()
+        with self.captureOnCommitCallbacks(execute=True):
+            image.tags.add(tag)
+        self.assertEqual(self.client.get('/api/tags/').json()['tags'][0]['image_count'], 1)
+
+        self.assertBumps({'image', 'tag'}, lambda: image.delete())
+        self.assertEqual(self.client.get('/api/tags/').json()['tags'][0]['image_count'], 0)
+
+    def test_landing_payloads_per_site_and_clicks_of_featured_images(self):
+        category = Category.objects.create(name='Travel', show_in_landing=True)
+        featured = create_image(category=category)
+        hidden = create_image()
+
+        def featured_clicks(host):
+            response = self.client.get('/api/categories/landing/', HTTP_HOST=host)
+            image = response.json()['landing_categories'][0]['featured_images'][0]
+            return image['update_clicks'], image['output_image_url']
+
+        for host in ('one.example', 'two.example'):
+            featured_clicks(host)
+        # Each site reads its own cached payload, without a query
+        with self.assertNumQueries(0):
+            self.assertEqual(featured_clicks('two.example'), (0, None))
+
+        # Clicks of an image the page does not show leave the payloads cached
+        click_aggregator.record(hidden.id)
+        click_aggregator.flush()
+        with self.assertNumQueries(0):
+            featured_clicks('one.example')
+
+        click_aggregator.record(featured.id)
+        click_aggregator.flush()
+        self.assertEqual([featured_clicks(host)[0] for host in ('one.example', 'two.example')], [1, 1])
+
+
+class LandingTests(StylerTestCase):
+
+    def landing(self):
+        return self.client.get('/api/categories/landing/').json()['landing_categories']
+
+    def test_newest_four_images_of_each_landing_category(self):
+        now = timezone.now()
+        expected = {}
+        for name in ('Travel', 'Food'):
+            category = Category.objects.create(name=name, show_in_landing=True)
+            images = [create_image(category=category) for _ in range(6)]
+            for age, image in enumerate(images):
+                StyledImage.objects.filter(pk=image.pk).update(created_at=now - timedelta(hours=age))
+            expected[name] = [image.id for image in images[:4]]
+        create_image(category=Category.objects.create(name='Hidden'))
+        Category.objects.create(name='Empty', show_in_landing=True)
+
+        # Categories and one windowed query for all featured images, whatever their number
+        with self.assertNumQueries(2):
+            categories = self.landing()
+        self.assertEqual(
+            {category['name']: [image['id'] for image in category['featured_images']] for category in categories},
+            {**expected, 'Empty': []},
+        )
+        self.assertEqual({category['name']: category['total_images'] for category in categories},
+                         {'Travel': 6, 'Food': 6, 'Empty': 0})
+
+    def test_category_and_image_writes_rebuild_the_payload(self):
+        category = Category.objects.create(name='Travel', show_in_landing=True)
+        self.assertEqual(self.landing()[0]['featured_images'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image = create_image(category=category)
+        self.assertEqual([image['id'] for image in self.landing()[0]['featured_images']], [image.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category.show_in_landing = False
+            category.save()
+        self.assertEqual(self.landing(), [])
+
+
+class StatsSnapshotTests(StylerTestCase):
+
+    def stats(self):
+        return self.client.get('/api/images/stats/').json()
+
+    def test_endpoints_read_one_snapshot(self):
+        for clicks in (0, 2, 4):
+            create_image(update_clicks=clicks)
+
+        with self.assertNumQueries(2):
+            data = self.stats()
+        self.assertEqual(data['stats'], {
+            'total_images': 3, 'images_with_clicks': 2, 'total_clicks': 6, 'average_clicks_per_image': 2,
+        })
+        self.assertEqual([image['update_clicks'] for image in data['top_updated_images']], [4, 2, 0])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.stats()['snapshot_at'], data['snapshot_at'])
+        # Only the ranking itself is queried, the totals come from the snapshot
+        with self.assertNumQueries(1):
+            stats = self.client.get('/api/most-updated/').json()['stats']
+        self.assertEqual((stats['total_images_in_database'], stats['total_update_clicks']), (3, 6))
+
+    def test_writes_and_click_flushes_drop_the_snapshot(self):
+        image = create_image()
+        self.assertEqual(self.stats()['stats']['total_images'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_image()
+        self.assertEqual(self.stats()['stats']['total_images'], 2)
+
+        click_aggregator.record(image.id)
+        click_aggregator.flush()
+        self.assertEqual(self.stats()['stats']['total_clicks'], 1)
+
+
+class StyleSpecTests(SimpleTestCase):
+
+    def test_only_the_background_color_has_an_alpha(self):
+        self.assertEqual(StyleSpec(text_background='#FFFFFF80').background_rgba, (255, 255, 255, 128))
+        self.assertEqual(StyleSpec(font_color='00ff00').font_color, '#00ff00')
+        # font_color and shadow_color are stored in 7 characters
+        for name in ('font_color', 'shadow_color'):
+            with self.assertRaises(ValueError):
+                StyleSpec(**{name: '#FFFFFF80'})
+
+    def test_choices_and_finite_numbers_are_enforced(self):
+        self.assertEqual(StyleSpec(font_weight=700, text_alignment='left').font_weight, '700')
+        for values in (
+            {'text_alignment': 'justify'},
+            {'font_weight': 'bold'},
+            {'font_weight': '650'},
+            {'line_height': 'nan'},
+            {'letter_spacing': float('inf')},
+        ):
+            with self.subTest(values), self.assertRaises(ValueError):
+                StyleSpec(**values)
+
+
+def render_directly(image, text, style):
+    """Reference render without sprites: every piece drawn into a full-size layer, as before the cache"""
+    font = load_font(resolve_font_path(style.font_family, style.font_weight), style.font_size)
+    layer = Image.new('RGBA', image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    bbox = draw.textbbox((0, 0), text, font=font)
+    text_width = bbox[2] - bbox[0] + (style.letter_spacing * (len(text) - 1) if len(text) > 1 else 0)
+    final_x = style.x_position - {'center': text_width // 2, 'right': text_width}.get(style.text_alignment, 0)
+    y = style.y_position
+    background_height = int(style.font_size * style.line_height)
+
+    if style.enable_background:
+        draw.rectangle(
+            [final_x - 5, y - 5, final_x + text_width + 5, y + background_height + 5], fill=style.background_rgba
+        )
+
+    def draw_text(x, y, fill):
+        for offset, chunk in glyph_runs(text, font, style.letter_spacing):
+            draw.text((x + offset, y), chunk, fill=fill, font=font)
+
+    if style.enable_shadow:
+        draw_text(final_x + style.shadow_x, y + style.shadow_y, style.shadow_color_rgba)
+    draw_text(final_x, y, style.font_color_rgba)
+    if style.text_rotate:
+        layer = layer.rotate(
+            style.text_rotate, center=(final_x + text_width // 2, y + background_height // 2), resample=Image.BICUBIC
+        )
+    return Image.alpha_composite(image.convert('RGBA'), layer).convert('RGB')
+
+
+class TextSpriteTests(StylerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        sprite_cache.clear()
+
+    def test_cached_sprites_render_like_direct_drawing(self):
+        source = Image.new('RGB', (400, 240), (40, 90, 160))
+        styles = [
+            StyleSpec(font_family='Roboto', font_size=40, x_position=200, y_position=80),
+            # Position and color edits of the same caption reuse its sprite
+            StyleSpec(font_family='Roboto', font_size=40, x_position=120, y_position=150, font_color='#FFCC00',
+                      text_opacity=60, text_alignment='left'),
+            StyleSpec(font_family='Roboto', font_size=32, x_position=380, y_position=40, text_alignment='right',
+                      enable_shadow=True, shadow_x=3, shadow_y=-2, shadow_color='#000000',
+                      enable_background=True, text_background='#FFFFFF80', letter_spacing=4),
+            StyleSpec(font_family='Roboto', font_size=36, x_position=200, y_position=100, text_rotate=30,
+                      enable_shadow=True),
+            StyleSpec(font_family='Roboto', font_size=36, x_position=150, y_position=120, text_rotate=-75,
+                      enable_shadow=True, font_color='#00FF00'),
+        ]
+        hits = sprite_cache.stats()['hits']
+        with mock.patch('builtins.print'):
+            for style in styles:
+                with self.subTest(style=style):
+                    rendered = render_text_image(source, 'Sprite Ag', style)
+                    self.assertEqual(rendered.tobytes(), render_directly(source, 'Sprite Ag', style).tobytes())
+        self.assertEqual(sprite_cache.stats()['hits'] - hits, 2)
+
+    @override_settings(STYLER_TEXT_SPRITE_CACHE_BYTES=100)
+    def test_least_recently_used_sprites_are_evicted_at_the_byte_limit(self):
+        cache = SpriteCache()
+
+        def sprite(nbytes):
+            return lambda: mock.Mock(nbytes=nbytes)
+
+        first = cache.get('first', sprite(40))
+        cache.get('second', sprite(40))
+        self.assertIs(cache.get('first', sprite(40)), first)
+        cache.get('third', sprite(40))
+
+        self.assertEqual(list(cache.sprites), ['first', 'third'])
+        self.assertEqual(cache.stats()['bytes'], 80)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        # A sprite over the whole budget is returned without being cached
+        cache.get('huge', sprite(101))
+        self.assertEqual(list(cache.sprites), ['first', 'third'])
+
+
+class AdminChangelistTests(StylerTestCase):
+    url = '/admin/styler/styledimage/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def create_images(self, count):
+        category = Category.objects.create(name=f'Category {Category.objects.count()}')
+        tags = [Tag.objects.create(name=f'tag-{Tag.objects.count()}-{i}') for i in range(2)]
+        for i in range(count):
+            image = create_image(category=category, font_size=20 + 10 * i, update_clicks=i)
+            image.tags.set(tags)
+
+    def changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.context['cl']
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        self.create_images(2)
+        small, _ = self.changelist_queries()
+        self.create_images(30)
+        large, changelist = self.changelist_queries()
+        self.assertEqual(len(changelist.result_list), changelist.list_per_page)
+        self.assertEqual(large, small)
+
+    def test_range_filters(self):
+        self.create_images(10)  # font sizes 20-110, clicks 0-9
+        self.assertEqual(self.changelist_queries(font_size_range='medium')[1].result_count, 2)
+        self.assertEqual(self.changelist_queries(font_size_range='huge')[1].result_count, 2)
+        self.assertEqual(self.changelist_queries(update_clicks_range='none')[1].result_count, 1)
+        self.assertEqual(self.changelist_queries(update_clicks_range='medium')[1].result_count, 5)
+
+    @override_settings(STYLER_ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_large_unfiltered_changelists_use_the_estimated_count(self):
+        self.create_images(3)
+        with mock.patch('styler.admin.estimate_row_count', return_value=5000):
+            self.assertEqual(self.changelist_queries()[1].result_count, 5000)
+            # Filtered pages are counted exactly
+            self.assertEqual(self.changelist_queries(update_clicks_range='low')[1].result_count, 2)
+        with mock.patch('styler.admin.estimate_row_count', return_value=10):
+            self.assertEqual(self.changelist_queries()[1].result_count, 3)
+
+
+class TagAssignmentTests(StylerTestCase):
+
+    def assign_queries(self, image, names):
+        with CaptureQueriesContext(connection) as queries:
+            assign_tags(image, names)
+        return len(queries)
+
+    def test_names_are_normalized(self):
+        self.assertEqual(parse_tag_names(' Beach, city,,BEACH , '), ['beach', 'city'])
+        self.assertEqual(parse_tag_names(['Food', 1]), ['food', '1'])
+        self.assertEqual(parse_tag_names(None), [])
+
+    def test_query_count_does_not_grow_with_the_tags(self):
+        new_few = self.assign_queries(create_image(), [f'few-{i}' for i in range(2)])
+        new_many = self.assign_queries(create_image(), [f'many-{i}' for i in range(30)])
+        self.assertEqual(new_many, new_few)
+
+        existing_few = self.assign_queries(create_image(), [f'few-{i}' for i in range(2)])
+        existing_many = self.assign_queries(create_image(), [f'many-{i}' for i in range(30)])
+        self.assertEqual(existing_many, existing_few)
+        self.assertEqual(Tag.objects.count(), 32)
+
+    def test_only_changed_links_are_written(self):
+        image = create_image()
+        assign_tags(image, 'beach, city')
+        kept_link = StyledImage.tags.through.objects.get(styledimage=image, tag__name='beach').pk
+
+        tags = assign_tags(image, 'Beach, food')
+        self.assertEqual([tag.name for tag in tags], ['beach', 'food'])
+        self.assertEqual(StyledImage.tags.through.objects.get(styledimage=image, tag__name='beach').pk, kept_link)
+        self.assertEqual(dict(Tag.objects.values_list('name', 'image_count')), {'beach': 1, 'city': 0, 'food': 1})
+
+        assign_tags(image, '')
+        self.assertFalse(image.tags.exists())
+
+
+class UpdateTextTests(StylerTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        blob, output_name = create_sources(1)[0]
+        cls.fields = {'blob': blob, 'original_image': blob.file.name, 'output_image': output_name}
+
+    def update(self, url, **data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_invalid_stored_style_is_reset(self):
+        for url in ('/api/update-text/', '/api/update-text-json/'):
+            image = create_image(font_color='white', shadow_color='#123456', **self.fields)
+
+            self.assertEqual(self.update(url, id=image.id, text='Fixed').status_code, 200)
+            image.refresh_from_db()
+            self.assertEqual((image.font_color, image.shadow_color), ('#FFFFFF', '#123456'))
+
+            StyledImage.objects.filter(pk=image.pk).update(font_color='white')
+            self.assertEqual(self.update(url, id=image.id, text='Fixed', font_color='#00FF00').status_code, 200)
+            image.refresh_from_db()
+            self.assertEqual(image.font_color, '#00FF00')
+
+    def test_metadata_only_updates_skip_the_render(self):
+        image = create_image(text='Same text', **self.fields)
+        image.output_signature = image.get_render_signature('Same text', image.get_style_spec())
+        image.save(update_fields=['output_signature'])
+        with mock.patch('styler.views.add_text_to_image') as add_text, \
+                mock.patch('styler.views.render_text_image') as render:
+            data = self.update('/api/update-text-json/', id=image.id, text='Same text',
+                               image_name='Renamed', tags='news').json()
+            response = self.update('/api/update-text/', id=image.id, text='Same text')
+            response.close()
+        add_text.assert_not_called()
+        render.assert_not_called()
+        self.assertFalse(data['regenerated'])
+        self.assertEqual(response.status_code, 200)
+        image.refresh_from_db()
+        self.assertEqual((image.image_name, image.output_image.name), ('Renamed', self.fields['output_image']))
+
+        data = self.update('/api/update-text-json/', id=image.id, text='Same text', font_size=60).json()
+        self.assertTrue(data['regenerated'])
+        image.refresh_from_db()
+        self.assertNotEqual(image.output_image.name, self.fields['output_image'])
+
+    def test_output_not_yet_published_is_not_served(self):
+        image = create_image(**self.fields)
+        with mock.patch('styler.views.render_text_image', wraps=render_text_image) as render:
+            # The first render is published on commit, which never comes here
+            self.update('/api/update-text/', id=image.id, text='New text').close()
+            self.update('/api/update-text/', id=image.id, text='New text').close()
+            self.assertEqual(render.call_count, 2)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.update('/api/update-text/', id=image.id, text='New text').close()
+            self.update('/api/update-text/', id=image.id, text='New text').close()
+            self.assertEqual(render.call_count, 3)
+
+        image.refresh_from_db()
+        self.assertNotEqual(image.output_image.name, self.fields['output_image'])
+        self.assertTrue(image.has_current_output('New text', image.get_style_spec()))
+        self.assertFalse(self.update('/api/update-text-json/', id=image.id, text='New text').json()['regenerated'])
+
+    def test_updates_touch_last_updated(self):
+        image = create_image(**self.fields)
+        StyledImage.objects.filter(pk=image.pk).update(last_updated=timezone.now() - timedelta(days=1))
+        for url in ('/api/update-text/', '/api/update-text-json/'):
+            before = StyledImage.objects.get(pk=image.pk).last_updated
+            self.update(url, id=image.id, text=image.text).close()
+            self.assertGreater(StyledImage.objects.get(pk=image.pk).last_updated, before)
+
+    def test_legacy_styles_are_normalized_by_migration(self):
+        migration = importlib.import_module('styler.migrations.0023_normalize_stored_styles')
+        legacy = create_image(font_color='white', shadow_color='123456', line_height=1.5, **self.fields)
+        valid = create_image(font_color='#00FF00', **self.fields)
+        preset = StylePreset.objects.create(name='Legacy', font_weight='bold')
+
+        migration.normalize_stored_styles(django_apps, None)
+        legacy.refresh_from_db()
+        valid.refresh_from_db()
+        preset.refresh_from_db()
+        self.assertEqual(
+            (legacy.font_color, legacy.shadow_color, legacy.line_height, valid.font_color, preset.font_weight),
+            ('#FFFFFF', '#123456', 1.5, '#00FF00', '600')
+        )
+
+    def test_admin_rejects_styles_that_cannot_render(self):
+        data = model_to_dict(StylePreset(name='Admin preset'))
+        self.assertTrue(StylePresetAdminForm(data=data).is_valid())
+        data['font_color'] = 'white'
+        form = StylePresetAdminForm(data=data)
+        self.assertFalse(form.is_valid())
+        self.assertIn('font_color', form.non_field_errors()[0])
+
+    def test_invalid_request_style_is_rejected(self):
+        image = create_image(**self.fields)
+        response = self.update('/api/update-text-json/', id=image.id, text='Broken', font_color='white')
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkUploadTests(StylerTestCase):
+
+    def zip_upload(self, count):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for index in range(count):
+                archive.writestr(f"image_{index}.jpg", sample_upload().read())
+            archive.writestr('.DS_Store', b'')
+        return SimpleUploadedFile('images.zip', buffer.getvalue(), content_type='application/zip')
+
+    def test_archive_members_become_images(self):
+        response = self.client.post('/api/upload-style/bulk/', {
+            'files': [self.zip_upload(2), sample_upload('single.jpg')], 'text': 'Bulk', 'tags': 'bulk',
+        })
+
+        data = response.json()
+        self.assertEqual((data['total'], data['created']), (3, 3))
+        self.assertEqual(
+            [result['name'] for result in data['results']],
+            ['images.zip/image_0.jpg', 'images.zip/image_1.jpg', 'single.jpg'],
+        )
+        self.assertEqual(Tag.objects.get(name='bulk').image_count, 3)
+        self.assertEqual(ImageBlob.objects.get().ref_count, 3)
+
+    @override_settings(STYLER_BULK_UPLOAD_MAX_FILES=2)
+    def test_files_past_the_limit_are_not_read(self):
+        response = self.client.post('/api/upload-style/bulk/', {'files': [self.zip_upload(50)], 'text': 'Bulk'})
+
+        data = response.json()
+        self.assertEqual((data['total'], data['created'], data['failed']), (3, 2, 1))
+        self.assertIn("Only 2 images are accepted", data['results'][-1]['error'])
+        self.assertEqual(StyledImage.objects.count(), 2)
+
+
+class ExportTests(StylerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Export')
+        for index, (blob, output_name) in enumerate(create_sources(3)):
+            create_image(
+                text=f'Export {index}', category=self.category, blob=blob,
+                original_image=blob.file.name, output_image=output_name,
+            )
+        self.url = f'/api/categories/{self.category.id}/export/'
+
+    def download(self, **headers):
+        response = self.client.get(self.url, **headers)
+        return response, b''.join(response.streaming_content)
+
+    def assertArchiveMatchesOutputs(self, body):
+        with zipfile.ZipFile(BytesIO(body)) as archive:
+            self.assertIsNone(archive.testzip())
+            contents = {name.split('_', 1)[0]: archive.read(name) for name in archive.namelist()}
+        expected = {}
+        for image in StyledImage.objects.filter(category=self.category):
+            with default_storage.open(image.output_image.name) as f:
+                expected[str(image.id)] = f.read()
+        self.assertEqual(contents, expected)
+
+    def test_archive_opens_with_zipfile(self):
+        response, body = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertArchiveMatchesOutputs(body)
+
+    def test_archive_forced_to_zip64_still_opens(self):
+        with mock.patch('styler.export.ZIP64_COUNT_LIMIT', 2), mock.patch('styler.export.ZIP64_LIMIT', 1):
+            _, body = self.download()
+        self.assertIn(b'PK\x06\x06', body)
+        self.assertArchiveMatchesOutputs(body)
+
+    def test_range_request_resumes_the_download(self):
+        response, full = self.download()
+        etag = response['ETag']
+        split = len(full) // 2 + 7
+
+        response, partial = self.download(HTTP_RANGE=f'bytes={split}-', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes {split}-{len(full) - 1}/{len(full)}')
+        self.assertEqual(full[:split] + partial, full)
+
+        response, middle = self.download(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(middle, full[100:200])
+
+    def test_stale_if_range_sends_the_whole_archive(self):
+        _, full = self.download()
+        response, body = self.download(HTTP_RANGE='bytes=100-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, full)
+
+    def test_unsatisfiable_range_is_rejected(self):
+        _, full = self.download()
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(full)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(full)}')
+
+
+class PresetApplyTests(StylerTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        blob, output_name = create_sources(1)[0]
+        cls.summer, cls.winter = Category.objects.create(name='Summer'), Category.objects.create(name='Winter')
+        cls.images = {
+            key: create_image(text=text, category=category, blob=blob,
+                              original_image=blob.file.name, output_image=output_name)
+            for key, text, category in (
+                ('summer_sale', 'Summer sale', cls.summer),
+                ('summer_coffee', 'Coffee', cls.summer),
+                ('winter_sale', 'Winter sale', cls.winter),
+            )
+        }
+        cls.preset = StylePreset.objects.create(name='Shadow', enable_shadow=True)
+
+    def apply(self, **selection):
+        response = self.client.post(
+            '/api/presets/apply/', json.dumps({'preset_id': self.preset.id, **selection}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return sorted(image['id'] for image in response.json()['images'] if image['success'])
+
+    def test_category_narrows_a_search(self):
+        restyled = self.apply(q='sale', category_id=self.summer.id)
+
+        self.assertEqual(restyled, [self.images['summer_sale'].id])
+        self.assertEqual(
+            list(StyledImage.objects.filter(enable_shadow=True).values_list('id', flat=True)), restyled
+        )
+
+    def test_whole_category(self):
+        restyled = self.apply(category_id=self.summer.id)
+
+        self.assertEqual(restyled, sorted([self.images['summer_sale'].id, self.images['summer_coffee'].id]))
+
+
+class RerenderCommandTests(StylerTestCase):
+
+    def rerender(self, **options):
+        checkpoint = os.path.join(self.media_root, 'checkpoint.json')
+        out = StringIO()
+        thread_pool = lambda max_workers, **kwargs: ThreadPoolExecutor(max_workers)
+        with mock.patch('styler.management.commands.rerender.ProcessPoolExecutor', thread_pool):
+            call_command('rerender', checkpoint=checkpoint, stdout=out, stderr=StringIO(), **options)
+        self.assertFalse(os.path.exists(checkpoint))
+        return out.getvalue()
+
+    def test_nothing_to_rerender(self):
+        self.assertIn("Nothing to re-render.", self.rerender(category='999'))
+
+    def test_legacy_styles_are_rendered_with_defaults(self):
+        blob, output_name = create_sources(1)[0]
+        fields = {'blob': blob, 'original_image': blob.file.name, 'output_image': output_name}
+        images = [create_image(**fields), create_image(font_color='red', text_alignment='justify', **fields)]
+
+        with mock.patch('styler.management.commands.rerender.Command.report', autospec=True) as report:
+            self.rerender()
+        _, processed, render_times, _, checkpoint = report.call_args.args
+        self.assertEqual((processed, len(render_times)), (2, 2))
+        self.assertEqual((checkpoint['rendered'], checkpoint['failed']), (2, 0))
+        for image in images:
+            image.refresh_from_db()
+            self.assertNotEqual(image.output_image.name, output_name)
+
+
+class GcOutputsTests(StylerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(os.path.join(self.media_root, 'outputs'), ignore_errors=True)
+        # Three versions of two sources, a day apart, oldest first
+        self.versions = {}
+        for stem in ('beach', 'city'):
+            for age in (3, 2, 1):
+                name = default_storage.save(f"outputs/{stem}_styled_{1000 - age}_0000.jpg", ContentFile(b'jpeg'))
+                mtime = time.time() - age * 86400
+                os.utime(default_storage.path(name), (mtime, mtime))
+                self.versions.setdefault(stem, []).append(name)
+
+    def gc_outputs(self, **options):
+        out = StringIO()
+        call_command('gc_outputs', stdout=out, **options)
+        return out.getvalue()
+
+    def remaining(self):
+        return sorted(name for names in self.versions.values() for name in names if default_storage.exists(name))
+
+    def test_keeps_the_newest_versions_of_each_source(self):
+        self.assertIn("Deleted 2 of 6 output files", self.gc_outputs(keep=2))
+        self.assertEqual(self.remaining(), sorted(self.versions['beach'][1:] + self.versions['city'][1:]))
+
+    def test_referenced_and_recent_files_are_kept(self):
+        create_image(output_image=self.versions['beach'][0])
+        recent = self.versions['city'][0]
+        os.utime(default_storage.path(recent), None)
+
+        self.gc_outputs(keep=0)
+        self.assertEqual(self.remaining(), [self.versions['beach'][0], recent])
+
+    def test_dry_run_deletes_nothing(self):
+        output = self.gc_outputs(keep=1, dry_run=True)
+        self.assertIn("Would delete 4 of 6 output files", output)
+        for name in self.versions['beach'][:2] + self.versions['city'][:2]:
+            self.assertIn(f"would delete {name}", output)
+        self.assertEqual(len(self.remaining()), 6)
+
+
+class RenderJobTests(StylerTestCase):
+
+    def test_job_thread_starts_after_commit(self):
+        with mock.patch('styler.rendering.threading.Thread') as thread:
+            with self.captureOnCommitCallbacks() as callbacks:
+                job = rendering.start_render_job([1, 2])
+            thread.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+        thread.assert_called_once_with(target=rendering.run_render_job, args=(job.id, [1, 2]), daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+    def test_stale_jobs_are_marked_failed(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        lost = RenderJob.objects.create(status=RenderJob.RUNNING, total=10, heartbeat_at=long_ago)
+        never_started = RenderJob.objects.create(total=10)
+        RenderJob.objects.filter(pk=never_started.pk).update(created_at=long_ago)
+        running = RenderJob.objects.create(status=RenderJob.RUNNING, total=10, heartbeat_at=timezone.now())
+        done = RenderJob.objects.create(status=RenderJob.DONE, total=10, heartbeat_at=long_ago)
+
+        out = StringIO()
+        call_command('fail_stale_render_jobs', stdout=out)
+        self.assertIn("Marked 2 render jobs", out.getvalue())
+        statuses = dict(RenderJob.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            [statuses[job.pk] for job in (lost, never_started, running, done)],
+            [RenderJob.FAILED, RenderJob.FAILED, RenderJob.RUNNING, RenderJob.DONE],
+        )
+        lost.refresh_from_db()
+        self.assertIn("Stopped making progress", lost.errors)
+        self.assertIsNotNone(lost.finished_at)
+
+    def test_heartbeat_per_image_and_a_failed_job_stays_failed(self):
+        blob, output_name = create_sources(1)[0]
+        image_ids = [
+            create_image(blob=blob, original_image=blob.file.name, output_image=output_name).id for _ in range(3)
+        ]
+        job = RenderJob.objects.create(total=3)
+        heartbeats = []
+
+        def render_batch(batch, on_result=None):
+            def beat(result):
+                on_result(result)
+                heartbeats.append(RenderJob.objects.get(pk=job.pk).heartbeat_at)
+            results = original_render_batch(batch, on_result=beat)
+            # The stale job sweep ran meanwhile
+            RenderJob.objects.filter(pk=job.pk).update(status=RenderJob.FAILED)
+            return results
+
+        original_render_batch = rendering.render_batch
+        # The job runs on the test's connection, which must stay open
+        with mock.patch('styler.rendering.render_batch', render_batch), \
+                mock.patch('styler.rendering.close_old_connections'), mock.patch('styler.rendering.connections'):
+            rendering.run_render_job(job.id, image_ids)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.completed, len(heartbeats)), (RenderJob.FAILED, 3, 3))
+        self.assertIsNone(job.finished_at)
+
+
+class SeedImagesTests(StylerTestCase):
+
+    def test_counters_match_the_seeded_rows(self):
+        self.assertEqual(seed_images(30, categories=3, tags=10, sources=2, batch_size=12), 30)
+
+        self.assertEqual(StyledImage.objects.count(), 30)
+        for category in Category.objects.all():
+            self.assertEqual(category.image_count, category.styled_images.count())
+        for tag in Tag.objects.all():
+            self.assertEqual(tag.image_count, tag.styled_images.count())
+        for blob in ImageBlob.objects.all():
+            self.assertEqual(blob.ref_count, StyledImage.objects.filter(blob=blob).count())
+
+
+class RendererBenchmarkTests(StylerTestCase):
+
+    def test_cases_cover_sizes_with_one_font_and_every_font_once(self):
+        cases = build_cases([4, 1], [('Lato', '400'), ('Roboto', '600')], ['short'], ['plain', 'all'])
+        self.assertEqual([case['name'] for case in cases], [
+            '4mp/Roboto_600/short/plain', '4mp/Roboto_600/short/all',
+            '1mp/Roboto_600/short/plain', '1mp/Roboto_600/short/all',
+            '1mp/Lato_400/short/plain', '1mp/Lato_400/short/all',
+        ])
+        self.assertEqual(build_cases([1], [], ['short'], ['plain']), [])
+
+    def test_regressions_beyond_the_thresholds_and_floors(self):
+        def results(**cases):
+            return {'cases': {
+                name: {'seconds': seconds, 'stages': {'layout': seconds, 'encode': 0}, 'peak_memory_bytes': memory}
+                for name, (seconds, memory) in cases.items()
+            }}
+
+        baseline = results(slower=(0.1, 2**24), tiny=(0.001, 2**24), hungrier=(0.1, 2**24), same=(0.1, 2**24))
+        regressions = compare_results(
+            results(slower=(0.2, 2**24), tiny=(0.0025, 2**24), hungrier=(0.1, 2**25), same=(0.105, 2**24), new=(1, 1)),
+            baseline, threshold=0.15, memory_threshold=0.10,
+        )
+        self.assertEqual([name for name, _ in regressions], ['slower', 'hungrier'])
+        self.assertIn('mostly layout', regressions[0][1])
+
+    @override_settings(STORAGES={
+        **settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    })
+    def test_spawned_workers_read_the_sources(self):
+        # The worker process has its own settings and storage; the sources reach it as local files
+        results = run_benchmark(build_cases([0.05], [('Roboto', '600')], ['short'], ['all']), repeat=1)
+        result = results['cases']['0.05mp/Roboto_600/short/all']
+        self.assertEqual((result['width'], result['height']), image_dimensions(0.05))
+        self.assertGreater(result['seconds'], 0)
+        self.assertIn('layout', result['stages'])
+
+    def test_command_saves_and_compares_a_baseline(self):
+        baseline = os.path.join(self.media_root, 'baseline.json')
+        options = {
+            'sizes': '0.05', 'fonts': 'Roboto_600', 'texts': 'short', 'profiles': 'plain,rotation', 'repeat': 1,
+            'baseline': baseline, 'threshold': 100, 'memory_threshold': 100,
+        }
+        thread_pool = lambda max_workers, **kwargs: ThreadPoolExecutor(max_workers)
+        with mock.patch('styler.benchmark.ProcessPoolExecutor', thread_pool):
+            call_command('benchmark_renderer', save_baseline=True, stdout=StringIO(), **options)
+            with open(baseline) as f:
+                self.assertEqual(len(json.load(f)['cases']), 2)
+
+            out = StringIO()
+            call_command('benchmark_renderer', stdout=out, **options)
+        self.assertIn("No regressions in 2 cases", out.getvalue())
+        self.assertFalse(os.listdir(os.path.join(self.media_root, 'outputs')))
+
+
+class ApiBenchmarkTests(StylerTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_images(40, categories=3, tags=10, sources=2)
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def run_endpoints(self, **kwargs):
+        self.client.force_login(self.admin)
+        return run_api_benchmark(self.client, build_endpoints(pick_target(), **kwargs), repeat=2)
+
+    def test_every_endpoint_within_its_query_budget(self):
+        # Runs the click flushes the updates queue, so none is left for the exit hook
+        with self.captureOnCommitCallbacks(execute=True):
+            report = self.run_endpoints(writes=True, admin=True)
+        self.assertEqual(check_report(report), [])
+
+    def test_read_queries_do_not_grow_with_the_data(self):
+        before = self.run_endpoints(writes=False, admin=True)
+        seed_images(60, categories=3, tags=10, sources=2, random_seed=1)
+        after = self.run_endpoints(writes=False, admin=True)
+
+        self.assertEqual(
+            {name: result['queries'] for name, result in after['endpoints'].items()},
+            {name: result['queries'] for name, result in before['endpoints'].items()},
+        )
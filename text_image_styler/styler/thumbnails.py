@@ -0,0 +1,107 @@
+"""
+Downscaled WebP variants of originals and styled outputs.
+
+Variants live next to each other under thumbnails/ in the media storage and are named
+after their source file, so a regenerated output (which gets a new file name)
+never shows a stale thumbnail.
+
+Listings derive variant URLs from names alone, without asking the storage, but
+only for files flagged as having them: ImageBlob.has_thumbnails is set once
+ingest generated the original's variants and StyledImage.output_has_thumbnails
+when a rendered output was saved with its variants. build_thumbnails fills in
+and flags everything else. The width of the source, which a variant never
+exceeds, comes from the image's blob.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from .media import write_file
+
+THUMBNAIL_DIR = 'thumbnails'
+
+
+def get_thumbnail_widths():
+    """Variant widths in pixels, smallest first"""
+    return sorted(getattr(settings, 'STYLER_THUMBNAIL_WIDTHS', (64, 320, 1024)))
+
+
+def thumbnail_name(source_name, width):
+    """Media-relative name of the width variant of source_name"""
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(THUMBNAIL_DIR, directory, f"{stem}_{width}w.webp")
+
+
+def generate_thumbnails(source_name, image=None):
+    """
+    Write every variant of source_name. Pass the decoded image when it is
+    already in memory (e.g. right after rendering) to skip decoding the file.
+    """
+    quality = getattr(settings, 'STYLER_THUMBNAIL_QUALITY', 80)
+    if image is None:
+        with default_storage.open(source_name, 'rb') as f:
+            image = Image.open(f)
+            # Let the JPEG decoder downscale while decoding
+            largest = max(get_thumbnail_widths())
+            image.draft('RGB', (largest, max(1, round(image.height * largest / image.width))))
+            image = image.convert('RGB')
+    else:
+        image = image.convert('RGB')
+    # Largest first, so every smaller variant is resized from the previous one
+    for width in reversed(get_thumbnail_widths()):
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+
+        buffer = BytesIO()
+        image.save(buffer, 'WEBP', quality=quality)
+        write_file(thumbnail_name(source_name, width), buffer.getvalue(), overwrite=True)
+
+
+def delete_thumbnails(source_name):
+    """Remove every variant of source_name"""
+    for width in get_thumbnail_widths():
+        default_storage.delete(thumbnail_name(source_name, width))
+
+
+def has_thumbnails(source_name):
+    """Whether every variant of source_name is stored (one storage check per width)"""
+    return all(default_storage.exists(thumbnail_name(source_name, width)) for width in get_thumbnail_widths())
+
+
+def get_thumbnail_urls(image_field, source_width):
+    """
+    {width: url} of the variants of an ImageField value whose file is
+    source_width pixels wide (None when unknown, which gives no variants)
+    """
+    if not image_field or not source_width:
+        return {}
+
+    urls = {}
+    for width in get_thumbnail_widths():
+        # Variants wider than the source are stored at the source's width
+        real_width = min(width, source_width)
+        if real_width not in urls:
+            urls[real_width] = default_storage.url(thumbnail_name(image_field.name, width))
+    return urls
+
+
+def get_srcset(thumbnail_urls):
+    """HTML srcset string for a {width: url} mapping"""
+    return ', '.join(f"{url} {width}w" for width, url in sorted(thumbnail_urls.items()))
+
+
+def get_thumbnail_url(image_field, width, source_width):
+    """URL of the smallest variant at least width wide, falling back to the full image"""
+    urls = get_thumbnail_urls(image_field, source_width)
+    for variant_width, url in sorted(urls.items()):
+        if variant_width >= width:
+            return url
+    # A source narrower than width: its largest variant is the whole image
+    if urls:
+        return urls[max(urls)]
+    return image_field.url if image_field else None
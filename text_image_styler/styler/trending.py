@@ -0,0 +1,80 @@
+"""
+Time-decayed trending scores.
+
+Every click adds exp(rate * (click_time - epoch)) to StyledImage.trending_score.
+Because all scores share the same epoch their order never changes as time
+passes, so the trending list is an indexed ORDER BY trending_score read.
+The decayed value at any moment is stored_score * exp(-rate * (now - epoch)).
+
+With a 72 hour half-life the stored values double every three days and stay
+well inside float range for about seven years after the epoch; move
+STYLER_TRENDING_EPOCH forward and run `manage.py refresh_trending_scores`
+long before that. A warning is printed from about a year before the limit,
+and past it weights are clamped: scores stop overflowing, but newer clicks
+no longer outrank older ones until the epoch is moved.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+
+# exp(MAX_EXPONENT) leaves room below the float maximum (about exp(709)) for
+# sums of many clicks; WARN_EXPONENT is about a year earlier at a 72 hour half-life
+MAX_EXPONENT = 600
+WARN_EXPONENT = 520
+
+_epoch_warned = False
+
+
+def get_epoch():
+    """Reference time that all stored scores are scaled to"""
+    epoch = getattr(settings, 'STYLER_TRENDING_EPOCH', '2025-01-01T00:00:00+00:00')
+    return datetime.fromisoformat(epoch).astimezone(dt_timezone.utc)
+
+
+def get_decay_rate():
+    """Decay rate per second derived from the configured half-life"""
+    half_life_hours = getattr(settings, 'STYLER_TRENDING_HALF_LIFE_HOURS', 72)
+    return math.log(2) / (half_life_hours * 3600)
+
+
+def click_weight(moment=None):
+    """Amount one click made at moment adds to the stored score (clamped, see above)"""
+    moment = moment or timezone.now()
+    exponent = get_decay_rate() * (moment - get_epoch()).total_seconds()
+    if exponent > WARN_EXPONENT:
+        warn_epoch_age(exponent)
+    return math.exp(min(exponent, MAX_EXPONENT))
+
+
+def warn_epoch_age(exponent):
+    """Print, once per process, that STYLER_TRENDING_EPOCH needs moving forward"""
+    global _epoch_warned
+    if _epoch_warned:
+        return
+    _epoch_warned = True
+    state = "are clamped" if exponent > MAX_EXPONENT else "will soon be clamped"
+    print(
+        f"⚠ Trending weights {state}: move STYLER_TRENDING_EPOCH close to now "
+        f"and run `manage.py refresh_trending_scores`"
+    )
+
+
+def decayed_score(stored_score, now=None):
+    """Stored score converted to decayed clicks as of now"""
+    return stored_score / click_weight(now)
+
+
+def stored_score_threshold(min_decayed_score, now=None):
+    """Stored score that corresponds to min_decayed_score as of now"""
+    return min_decayed_score * click_weight(now)
+
+
+def activity_score(stored_score, now=None):
+    """
+    Recent clicks per day: a steady rate of r clicks/day settles at a decayed
+    score of r / daily_rate, so multiplying back gives the rate
+    """
+    return decayed_score(stored_score, now) * get_decay_rate() * 86400
@@ -1,223 +1,222 @@
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from PIL import Image, ImageFont
+from io import BytesIO
+import functools
 import os
+import secrets
+import time
 import requests
 from django.conf import settings
+from django.core.files.storage import default_storage
 import math
 
+from .media import write_file
+from .sprites import get_text_sprite
+from .styles import StyleSpec
+from .thumbnails import generate_thumbnails
 
-def add_text_to_image(image_path, text, style_options):
+
+# Font files by (family, weight) and loaded fonts by (file, size), per process
+_font_paths = {}
+
+
+def resolve_font_path(font_family, font_weight):
+    """Font file for a family and weight, looked up once per process when found"""
+    key = (font_family, font_weight)
+    font_path = _font_paths.get(key)
+    if font_path is None:
+        # Get font path with proper weight handling
+        font_path = get_google_font(font_family, font_weight)
+        if not font_path:
+            font_path = get_font_path(font_family, font_weight)
+        if font_path:
+            _font_paths[key] = font_path
+    return font_path
+
+
+@functools.lru_cache(maxsize=64)
+def load_font(font_path, font_size):
+    """FreeType font of font_path at font_size, falling back to Pillow's default font"""
+    try:
+        if font_path and os.path.exists(font_path):
+            font = ImageFont.truetype(font_path, font_size)
+            print(f"✓ Loaded font: {font_path}")
+            return font
+        print("⚠ Using default font")
+    except Exception as e:
+        print(f"✗ Error loading font: {e}")
+    return ImageFont.load_default()
+
+
+def record_stage(timings, stage, started):
+    """Add the seconds since started to timings[stage] when timings is a dict; returns the current time"""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0) + now - started
+    return now
+
+
+def render_text_image(source, text, style, scale=1.0, timings=None):
     """
-    Add advanced styled text to an image and return the path to the modified image
+    Add advanced styled text to an image and return the result as an RGB image
+    source: a path, a file object or an already decoded PIL image
+    style: a StyleSpec (a style options dict is converted)
+    scale: size of source relative to the image the style coordinates refer to
+    timings: optional dict that receives the seconds spent in each stage
     """
     try:
+        started = time.perf_counter()
+
         # Debug: Print what we're processing
         print("=== IMAGE PROCESSING STARTED ===")
-        print(f"Image path: {image_path}")
+        print(f"Source: {source}")
         print(f"Text: {text}")
 
-        # Open the original image
-        original_image = Image.open(image_path).convert('RGBA')
+        # Open the original image (copied, so a decoded source is never modified)
+        if isinstance(source, Image.Image):
+            original_image = source.convert('RGBA')
+        else:
+            original_image = Image.open(source).convert('RGBA')
         width, height = original_image.size
         print(f"Image size: {width}x{height}")
-
-        # Create a transparent layer for text and effects
-        text_layer = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(text_layer)
-
-        # Extract style options with debugging
-        font_size = int(style_options.get('font_size', 48))
-        font_color = style_options.get('font_color', '#FFFFFF')
-        x_position = int(style_options.get('x_position', 250))
-        y_position = int(style_options.get('y_position', 250))
-        font_family = style_options.get('font_family', 'Roboto')
-        text_alignment = style_options.get('text_alignment', 'center')
-        font_weight = style_options.get('font_weight', '600')
-
-        # Advanced options
-        text_rotate = int(style_options.get('text_rotate', 0))
-        text_opacity = int(style_options.get('text_opacity', 100))
-        enable_shadow = style_options.get('enable_shadow') == 'on'
-        shadow_x = int(style_options.get('shadow_x', 2))
-        shadow_y = int(style_options.get('shadow_y', 2))
-        shadow_blur = int(style_options.get('shadow_blur', 4))
-        shadow_color = style_options.get('shadow_color', '#000000')
-        enable_background = style_options.get('enable_background') == 'on'
-        text_background = style_options.get('text_background', '#00000000')
-        letter_spacing = float(style_options.get('letter_spacing', 0))
-        line_height = float(style_options.get('line_height', 1.2))
+        started = record_stage(timings, 'decode', started)
+
+        style = StyleSpec.coerce(style)
+        font_size = style.font_size
+        x_position = style.x_position
+        y_position = style.y_position
+        shadow_x = style.shadow_x
+        shadow_y = style.shadow_y
+        letter_spacing = style.letter_spacing
+        line_height = style.line_height
+        text_rotate = style.text_rotate
+        enable_shadow = style.enable_shadow
+
+        # Coordinates are given for the full-size original, the source may be a downscaled working copy
+        if scale != 1:
+            font_size = max(1, round(font_size * scale))
+            x_position = round(x_position * scale)
+            y_position = round(y_position * scale)
+            shadow_x = round(shadow_x * scale)
+            shadow_y = round(shadow_y * scale)
+            letter_spacing = letter_spacing * scale
+            print(f"Scaled to working copy: {scale:.3f}")
 
         # Debug: Print extracted parameters
         print("=== PARAMETERS EXTRACTED FOR PROCESSING ===")
-        print(f"Font: {font_family} (weight: {font_weight}, size: {font_size})")
-        print(f"Position: ({x_position}, {y_position}), Alignment: {text_alignment}")
-        print(f"Rotation: {text_rotate}°, Opacity: {text_opacity}%")
-        print(f"Shadow: {enable_shadow} (X:{shadow_x}, Y:{shadow_y}, Blur:{shadow_blur}, Color:{shadow_color})")
+        print(f"Font: {style.font_family} (weight: {style.font_weight}, size: {font_size})")
+        print(f"Position: ({x_position}, {y_position}), Alignment: {style.text_alignment}")
+        print(f"Rotation: {text_rotate}°, Opacity: {style.text_opacity}%")
+        print(f"Shadow: {enable_shadow} (X:{shadow_x}, Y:{shadow_y}, Blur:{style.shadow_blur}, Color:{style.shadow_color})")
         print(f"Letter Spacing: {letter_spacing}, Line Height: {line_height}")
-        print(f"Background: {enable_background}, Color: {text_background}")
+        print(f"Background: {style.enable_background}, Color: {style.text_background}")
         print("============================================")
 
-        # Convert HEX color to RGB with alpha
-        def hex_to_rgba(hex_color, opacity=255):
-            hex_color = hex_color.lstrip('#')
-            if len(hex_color) == 8:  # With alpha
-                r = int(hex_color[0:2], 16)
-                g = int(hex_color[2:4], 16)
-                b = int(hex_color[4:6], 16)
-                a = int(hex_color[6:8], 16)
-                # Apply additional opacity
-                a = int(a * (opacity / 255))
-                return (r, g, b, a)
-            elif len(hex_color) == 6:  # Without alpha
-                r = int(hex_color[0:2], 16)
-                g = int(hex_color[2:4], 16)
-                b = int(hex_color[4:6], 16)
-                return (r, g, b, opacity)
-            else:
-                return (255, 255, 255, opacity)
-
-        # Calculate opacity (convert percentage to 0-255)
-        opacity = int(text_opacity * 2.55)
-        font_color_rgba = hex_to_rgba(font_color, opacity)
-        shadow_color_rgba = hex_to_rgba(shadow_color, 200)  # Slightly transparent shadow
-        background_rgba = hex_to_rgba(text_background)
-
-        # Get font path with proper weight handling
-        font_path = get_google_font(font_family, font_weight)
-        if not font_path:
-            font_path = get_font_path(font_family, font_weight)
-
-        # Load font
-        try:
-            if font_path and os.path.exists(font_path):
-                font = ImageFont.truetype(font_path, font_size)
-                print(f"✓ Loaded font: {font_path}")
-            else:
-                font = ImageFont.load_default()
-                print("⚠ Using default font")
-        except Exception as e:
-            print(f"✗ Error loading font: {e}")
-            font = ImageFont.load_default()
-
-        # Calculate text dimensions
-        try:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except AttributeError:
-            # Fallback for older Pillow versions
-            text_width, text_height = draw.textsize(text, font=font)
-
-        # Apply letter spacing to total width calculation
-        if letter_spacing != 0:
-            total_letter_spacing = letter_spacing * (len(text) - 1) if len(text) > 1 else 0
-            text_width += total_letter_spacing
-            print(f"Letter spacing applied: {letter_spacing}px, Total width: {text_width}px")
+        # Background box and shadow are only part of the sprite when they are drawn
+        padding = None
+        if style.enable_background and style.background_rgba[3] > 0:
+            padding = max(1, round(5 * scale))
+        shadow_offset = (shadow_x, shadow_y) if enable_shadow else None
+
+        # Layout and rasterization, cached for edits that keep the text and its geometry
+        font_path = resolve_font_path(style.font_family, style.font_weight)
+        sprite = get_text_sprite(
+            text, font_path, lambda: load_font(font_path, font_size), font_size, letter_spacing,
+            line_height, text_rotate, shadow_offset, padding
+        )
+        text_width = sprite.text_width
+        print(f"Text width: {text_width}px, Line height: {line_height}")
+        started = record_stage(timings, 'layout', started)
 
         # Calculate text position based on alignment
         final_x = x_position
-        if text_alignment == 'center':
+        if style.text_alignment == 'center':
             final_x = x_position - (text_width // 2)
-        elif text_alignment == 'right':
+        elif style.text_alignment == 'right':
             final_x = x_position - text_width
 
-        # Calculate background height based on line height
-        background_height = int(font_size * line_height)
-        print(f"Line height: {line_height}, Background height: {background_height}px")
-
-        # Draw text background if enabled
-        if enable_background and background_rgba[3] > 0:
-            padding = 5
-            draw.rectangle([
-                final_x - padding,
-                y_position - padding,
-                final_x + text_width + padding,
-                y_position + background_height + padding
-            ], fill=background_rgba)
-            print("✓ Text background drawn")
-
-        # Draw text shadow if enabled
-        if enable_shadow:
-            shadow_x_pos = final_x + shadow_x
-            shadow_y_pos = y_position + shadow_y
-
-            # Draw shadow text with letter spacing
-            if letter_spacing != 0:
-                current_x = shadow_x_pos
-                for char in text:
-                    try:
-                        char_bbox = draw.textbbox((0, 0), char, font=font)
-                        char_width = char_bbox[2] - char_bbox[0]
-                    except AttributeError:
-                        char_width = draw.textsize(char, font=font)[0]
-
-                    draw.text((current_x, shadow_y_pos), char, fill=shadow_color_rgba, font=font)
-                    current_x += char_width + letter_spacing
-            else:
-                draw.text((shadow_x_pos, shadow_y_pos), text, fill=shadow_color_rgba, font=font)
-            print("✓ Text shadow drawn")
-
-        # Draw main text with letter spacing
-        if letter_spacing != 0:
-            current_x = final_x
-            for char in text:
-                try:
-                    char_bbox = draw.textbbox((0, 0), char, font=font)
-                    char_width = char_bbox[2] - char_bbox[0]
-                except AttributeError:
-                    char_width = draw.textsize(char, font=font)[0]
-
-                draw.text((current_x, y_position), char, fill=font_color_rgba, font=font)
-                current_x += char_width + letter_spacing
-        else:
-            draw.text((final_x, y_position), text, fill=font_color_rgba, font=font)
-        print("✓ Main text drawn")
-
-        # Apply rotation if needed
-        if text_rotate != 0:
-            # Calculate rotation center
-            center_x = final_x + text_width // 2
-            center_y = y_position + background_height // 2
-
-            # Rotate the text layer
-            text_layer = text_layer.rotate(
-                text_rotate,
-                center=(center_x, center_y),
-                resample=Image.BICUBIC
-            )
-            print(f"✓ Text rotated: {text_rotate}°")
-
-        # Composite the text layer onto the original image
-        original_image = Image.alpha_composite(original_image, text_layer)
+        # Fill the cached masks with this render's colors and composite them in place
+        tile = sprite.paint(
+            style.font_color_rgba,
+            style.shadow_color_rgba if enable_shadow else None,
+            style.background_rgba if padding is not None else None,
+            text_rotate
+        )
+        composite_at(original_image, tile, round(final_x) + sprite.offset_x, y_position + sprite.offset_y)
         print("✓ Text composited onto image")
+        started = record_stage(timings, 'composite', started)
 
         # Convert back to RGB for JPEG saving
         final_image = original_image.convert('RGB')
+        record_stage(timings, 'convert', started)
 
-        # Generate output path
-        import time
-        filename = os.path.basename(image_path)
-        name, ext = os.path.splitext(filename)
-        timestamp = str(int(time.time()))
-        output_filename = f"{name}_styled_{timestamp}.jpg"
-        output_path = os.path.join(settings.MEDIA_ROOT, 'outputs', output_filename)
-
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-        # Save the modified image
-        final_image.save(output_path, quality=95)
-
-        print(f"✓ Advanced styled image saved: {output_path}")
         print("=== IMAGE PROCESSING COMPLETED ===")
-
-        return f"outputs/{output_filename}"
+        return final_image
 
     except Exception as e:
-        print(f"✗ Error in add_text_to_image: {str(e)}")
+        print(f"✗ Error in render_text_image: {str(e)}")
         import traceback
         traceback.print_exc()
         raise e
 
+
+def composite_at(image, tile, x, y):
+    """Alpha composite tile onto image with its top left corner at (x, y), clipped to the image"""
+    left, top = max(0, -x), max(0, -y)
+    right = min(tile.width, image.width - x)
+    bottom = min(tile.height, image.height - y)
+    if right > left and bottom > top:
+        image.alpha_composite(tile, dest=(x + left, y + top), source=(left, top, right, bottom))
+
+
+def encode_output(image, quality=95):
+    """Encode a rendered image as output JPEG bytes"""
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def new_output_name(source_name):
+    """Media-relative name for a new render of source_name"""
+    name = os.path.splitext(os.path.basename(source_name))[0]
+    timestamp = str(int(time.time()))
+    # Originals are shared, so renders of one source in the same second need a unique suffix
+    return f"outputs/{name}_styled_{timestamp}_{secrets.token_hex(4)}.jpg"
+
+
+def save_output(output_name, content, image=None, timings=None):
+    """
+    Store encoded output bytes and their thumbnails, returning the stored name.
+    Pass the rendered image when it is still in memory so the thumbnails skip
+    decoding the JPEG.
+    """
+    started = time.perf_counter()
+    output_name = write_file(output_name, content)
+    started = record_stage(timings, 'write', started)
+
+    # Downscaled previews
+    generate_thumbnails(output_name, image)
+    record_stage(timings, 'thumbnails', started)
+    print(f"✓ Advanced styled image saved: {output_name}")
+    return output_name
+
+
+def add_text_to_image(source_name, text, style, scale=1.0, timings=None):
+    """
+    Add advanced styled text to a stored image and return the media name of the modified image
+    timings: optional dict that receives the seconds spent in each stage
+    """
+    with default_storage.open(source_name, 'rb') as source:
+        final_image = render_text_image(source, text, style, scale, timings)
+    return store_render(final_image, source_name, timings)
+
+
+def store_render(final_image, source_name, timings=None):
+    """Encode a rendered image and save it as a new output of source_name, returning the stored name"""
+    started = time.perf_counter()
+    content = encode_output(final_image)
+    record_stage(timings, 'encode', started)
+    return save_output(new_output_name(source_name), content, final_image, timings)
+
 def get_google_font(font_family, font_weight='400'):
     """
     Download Google Font and return the local path
@@ -1,12 +1,32 @@
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.files.storage import FileSystemStorage
 from django.conf import settings
-from .utils import add_text_to_image
-from .models import StyledImage, Category, Tag
+from django.core.files.storage import default_storage
+from . import trending
+from .clicks import hour_bucket
+from .blobs import get_upload_sha256, release_blob
+from .bulk_upload import bulk_ingest, iter_upload_members
+from .ingest import IngestError, ingest_upload
+from .media import open_image
+from .presets import apply_preset, get_preset_max_images
+from .rendering import publish_output_later
+from .retention import delete_output
+from .sprites import sprite_cache
+from .styles import StyleSpec
+from .tagging import assign_tags, get_or_create_tags, parse_tag_names
+from .utils import add_text_to_image, encode_output, new_output_name, render_text_image, save_output
+from .export import export_response
+from .caching import cache_response, get_cached_landing, get_landing_version, set_cached_landing
+from .models import StyledImage, StylePreset, Category, Tag
+from .stats import get_stats_snapshot
+from .thumbnails import get_srcset, get_thumbnail_urls
 from django.core import serializers
-from django.db.models import Prefetch, Q, Sum
+from django.db import transaction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, OuterRef, Prefetch, Q, Subquery, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils.text import slugify
 import os
 import json
 
@@ -34,26 +54,6 @@ def upload_and_style(request):
             text = request.POST.get('text', '').strip()
             image_name = request.POST.get('image_name', '').strip()  # NEW
             tags_input = request.POST.get('tags', '')  # NEW - comma separated tags
-            font_size = request.POST.get('font_size', '48')
-            font_color = request.POST.get('font_color', '#FFFFFF')
-            x_position = request.POST.get('x_position', '250')
-            y_position = request.POST.get('y_position', '250')
-            font_family = request.POST.get('font_family', 'Roboto')
-            text_alignment = request.POST.get('text_alignment', 'center')
-            font_weight = request.POST.get('font_weight', '600')
-
-            # Advanced parameters
-            text_rotate = request.POST.get('text_rotate', '0')
-            text_opacity = request.POST.get('text_opacity', '100')
-            enable_shadow = request.POST.get('enable_shadow', '')
-            shadow_x = request.POST.get('shadow_x', '2')
-            shadow_y = request.POST.get('shadow_y', '2')
-            shadow_blur = request.POST.get('shadow_blur', '4')
-            shadow_color = request.POST.get('shadow_color', '#000000')
-            enable_background = request.POST.get('enable_background', '')
-            text_background = request.POST.get('text_background', '#00000000')
-            letter_spacing = request.POST.get('letter_spacing', '0')
-            line_height = request.POST.get('line_height', '1.2')
 
             # Category (no subcategory anymore)
             category_id = request.POST.get('category')
@@ -62,68 +62,34 @@ def upload_and_style(request):
             if not text:
                 return JsonResponse({'error': 'No text provided'}, status=400)
 
-            # Convert to appropriate types
             try:
-                font_size = int(font_size)
-                x_position = int(x_position)
-                y_position = int(y_position)
-                text_rotate = int(text_rotate)
-                text_opacity = int(text_opacity)
-                shadow_x = int(shadow_x)
-                shadow_y = int(shadow_y)
-                shadow_blur = int(shadow_blur)
-                letter_spacing = float(letter_spacing)
-                line_height = float(line_height)
+                style = StyleSpec.from_options(request.POST)
             except ValueError as e:
-                return JsonResponse({'error': f'Invalid numeric values: {str(e)}'}, status=400)
+                return JsonResponse({'error': str(e)}, status=400)
 
-            # Validate ranges
-            if text_opacity < 0 or text_opacity > 100:
-                return JsonResponse({'error': 'Text opacity must be between 0 and 100'}, status=400)
-
-            if text_rotate < -180 or text_rotate > 180:
-                return JsonResponse({'error': 'Text rotation must be between -180 and 180 degrees'}, status=400)
-
-            # Save uploaded image
-            fs = FileSystemStorage()
+            # Validate, normalize and save the uploaded image (identical content is stored only once)
             try:
-                filename = fs.save(f"uploads/{image_file.name}", image_file)
-                image_path = fs.path(filename)
+                blob, _, working_image = ingest_upload(
+                    image_file, get_upload_sha256(request, 'image', image_file)
+                )
+                filename = blob.file.name
+                source_name, scale = blob.get_render_source()
+            except IngestError as e:
+                return JsonResponse({'error': str(e)}, status=400)
             except Exception as e:
                 return JsonResponse({'error': f'Error saving image: {str(e)}'}, status=500)
 
-            # Prepare style options
-            style_options = {
-                'font_size': font_size,
-                'font_color': font_color,
-                'x_position': x_position,
-                'y_position': y_position,
-                'font_family': font_family,
-                'text_alignment': text_alignment,
-                'font_weight': font_weight,
-                'text_rotate': text_rotate,
-                'text_opacity': text_opacity,
-                'enable_shadow': enable_shadow,
-                'shadow_x': shadow_x,
-                'shadow_y': shadow_y,
-                'shadow_blur': shadow_blur,
-                'shadow_color': shadow_color,
-                'enable_background': enable_background,
-                'text_background': text_background,
-                'letter_spacing': letter_spacing,
-                'line_height': line_height,
-            }
-
             # Add text to image
             try:
-                output_image_relative_path = add_text_to_image(image_path, text, style_options)
+                # A new upload is rendered from the image decoded during ingest
+                source = working_image or open_image(source_name)
+                final_image = render_text_image(source, text, style, scale)
+                output_image_relative_path = save_output(
+                    new_output_name(source_name), encode_output(final_image), final_image
+                )
             except Exception as e:
-                # Clean up uploaded file if processing fails
-                try:
-                    if os.path.exists(image_path):
-                        os.remove(image_path)
-                except:
-                    pass
+                # Clean up uploaded file if processing fails (other images may share it)
+                release_blob(blob.id)
                 return JsonResponse({'error': f'Image processing failed: {str(e)}'}, status=500)
 
             # Handle category relationship
@@ -135,50 +101,33 @@ def upload_and_style(request):
                     # Continue without category if not found
                     pass
 
-            # Create database record
+            # Create database record (tags and counters are committed together)
             try:
-                styled_image = StyledImage.objects.create(
-                    original_image=filename,
-                    text=text,
-                    image_name=image_name if image_name else None,  # NEW
-                    font_size=font_size,
-                    font_color=font_color,
-                    x_position=x_position,
-                    y_position=y_position,
-                    font_family=font_family,
-                    text_alignment=text_alignment,
-                    font_weight=font_weight,
-                    text_rotate=text_rotate,
-                    text_opacity=text_opacity,
-                    enable_shadow=enable_shadow == 'on',
-                    shadow_x=shadow_x,
-                    shadow_y=shadow_y,
-                    shadow_blur=shadow_blur,
-                    shadow_color=shadow_color,
-                    enable_background=enable_background == 'on',
-                    text_background=text_background,
-                    letter_spacing=letter_spacing,
-                    line_height=line_height,
-                    output_image=output_image_relative_path,
-                    category=category,
-                    update_clicks=0  # Initialize click counter
-                )
-
-                # Handle tags - NEW
-                if tags_input:
-                    tags_list = [tag.strip() for tag in tags_input.split(',') if tag.strip()]
-                    for tag_name in tags_list:
-                        tag, created = Tag.objects.get_or_create(name=tag_name.lower())
-                        styled_image.tags.add(tag)
+                with transaction.atomic():
+                    styled_image = StyledImage(
+                        original_image=filename,
+                        blob=blob,
+                        text=text,
+                        image_name=image_name if image_name else None,  # NEW
+                        **style.as_fields(),
+                        output_image=output_image_relative_path,
+                        output_has_thumbnails=True,
+                        category=category,
+                        update_clicks=0  # Initialize click counter
+                    )
+                    styled_image.output_signature = styled_image.get_render_signature(text, style)
+                    styled_image.save()
+                    # The image holds its own reference to the original now
+                    release_blob(blob.id)
+
+                    # Handle tags - NEW
+                    tags = assign_tags(styled_image, tags_input) if tags_input else []
 
             except Exception as e:
                 # Clean up files if database save fails
                 try:
-                    if os.path.exists(image_path):
-                        os.remove(image_path)
-                    output_path = os.path.join(settings.MEDIA_ROOT, output_image_relative_path)
-                    if os.path.exists(output_path):
-                        os.remove(output_path)
+                    release_blob(blob.id)
+                    delete_output(output_image_relative_path)
                 except:
                     pass
                 return JsonResponse({'error': f'Database save failed: {str(e)}'}, status=500)
@@ -191,7 +140,7 @@ def upload_and_style(request):
                 'output_image_url': output_url,
                 'styled_image_id': styled_image.id,
                 'image_name': styled_image.image_name,
-                'tags': [tag.name for tag in styled_image.tags.all()],  # NEW
+                'tags': [tag.name for tag in tags],  # NEW
                 'message': 'Image successfully created with all styling parameters applied',
             })
 
@@ -200,6 +149,62 @@ def upload_and_style(request):
 
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
+
+@csrf_exempt
+def bulk_upload_and_style(request):
+    """
+    Upload many images (or ZIP archives of images) at once with one shared style
+    Expected POST data: 'files' (repeatable) plus the same text, style, category
+    and tags fields as api/upload-style/
+    Returns: per-file results, in upload order (ZIP members in archive order)
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        if not request.FILES.getlist('files'):
+            return JsonResponse({'error': 'No files provided'}, status=400)
+
+        text = request.POST.get('text', '').strip()
+        if not text:
+            return JsonResponse({'error': 'No text provided'}, status=400)
+
+        try:
+            style = StyleSpec.from_options(request.POST)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        category = None
+        category_id = request.POST.get('category')
+        if category_id:
+            category = Category.objects.filter(id=category_id).first()
+            if category is None:
+                return JsonResponse({'error': 'Category not found'}, status=404)
+
+        tags = get_or_create_tags(parse_tag_names(request.POST.get('tags', '')))
+
+        results = bulk_ingest(
+            iter_upload_members(request, 'files'), text, style, category, tags
+        )
+        created = sum(1 for result in results if result['success'])
+        for result in results:
+            if result['success']:
+                result['output_image_url'] = request.build_absolute_uri(result['output_image_url'])
+
+        return JsonResponse({
+            'success': created > 0,
+            'total': len(results),
+            'created': created,
+            'failed': len(results) - created,
+            'category': category.name if category else None,
+            'tags': [tag.name for tag in tags],
+            'results': results,
+        })
+
+    except Exception as e:
+        return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
+
+
 def download_styled_image(request, image_id):
     """Download the styled image"""
     try:
@@ -208,13 +213,16 @@ def download_styled_image(request, image_id):
         if not styled_image.output_image:
             return JsonResponse({'error': 'No styled image available for download'}, status=404)
 
-        image_path = styled_image.output_image.path
+        output_name = styled_image.output_image.name
 
-        if os.path.exists(image_path):
-            with open(image_path, 'rb') as f:
-                response = HttpResponse(f.read(), content_type='image/jpeg')
-                response['Content-Disposition'] = f'attachment; filename="styled_image_{image_id}.jpg"'
-                return response
+        if default_storage.exists(output_name):
+            # Streamed from storage in chunks
+            return FileResponse(
+                default_storage.open(output_name, 'rb'),
+                content_type='image/jpeg',
+                as_attachment=True,
+                filename=f"styled_image_{image_id}.jpg"
+            )
         else:
             return JsonResponse({'error': 'Styled image file not found'}, status=404)
 
@@ -232,11 +240,10 @@ def get_styled_image(request, image_id):
         if not styled_image.output_image:
             return JsonResponse({'error': 'No styled image available'}, status=404)
 
-        image_path = styled_image.output_image.path
+        output_name = styled_image.output_image.name
 
-        if os.path.exists(image_path):
-            with open(image_path, 'rb') as f:
-                return HttpResponse(f.read(), content_type='image/jpeg')
+        if default_storage.exists(output_name):
+            return FileResponse(default_storage.open(output_name, 'rb'), content_type='image/jpeg')
         else:
             return JsonResponse({'error': 'Styled image file not found'}, status=404)
 
@@ -250,7 +257,7 @@ def get_styled_image(request, image_id):
 def get_image_data(request, image_id):
     """Get all styling data for a specific image for editing"""
     try:
-        styled_image = StyledImage.objects.prefetch_related('tags').get(id=image_id)
+        styled_image = StyledImage.objects.select_related('category', 'blob').prefetch_related('tags').get(id=image_id)
 
         # Get tags data - NEW
         tags_data = [{'id': tag.id, 'name': tag.name} for tag in styled_image.tags.all()]
@@ -285,6 +292,7 @@ def get_image_data(request, image_id):
                 'category_name': styled_image.category.name if styled_image.category else None,
                 'tags': tags_data,  # NEW
                 'output_image_url': styled_image.output_image.url if styled_image.output_image else None,
+                **get_thumbnail_fields(styled_image),
             }
         })
     except StyledImage.DoesNotExist:
@@ -292,9 +300,10 @@ def get_image_data(request, image_id):
     except Exception as e:
         return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
 
+@cache_response('image', 'category', 'tag')
 def list_styled_images(request):
     """List all styled images from database with category information"""
-    styled_images = StyledImage.objects.select_related('category').prefetch_related('tags').all().order_by('-created_at')
+    styled_images = StyledImage.objects.select_related('category', 'blob').prefetch_related('tags').all().order_by('-created_at')
 
     images_data = []
     for image in styled_images:
@@ -324,6 +333,7 @@ def list_styled_images(request):
             'tags': tags,  # NEW
             'original_image_url': image.original_image.url if image.original_image else None,
             'output_image_url': image.output_image.url if image.output_image else None,
+            **get_thumbnail_fields(image),
             'created_at': image.created_at.isoformat(),
         })
 
@@ -347,50 +357,13 @@ def update_text_and_regenerate(request):
                 data = json.loads(request.body)
                 image_id = data.get('id')
                 new_text = data.get('text', '').strip()
-
-                # Get ALL styling parameters from the request
-                font_size = data.get('font_size')
-                font_color = data.get('font_color')
-                x_position = data.get('x_position')
-                y_position = data.get('y_position')
-                font_family = data.get('font_family')
-                text_alignment = data.get('text_alignment')
-                font_weight = data.get('font_weight')
-                text_rotate = data.get('text_rotate')
-                text_opacity = data.get('text_opacity')
-                enable_shadow = data.get('enable_shadow')
-                shadow_x = data.get('shadow_x')
-                shadow_y = data.get('shadow_y')
-                shadow_blur = data.get('shadow_blur')
-                shadow_color = data.get('shadow_color')
-                enable_background = data.get('enable_background')
-                text_background = data.get('text_background')
-                letter_spacing = data.get('letter_spacing')
-                line_height = data.get('line_height')
                 category_id = data.get('category_id')  # Added category update
 
             else:
                 # Form data fallback
+                data = request.POST
                 image_id = request.POST.get('id')
                 new_text = request.POST.get('text', '').strip()
-                font_size = request.POST.get('font_size')
-                font_color = request.POST.get('font_color')
-                x_position = request.POST.get('x_position')
-                y_position = request.POST.get('y_position')
-                font_family = request.POST.get('font_family')
-                text_alignment = request.POST.get('text_alignment')
-                font_weight = request.POST.get('font_weight')
-                text_rotate = request.POST.get('text_rotate')
-                text_opacity = request.POST.get('text_opacity')
-                enable_shadow = request.POST.get('enable_shadow')
-                shadow_x = request.POST.get('shadow_x')
-                shadow_y = request.POST.get('shadow_y')
-                shadow_blur = request.POST.get('shadow_blur')
-                shadow_color = request.POST.get('shadow_color')
-                enable_background = request.POST.get('enable_background')
-                text_background = request.POST.get('text_background')
-                letter_spacing = request.POST.get('letter_spacing')
-                line_height = request.POST.get('line_height')
                 category_id = request.POST.get('category_id')
 
             # Validate required fields
@@ -409,9 +382,21 @@ def update_text_and_regenerate(request):
             if not styled_image.original_image:
                 return JsonResponse({'error': 'Original image not found'}, status=404)
 
+            # Stored styling with the fields provided in the request, validated
+            # (stored values that do not validate are drawn, and saved, as their defaults)
+            try:
+                style = StyleSpec.from_stored(
+                    styled_image, **{name: data.get(name) for name in StyledImage.STYLE_FIELDS}
+                )
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+
             # INCREMENT CLICK COUNTER - This is the key change!
             styled_image.increment_clicks()
 
+            # Remember the stored values to find out what this request changes
+            snapshot = styled_image.snapshot_fields()
+
             # Update ALL fields - use request values if provided, otherwise keep existing values
             styled_image.text = new_text
 
@@ -425,92 +410,41 @@ def update_text_and_regenerate(request):
                     pass
 
             # Only update fields that were provided in the request
-            if font_size is not None:
-                styled_image.font_size = int(font_size)
-            if font_color is not None:
-                styled_image.font_color = font_color
-            if x_position is not None:
-                styled_image.x_position = int(x_position)
-            if y_position is not None:
-                styled_image.y_position = int(y_position)
-            if font_family is not None:
-                styled_image.font_family = font_family
-            if text_alignment is not None:
-                styled_image.text_alignment = text_alignment
-            if font_weight is not None:
-                styled_image.font_weight = font_weight
-            if text_rotate is not None:
-                styled_image.text_rotate = int(text_rotate)
-            if text_opacity is not None:
-                styled_image.text_opacity = int(text_opacity)
-            if enable_shadow is not None:
-                styled_image.enable_shadow = bool(enable_shadow)
-            if shadow_x is not None:
-                styled_image.shadow_x = int(shadow_x)
-            if shadow_y is not None:
-                styled_image.shadow_y = int(shadow_y)
-            if shadow_blur is not None:
-                styled_image.shadow_blur = int(shadow_blur)
-            if shadow_color is not None:
-                styled_image.shadow_color = shadow_color
-            if enable_background is not None:
-                styled_image.enable_background = bool(enable_background)
-            if text_background is not None:
-                styled_image.text_background = text_background
-            if letter_spacing is not None:
-                styled_image.letter_spacing = float(letter_spacing)
-            if line_height is not None:
-                styled_image.line_height = float(line_height)
-
-            styled_image.save()
-
-            # Get the original image path
-            original_path = styled_image.original_image.path
-
-            # Prepare style options using UPDATED database values
-            style_options = {
-                'font_size': styled_image.font_size,
-                'font_color': styled_image.font_color,
-                'x_position': styled_image.x_position,
-                'y_position': styled_image.y_position,
-                'font_family': styled_image.font_family,
-                'text_alignment': styled_image.text_alignment,
-                'font_weight': styled_image.font_weight,
-                'text_rotate': styled_image.text_rotate,
-                'text_opacity': styled_image.text_opacity,
-                'enable_shadow': 'on' if styled_image.enable_shadow else '',
-                'shadow_x': styled_image.shadow_x,
-                'shadow_y': styled_image.shadow_y,
-                'shadow_blur': styled_image.shadow_blur,
-                'shadow_color': styled_image.shadow_color,
-                'enable_background': 'on' if styled_image.enable_background else '',
-                'text_background': styled_image.text_background,
-                'letter_spacing': styled_image.letter_spacing,
-                'line_height': styled_image.line_height,
-            }
+            for name, value in style.as_fields().items():
+                setattr(styled_image, name, value)
+
+            changed_fields = styled_image.get_changed_fields(snapshot)
+            styled_image.save(update_fields=changed_fields + ['last_updated'])
+
+            # The stored output is a render of exactly these values (a render still
+            # being published, or one that failed, has not replaced its signature yet)
+            if styled_image.has_current_output(new_text, style):
+                output_name = styled_image.output_image.name
+                if default_storage.exists(output_name):
+                    return FileResponse(
+                        default_storage.open(output_name, 'rb'),
+                        content_type='image/jpeg',
+                        filename=f"updated_image_{image_id}.jpg"
+                    )
+
+            # The image to render from (working copy when there is one)
+            source_name, scale = styled_image.get_render_source()
 
             # Regenerate the image with new text and styles
-            output_image_relative_path = add_text_to_image(
-                original_path,
-                new_text,
-                style_options
+            with default_storage.open(source_name, 'rb') as source:
+                final_image = render_text_image(source, new_text, style, scale)
+            content = encode_output(final_image)
+
+            # The output file is written and saved on the image, with its signature, after responding
+            publish_output_later(
+                styled_image.id, new_output_name(source_name), content, final_image,
+                signature=styled_image.get_render_signature(new_text, style),
             )
 
-            # Update the output image path
-            styled_image.output_image = output_image_relative_path
-            styled_image.save()
-
-            # Get the path to the new image
-            output_image_path = os.path.join(settings.MEDIA_ROOT, output_image_relative_path)
-
-            # Return the image directly
-            if os.path.exists(output_image_path):
-                with open(output_image_path, 'rb') as f:
-                    response = HttpResponse(f.read(), content_type='image/jpeg')
-                    response['Content-Disposition'] = f'inline; filename="updated_image_{image_id}.jpg"'
-                    return response
-            else:
-                return JsonResponse({'error': 'Generated image not found'}, status=500)
+            # Return the image directly from the encoded bytes
+            response = HttpResponse(content, content_type='image/jpeg')
+            response['Content-Disposition'] = f'inline; filename="updated_image_{image_id}.jpg"'
+            return response
 
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON data'}, status=400)
@@ -535,52 +469,15 @@ def update_text_and_regenerate_json(request):
                 image_id = data.get('id')
                 new_text = data.get('text', '').strip()
                 image_name = data.get('image_name', '').strip()  # NEW
-                tags_input = data.get('tags', '')  # NEW
-
-                # Get ALL styling parameters from the request
-                font_size = data.get('font_size')
-                font_color = data.get('font_color')
-                x_position = data.get('x_position')
-                y_position = data.get('y_position')
-                font_family = data.get('font_family')
-                text_alignment = data.get('text_alignment')
-                font_weight = data.get('font_weight')
-                text_rotate = data.get('text_rotate')
-                text_opacity = data.get('text_opacity')
-                enable_shadow = data.get('enable_shadow')
-                shadow_x = data.get('shadow_x')
-                shadow_y = data.get('shadow_y')
-                shadow_blur = data.get('shadow_blur')
-                shadow_color = data.get('shadow_color')
-                enable_background = data.get('enable_background')
-                text_background = data.get('text_background')
-                letter_spacing = data.get('letter_spacing')
-                line_height = data.get('line_height')
+                tags_input = data.get('tags')  # NEW - omitted keeps the current tags
                 category_id = data.get('category_id')
 
             else:
+                data = request.POST
                 image_id = request.POST.get('id')
                 new_text = request.POST.get('text', '').strip()
                 image_name = request.POST.get('image_name', '').strip()  # NEW
-                tags_input = request.POST.get('tags', '')  # NEW
-                font_size = request.POST.get('font_size')
-                font_color = request.POST.get('font_color')
-                x_position = request.POST.get('x_position')
-                y_position = request.POST.get('y_position')
-                font_family = request.POST.get('font_family')
-                text_alignment = request.POST.get('text_alignment')
-                font_weight = request.POST.get('font_weight')
-                text_rotate = request.POST.get('text_rotate')
-                text_opacity = request.POST.get('text_opacity')
-                enable_shadow = request.POST.get('enable_shadow')
-                shadow_x = request.POST.get('shadow_x')
-                shadow_y = request.POST.get('shadow_y')
-                shadow_blur = request.POST.get('shadow_blur')
-                shadow_color = request.POST.get('shadow_color')
-                enable_background = request.POST.get('enable_background')
-                text_background = request.POST.get('text_background')
-                letter_spacing = request.POST.get('letter_spacing')
-                line_height = request.POST.get('line_height')
+                tags_input = request.POST.get('tags')  # NEW - omitted keeps the current tags
                 category_id = request.POST.get('category_id')
 
             # Validate required fields
@@ -599,10 +496,22 @@ def update_text_and_regenerate_json(request):
             if not styled_image.original_image:
                 return JsonResponse({'error': 'Original image not found'}, status=404)
 
+            # Stored styling with the fields provided in the request, validated
+            # (stored values that do not validate are drawn, and saved, as their defaults)
+            try:
+                style = StyleSpec.from_stored(
+                    styled_image, **{name: data.get(name) for name in StyledImage.STYLE_FIELDS}
+                )
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+
             # INCREMENT CLICK COUNTER
             old_clicks = styled_image.update_clicks
             styled_image.increment_clicks()
 
+            # Remember the stored values to find out what this request changes
+            snapshot = styled_image.snapshot_fields()
+
             # Store old values for response
             old_text = styled_image.text
             old_styles = {
@@ -630,99 +539,50 @@ def update_text_and_regenerate_json(request):
                 except Category.DoesNotExist:
                     pass
 
-            # Update tags if provided - NEW
-            if tags_input is not None:
-                # Clear existing tags
-                styled_image.tags.clear()
-
-                # Add new tags
-                tags_list = [tag.strip() for tag in str(tags_input).split(',') if tag.strip()]
-                for tag_name in tags_list:
-                    tag, created = Tag.objects.get_or_create(name=tag_name.lower())
-                    styled_image.tags.add(tag)
-
             # Only update fields that were provided in the request
-            if font_size is not None:
-                styled_image.font_size = int(font_size)
-            if font_color is not None:
-                styled_image.font_color = font_color
-            if x_position is not None:
-                styled_image.x_position = int(x_position)
-            if y_position is not None:
-                styled_image.y_position = int(y_position)
-            if font_family is not None:
-                styled_image.font_family = font_family
-            if text_alignment is not None:
-                styled_image.text_alignment = text_alignment
-            if font_weight is not None:
-                styled_image.font_weight = font_weight
-            if text_rotate is not None:
-                styled_image.text_rotate = int(text_rotate)
-            if text_opacity is not None:
-                styled_image.text_opacity = int(text_opacity)
-            if enable_shadow is not None:
-                styled_image.enable_shadow = bool(enable_shadow)
-            if shadow_x is not None:
-                styled_image.shadow_x = int(shadow_x)
-            if shadow_y is not None:
-                styled_image.shadow_y = int(shadow_y)
-            if shadow_blur is not None:
-                styled_image.shadow_blur = int(shadow_blur)
-            if shadow_color is not None:
-                styled_image.shadow_color = shadow_color
-            if enable_background is not None:
-                styled_image.enable_background = bool(enable_background)
-            if text_background is not None:
-                styled_image.text_background = text_background
-            if letter_spacing is not None:
-                styled_image.letter_spacing = float(letter_spacing)
-            if line_height is not None:
-                styled_image.line_height = float(line_height)
-
-            styled_image.save()
-
-            # Get the original image path
-            original_path = styled_image.original_image.path
-
-            # Style options from updated image
-            style_options = {
-                'font_size': styled_image.font_size,
-                'font_color': styled_image.font_color,
-                'x_position': styled_image.x_position,
-                'y_position': styled_image.y_position,
-                'font_family': styled_image.font_family,
-                'text_alignment': styled_image.text_alignment,
-                'font_weight': styled_image.font_weight,
-                'text_rotate': styled_image.text_rotate,
-                'text_opacity': styled_image.text_opacity,
-                'enable_shadow': 'on' if styled_image.enable_shadow else '',
-                'shadow_x': styled_image.shadow_x,
-                'shadow_y': styled_image.shadow_y,
-                'shadow_blur': styled_image.shadow_blur,
-                'shadow_color': styled_image.shadow_color,
-                'enable_background': 'on' if styled_image.enable_background else '',
-                'text_background': styled_image.text_background,
-                'letter_spacing': styled_image.letter_spacing,
-                'line_height': styled_image.line_height,
-            }
+            for name, value in style.as_fields().items():
+                setattr(styled_image, name, value)
+
+            changed_fields = styled_image.get_changed_fields(snapshot)
+            regenerated = not styled_image.has_current_output(new_text, style)
+
+            # Only re-render when the stored output is not a render of these values
+            # (rendering stays outside the transaction; the output is saved with the fields)
+            if regenerated:
+                source_name, scale = styled_image.get_render_source()
+                styled_image.output_image = add_text_to_image(
+                    source_name,
+                    new_text,
+                    style,
+                    scale
+                )
+                styled_image.output_signature = styled_image.get_render_signature(new_text, style)
+                styled_image.output_has_thumbnails = True
+                changed_fields += ['output_image', 'output_signature', 'output_has_thumbnails']
 
-            # Regenerate the image with new text and styles
-            output_image_relative_path = add_text_to_image(
-                original_path,
-                new_text,
-                style_options
-            )
+            # One write for the fields and the tags
+            try:
+                with transaction.atomic():
+                    styled_image.save(update_fields=changed_fields + ['last_updated'])
 
-            # Update the output image path
-            styled_image.output_image = output_image_relative_path
-            styled_image.save()
+                    # Update tags if provided - NEW (only the links that differ are written)
+                    if tags_input is not None:
+                        assign_tags(styled_image, tags_input)
+            except Exception:
+                if regenerated:
+                    delete_output(styled_image.output_image.name)
+                raise
 
             # Return JSON response
-            output_url = f"{settings.MEDIA_URL}{output_image_relative_path}"
+            output_url = styled_image.output_image.url if styled_image.output_image else None
 
             return JsonResponse({
                 'success': True,
-                'message': 'Text and styles updated and image regenerated successfully',
+                'message': (
+                    'Text and styles updated and image regenerated successfully' if regenerated
+                    else 'Details updated, the image did not need regenerating'
+                ),
+                'regenerated': regenerated,
                 'image_id': image_id,
                 'image_name': styled_image.image_name,  # NEW
                 'tags': [tag.name for tag in styled_image.tags.all()],  # NEW
@@ -756,13 +616,19 @@ def update_text_and_regenerate_json(request):
     return JsonResponse({'error': 'Only POST method allowed'}, status=405)
 
 
+@cache_response('category', 'image')
 def get_categories_basic(request):
     """
     API endpoint to get only basic category info with category image
     Returns: JSON with category name, description, created_at, total_images, category_image
     """
     try:
-        categories = Category.objects.prefetch_related('styled_images').all()
+        # The newest image of each category, as a fallback cover, in the same query
+        newest_images = StyledImage.objects.filter(category=OuterRef('pk')).order_by('-created_at')
+        categories = Category.objects.annotate(
+            first_output_image=Subquery(newest_images.values('output_image')[:1]),
+            first_original_image=Subquery(newest_images.values('original_image')[:1]),
+        )
 
         categories_data = []
 
@@ -772,7 +638,7 @@ def get_categories_basic(request):
                 'name': category.name,
                 'description': category.description,
                 'created_at': category.created_at.isoformat(),
-                'total_images': category.styled_images.count(),
+                'total_images': category.image_count,
                 'show_in_landing': category.show_in_landing,
                 'category_image': None
             }
@@ -781,13 +647,15 @@ def get_categories_basic(request):
             if hasattr(category, 'category_image') and category.category_image:
                 category_data['category_image'] = get_absolute_media_url(request, category.category_image.url)
 
-            # Fallback to first image in category
-            elif category.styled_images.exists():
-                first_image = category.styled_images.first()
-                if first_image and first_image.output_image:
-                    category_data['category_image'] = get_absolute_media_url(request, first_image.output_image.url)
-                elif first_image and first_image.original_image:
-                    category_data['category_image'] = get_absolute_media_url(request, first_image.original_image.url)
+            # Fallback to the newest image in the category
+            elif category.first_output_image:
+                category_data['category_image'] = get_absolute_media_url(
+                    request, default_storage.url(category.first_output_image)
+                )
+            elif category.first_original_image:
+                category_data['category_image'] = get_absolute_media_url(
+                    request, default_storage.url(category.first_original_image)
+                )
 
             categories_data.append(category_data)
 
@@ -807,54 +675,79 @@ def get_categories_landing(request):
     Returns: JSON with categories that have show_in_landing = True
     """
     try:
-        # Filter categories that should be shown in landing page
-        landing_categories = Category.objects.filter(
-            show_in_landing=True
-        ).prefetch_related('styled_images')
+        # The assembled payload is cached until a category or image changes;
+        # it holds absolute URLs, so it is kept per scheme and host
+        site = request.build_absolute_uri('/')
+        version = get_landing_version()
+        content = get_cached_landing(version, site)
+        if content is None:
+            payload = build_landing_payload(request)
+            content = json.dumps(payload, cls=DjangoJSONEncoder)
+            set_cached_landing(version, site, content, [
+                image['id'] for category in payload['landing_categories'] for image in category['featured_images']
+            ])
+
+        return HttpResponse(content, content_type='application/json')
 
-        categories_data = []
+    except Exception as e:
+        return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
 
-        for category in landing_categories:
-            # Get some featured images for the category (limit to 4 for landing)
-            featured_images = category.styled_images.all()[:4]
 
-            category_data = {
-                'id': category.id,
-                'name': category.name,
-                'description': category.description,
-                'created_at': category.created_at.isoformat(),
-                'total_images': category.styled_images.count(),
-                'show_in_landing': category.show_in_landing,
-                'category_image': None,
-                'featured_images': []
-            }
+def build_landing_payload(request):
+    """Build the landing page payload with two queries: categories and featured images"""
+    # Filter categories that should be shown in landing page
+    landing_categories = list(Category.objects.filter(show_in_landing=True))
 
-            # Get category image
-            if hasattr(category, 'category_image') and category.category_image:
-                category_data['category_image'] = get_absolute_media_url(request, category.category_image.url)
+    # Top 4 newest images of every landing category in one windowed query
+    featured_images = StyledImage.objects.filter(
+        category__show_in_landing=True
+    ).annotate(
+        category_rank=Window(
+            RowNumber(),
+            partition_by=F('category_id'),
+            order_by=F('created_at').desc(),
+        )
+    ).filter(
+        category_rank__lte=4
+    ).only(
+        'id', 'category_id', 'text', 'output_image', 'update_clicks', 'last_updated', 'created_at'
+    ).order_by('category_id', 'category_rank')
+
+    featured_by_category = {}
+    for image in featured_images:
+        featured_by_category.setdefault(image.category_id, []).append({
+            'id': image.id,
+            'text': image.text[:50] + '...' if len(image.text) > 50 else image.text,
+            'output_image_url': get_absolute_media_url(request,
+                                                       image.output_image.url) if image.output_image else None,
+            'update_clicks': image.update_clicks,
+            'last_updated': image.last_updated.isoformat(),
+        })
 
-            # Get featured images
-            for image in featured_images:
-                featured_image_data = {
-                    'id': image.id,
-                    'text': image.text[:50] + '...' if len(image.text) > 50 else image.text,
-                    'output_image_url': get_absolute_media_url(request,
-                                                               image.output_image.url) if image.output_image else None,
-                    'update_clicks': image.update_clicks,
-                    'last_updated': image.last_updated.isoformat(),
-                }
-                category_data['featured_images'].append(featured_image_data)
+    categories_data = []
+    for category in landing_categories:
+        category_data = {
+            'id': category.id,
+            'name': category.name,
+            'description': category.description,
+            'created_at': category.created_at.isoformat(),
+            'total_images': category.image_count,
+            'show_in_landing': category.show_in_landing,
+            'category_image': None,
+            'featured_images': featured_by_category.get(category.id, [])
+        }
 
-            categories_data.append(category_data)
+        # Get category image
+        if category.category_image:
+            category_data['category_image'] = get_absolute_media_url(request, category.category_image.url)
 
-        return JsonResponse({
-            'success': True,
-            'total_categories': len(categories_data),
-            'landing_categories': categories_data
-        })
+        categories_data.append(category_data)
 
-    except Exception as e:
-        return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
+    return {
+        'success': True,
+        'total_categories': len(categories_data),
+        'landing_categories': categories_data
+    }
 
 
 def get_category_images(request, category_id):
@@ -865,7 +758,7 @@ def get_category_images(request, category_id):
         category = Category.objects.prefetch_related(
             Prefetch(
                 'styled_images',
-                queryset=StyledImage.objects.select_related('category').prefetch_related('tags')  # Added tags
+                queryset=StyledImage.objects.select_related('category', 'blob').prefetch_related('tags')  # Added tags
             )
         ).get(id=category_id)
 
@@ -900,6 +793,7 @@ def get_category_images(request, category_id):
                                                              image.original_image.url) if image.original_image else None,
                 'output_image_url': get_absolute_media_url(request,
                                                            image.output_image.url) if image.output_image else None,
+                **get_thumbnail_fields(image, request),
                 'created_at': image.created_at.isoformat(),
             })
 
@@ -926,45 +820,44 @@ def get_absolute_media_url(request, relative_url):
         return f"https://yousefelmesalamy.pythonanywhere.com{relative_url}"
 
 
+def get_thumbnail_fields(image, request=None):
+    """thumbnail_urls/srcset of an image's output, absolute when a request is given"""
+    thumbnail_urls = get_thumbnail_urls(image.output_image, image.get_output_thumbnail_width())
+    if request is not None:
+        thumbnail_urls = {
+            width: get_absolute_media_url(request, url) for width, url in thumbnail_urls.items()
+        }
+    return {
+        'thumbnail_urls': thumbnail_urls,
+        'srcset': get_srcset(thumbnail_urls),
+    }
+
+
 def get_image_stats(request):
     """
     NEW ENDPOINT: Get statistics about image updates
-    Returns: JSON with click statistics
+    Returns: JSON with click statistics (served from the cached stats snapshot)
     """
     try:
-        # Get total images
-        total_images = StyledImage.objects.count()
-
-        # Get images with clicks
-        images_with_clicks = StyledImage.objects.filter(update_clicks__gt=0).count()
-
-        # Get total clicks across all images
-        total_clicks = StyledImage.objects.aggregate(Sum('update_clicks'))['update_clicks__sum'] or 0
-
-        # Get top 10 most updated images
-        top_images = StyledImage.objects.select_related('category').order_by('-update_clicks')[:10]
+        snapshot = get_stats_snapshot()
 
         top_images_data = []
-        for image in top_images:
+        for image_data in snapshot['top_updated_images']:
             top_images_data.append({
-                'id': image.id,
-                'text': image.text[:30] + '...' if len(image.text) > 30 else image.text,
-                'update_clicks': image.update_clicks,
-                'last_updated': image.last_updated.isoformat(),
-                'category': image.category.name if image.category else 'Uncategorized',
-                'output_image_url': get_absolute_media_url(request,
-                                                           image.output_image.url) if image.output_image else None,
+                **image_data,
+                'output_image_url': get_absolute_media_url(request, image_data['output_image_url']),
             })
 
         return JsonResponse({
             'success': True,
             'stats': {
-                'total_images': total_images,
-                'images_with_clicks': images_with_clicks,
-                'total_clicks': total_clicks,
-                'average_clicks_per_image': total_clicks / total_images if total_images > 0 else 0,
+                'total_images': snapshot['total_images'],
+                'images_with_clicks': snapshot['images_with_clicks'],
+                'total_clicks': snapshot['total_clicks'],
+                'average_clicks_per_image': snapshot['average_clicks_per_image'],
             },
-            'top_updated_images': top_images_data
+            'top_updated_images': top_images_data,
+            'snapshot_at': snapshot['computed_at'],
         })
 
     except Exception as e:
@@ -976,7 +869,7 @@ def get_uncategorized_images(request):
     API endpoint to get all images that don't belong to any category
     """
     try:
-        uncategorized_images = StyledImage.objects.filter(category__isnull=True).prefetch_related('tags')
+        uncategorized_images = StyledImage.objects.filter(category__isnull=True).select_related('blob').prefetch_related('tags')
 
         images_data = []
         for image in uncategorized_images:
@@ -997,6 +890,7 @@ def get_uncategorized_images(request):
                 'tags': tags,  # NEW
                 'original_image_url': image.original_image.url if image.original_image else None,
                 'output_image_url': image.output_image.url if image.output_image else None,
+                **get_thumbnail_fields(image),
                 'created_at': image.created_at.isoformat(),
             })
 
@@ -1009,10 +903,11 @@ def get_uncategorized_images(request):
     except Exception as e:
         return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
 
+@cache_response('image', 'category', timeout=60)
 def get_trending_images(request):
     """
     NEW ENDPOINT: Get trending images (recently updated with high activity)
-    Returns: JSON with images that have been recently updated
+    Returns: JSON with images ranked by their time-decayed click score
     """
     try:
         # Get query parameters
@@ -1025,24 +920,24 @@ def get_trending_images(request):
         except ValueError:
             limit = 10
 
-        from datetime import datetime, timedelta
         from django.utils import timezone
 
-        # Get images updated in the last 7 days
-        week_ago = timezone.now() - timedelta(days=7)
+        now = timezone.now()
 
+        # Indexed top-k read on the stored score; images whose decayed score
+        # dropped below the minimum are no longer trending
+        min_score = getattr(settings, 'STYLER_TRENDING_MIN_SCORE', 0.1)
         trending_images = StyledImage.objects.select_related('category').filter(
-            last_updated__gte=week_ago,
-            update_clicks__gt=0
-        ).order_by('-update_clicks', '-last_updated')[:limit]
+            trending_score__gte=trending.stored_score_threshold(min_score, now)
+        ).order_by('-trending_score')[:limit]
 
         images_data = []
         for image in trending_images:
-            # Calculate activity score (clicks per day since creation)
-            days_since_creation = (timezone.now() - image.created_at).days
+            # Recent clicks per day, from the decayed score
+            activity_score = trending.activity_score(image.trending_score, now)
+            days_since_creation = (now - image.created_at).days
             if days_since_creation == 0:
                 days_since_creation = 1
-            activity_score = image.update_clicks / days_since_creation
 
             images_data.append({
                 'id': image.id,
@@ -1064,7 +959,8 @@ def get_trending_images(request):
 
         return JsonResponse({
             'success': True,
-            'timeframe': 'last_7_days',
+            'timeframe': 'time_decayed',
+            'half_life_hours': getattr(settings, 'STYLER_TRENDING_HALF_LIFE_HOURS', 72),
             'limit': limit,
             'trending_images': images_data
         })
@@ -1120,6 +1016,7 @@ def get_most_updated_images(request):
         from datetime import datetime, timedelta
         from django.utils import timezone
 
+        start_date = None
         if timeframe:
             now = timezone.now()
             if timeframe == 'daily':
@@ -1133,20 +1030,28 @@ def get_most_updated_images(request):
             else:
                 start_date = None
 
-            if start_date:
-                queryset = queryset.filter(last_updated__gte=start_date)
-
-        # Get the most updated images
-        most_updated_images = queryset.order_by('-update_clicks', '-last_updated')[:limit]
+        if start_date:
+            # Rank by the clicks made inside the timeframe, summed from the click rollups
+            queryset = queryset.filter(
+                click_rollups__bucket__gte=hour_bucket(start_date)
+            ).annotate(
+                timeframe_clicks=Sum('click_rollups__count')
+            )
+            most_updated_images = queryset.order_by('-timeframe_clicks', '-last_updated')[:limit]
+        else:
+            # Get the most updated images of all time
+            most_updated_images = queryset.order_by('-update_clicks', '-last_updated')[:limit]
 
         images_data = []
         for image in most_updated_images:
+            ranked_clicks = getattr(image, 'timeframe_clicks', image.update_clicks)
+
             # Calculate activity level based on clicks
-            if image.update_clicks >= 20:
+            if ranked_clicks >= 20:
                 activity_level = 'very_high'
-            elif image.update_clicks >= 10:
+            elif ranked_clicks >= 10:
                 activity_level = 'high'
-            elif image.update_clicks >= 5:
+            elif ranked_clicks >= 5:
                 activity_level = 'medium'
             else:
                 activity_level = 'low'
@@ -1156,6 +1061,7 @@ def get_most_updated_images(request):
                 'text': image.text,
                 'text_preview': image.text[:50] + '...' if len(image.text) > 50 else image.text,
                 'update_clicks': image.update_clicks,
+                'timeframe_clicks': ranked_clicks,
                 'activity_level': activity_level,
                 'last_updated': image.last_updated.isoformat(),
                 'created_at': image.created_at.isoformat(),
@@ -1177,10 +1083,11 @@ def get_most_updated_images(request):
                 }
             })
 
-        # Get statistics
-        total_images = StyledImage.objects.count()
-        total_updates = StyledImage.objects.aggregate(Sum('update_clicks'))['update_clicks__sum'] or 0
-        avg_updates = total_updates / total_images if total_images > 0 else 0
+        # Get statistics from the cached snapshot
+        snapshot = get_stats_snapshot()
+        total_images = snapshot['total_images']
+        total_updates = snapshot['total_clicks']
+        avg_updates = snapshot['average_clicks_per_image']
 
         return JsonResponse({
             'success': True,
@@ -1199,6 +1106,35 @@ def get_most_updated_images(request):
         return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
 
 
+def filter_search_queryset(queryset, search_query, category_id=None, tag_name=None):
+    """
+    Apply the search filters of api/search/ to queryset
+    Returns: (filtered queryset, category_id as an int when it was valid)
+    """
+    # Apply search query (now required)
+    queryset = queryset.filter(
+        Q(image_name__icontains=search_query) |
+        Q(text__icontains=search_query) |
+        Q(category__name__icontains=search_query) |
+        Q(tags__name__icontains=search_query)
+    ).distinct()
+
+    # Filter by category if specified
+    if category_id:
+        try:
+            category_id = int(category_id)
+            queryset = queryset.filter(category_id=category_id)
+        except ValueError:
+            pass
+
+    # Filter by tag if specified
+    if tag_name:
+        queryset = queryset.filter(tags__name__iexact=tag_name)
+
+    return queryset, category_id
+
+
+@cache_response('image', 'category', 'tag')
 def search_images(request):
     """
     NEW ENDPOINT: Unified search across images, tags, categories, and image names
@@ -1234,27 +1170,10 @@ def search_images(request):
             limit = 20
 
         # Start with base queryset
-        queryset = StyledImage.objects.select_related('category').prefetch_related('tags').all()
-
-        # Apply search query (now required)
-        queryset = queryset.filter(
-            Q(image_name__icontains=search_query) |
-            Q(text__icontains=search_query) |
-            Q(category__name__icontains=search_query) |
-            Q(tags__name__icontains=search_query)
-        ).distinct()
-
-        # Filter by category if specified
-        if category_id:
-            try:
-                category_id = int(category_id)
-                queryset = queryset.filter(category_id=category_id)
-            except ValueError:
-                pass
-
-        # Filter by tag if specified
-        if tag_name:
-            queryset = queryset.filter(tags__name__iexact=tag_name)
+        queryset, category_id = filter_search_queryset(
+            StyledImage.objects.select_related('category', 'blob').prefetch_related('tags').all(),
+            search_query, category_id, tag_name
+        )
 
         # Order and limit results
         search_results = queryset.order_by('-created_at')[:limit]
@@ -1291,6 +1210,7 @@ def search_images(request):
                                                              image.original_image.url) if image.original_image else None,
                 'output_image_url': get_absolute_media_url(request,
                                                            image.output_image.url) if image.output_image else None,
+                **get_thumbnail_fields(image, request),
                 'created_at': image.created_at.isoformat(),
             })
 
@@ -1309,14 +1229,153 @@ def search_images(request):
     except Exception as e:
         return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
 
+
+# Only the fields the export reads
+EXPORT_FIELDS = ('id', 'image_name', 'text', 'output_image', 'last_updated')
+
+
+def export_category_images(request, category_id):
+    """
+    Download the styled outputs of a category as one ZIP, streamed as it is written
+    Supports Range / If-Range, so an interrupted download can be resumed.
+    """
+    try:
+        category = Category.objects.get(id=category_id)
+    except Category.DoesNotExist:
+        return JsonResponse({'error': 'Category not found'}, status=404)
+
+    # Not category.styled_images: the related manager reads the deferred category_id of every row
+    images = StyledImage.objects.filter(category_id=category.id).only(*EXPORT_FIELDS).order_by('id')
+    return export_response(request, images.iterator(), f"{slugify(category.name) or category.id}.zip")
+
+
+def export_search_results(request):
+    """
+    Download the styled outputs of a search as one ZIP (same parameters as
+    api/search/, without the limit)
+    """
+    search_query = request.GET.get('q', '').strip()
+    if not search_query:
+        return JsonResponse({
+            'success': False,
+            'error': 'Search query parameter "q" is required',
+            'message': 'Please provide a search term using ?q=searchterm'
+        }, status=400)
+
+    images, _ = filter_search_queryset(
+        StyledImage.objects.only(*EXPORT_FIELDS),
+        search_query, request.GET.get('category_id'), request.GET.get('tag')
+    )
+    return export_response(
+        request, images.order_by('-created_at').iterator(), f"search-{slugify(search_query) or 'results'}.zip"
+    )
+
+
+@csrf_exempt
+def apply_style_preset(request):
+    """
+    Apply a StylePreset to many images in one call and regenerate them
+    Expected POST data (JSON):
+        - preset_id or preset (name): the preset to apply (REQUIRED)
+        - image_ids: list of image ids, or
+        - q (+ optional category_id / tag): every image of a search, or
+        - category_id: every image of a category
+        - texts: optional {image_id: new text} overrides
+    Returns: per-image results
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+
+    try:
+        if request.content_type == 'application/json':
+            data = json.loads(request.body)
+        else:
+            # Form data fallback (comma separated ids, no text overrides)
+            data = request.POST.dict()
+            if data.get('image_ids'):
+                data['image_ids'] = [value for value in data['image_ids'].split(',') if value.strip()]
+
+        preset_id = data.get('preset_id')
+        preset_name = data.get('preset')
+        if preset_id:
+            preset = StylePreset.objects.filter(id=preset_id).first()
+        elif preset_name:
+            preset = StylePreset.objects.filter(name=preset_name).first()
+        else:
+            return JsonResponse({'error': 'preset_id or preset is required'}, status=400)
+        if preset is None:
+            return JsonResponse({'error': 'Preset not found'}, status=404)
+
+        try:
+            texts = {int(image_id): str(text).strip() for image_id, text in (data.get('texts') or {}).items()}
+            if any(not text for text in texts.values()):
+                return JsonResponse({'error': 'Text overrides cannot be empty'}, status=400)
+
+            queryset = StyledImage.objects.select_related('blob')
+            search_query = str(data.get('q', '')).strip()
+            if data.get('image_ids'):
+                queryset = queryset.filter(id__in=[int(image_id) for image_id in data['image_ids']])
+            elif search_query:
+                # category_id and tag narrow the search, as in api/search/
+                category_id = int(data['category_id']) if data.get('category_id') else None
+                queryset, _ = filter_search_queryset(queryset, search_query, category_id, data.get('tag'))
+            elif data.get('category_id'):
+                queryset = queryset.filter(category_id=int(data['category_id']))
+            else:
+                return JsonResponse({'error': 'image_ids, category_id or q is required'}, status=400)
+        except (TypeError, ValueError, AttributeError) as e:
+            return JsonResponse({'error': f'Invalid selection: {str(e)}'}, status=400)
+
+        max_images = get_preset_max_images()
+        images = list(queryset.order_by('id')[:max_images + 1])
+        if len(images) > max_images:
+            return JsonResponse({
+                'error': f'At most {max_images} images can be restyled per request, narrow the selection'
+            }, status=400)
+
+        try:
+            results = apply_preset(preset, images, texts)
+        except ValueError as e:
+            return JsonResponse({'error': f'Invalid preset: {str(e)}'}, status=400)
+        if data.get('image_ids'):
+            for image_id in {int(image_id) for image_id in data['image_ids']} - set(results):
+                results[image_id] = (None, 'Image not found')
+
+        images_data = []
+        for image_id in sorted(results):
+            output_path, error = results[image_id]
+            if error is None:
+                images_data.append({
+                    'id': image_id,
+                    'success': True,
+                    'output_image_url': get_absolute_media_url(request, default_storage.url(output_path)),
+                })
+            else:
+                images_data.append({'id': image_id, 'success': False, 'error': error})
+        updated = sum(1 for item in images_data if item['success'])
+
+        return JsonResponse({
+            'success': updated > 0,
+            'preset': {'id': preset.id, 'name': preset.name},
+            'total': len(images_data),
+            'updated': updated,
+            'failed': len(images_data) - updated,
+            'images': images_data,
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
+
+
+@cache_response('tag')
 def list_all_tags(request):
     """
     NEW ENDPOINT: List all available tags with usage count
     """
     try:
-        tags = Tag.objects.annotate(
-            image_count=models.Count('styled_images')
-        ).order_by('-image_count', 'name')
+        tags = Tag.objects.order_by('-image_count', 'name')
 
         tags_data = []
         for tag in tags:
@@ -1334,4 +1393,15 @@ def list_all_tags(request):
         })
 
     except Exception as e:
-        return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
+
+def get_render_cache_stats(request):
+    """
+    Hit rate and memory use of the text sprite cache of the process serving the request
+    (render pool workers each keep their own)
+    """
+    return JsonResponse({
+        'success': True,
+        'pid': os.getpid(),
+        'text_sprites': sprite_cache.stats(),
+    })
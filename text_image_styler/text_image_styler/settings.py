@@ -135,8 +135,98 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media storage backend (see styler/media.py): 'filesystem' keeps media under
+# MEDIA_ROOT, 'tmpfs' uses the same layout on RAM-backed /dev/shm and 'memory'
+# keeps files inside this process only, to benchmark rendering without disk I/O.
+# Render pool workers are separate processes and cannot see 'memory' media.
+STYLER_MEDIA_STORAGE = os.environ.get('STYLER_MEDIA_STORAGE', 'filesystem')
+MEDIA_STORAGE_BACKENDS = {
+    'filesystem': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'tmpfs': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': os.environ.get('STYLER_TMPFS_MEDIA_ROOT', '/dev/shm/text_image_styler_media'),
+        },
+    },
+    'memory': {
+        'BACKEND': 'django.core.files.storage.InMemoryStorage',
+    },
+}
+STORAGES = {
+    'default': MEDIA_STORAGE_BACKENDS[STYLER_MEDIA_STORAGE],
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Uploads are hashed while they stream in, originals are stored once per content
+FILE_UPLOAD_HANDLERS = [
+    'styler.blobs.HashingUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache shared by all local worker processes, so invalidations made by one
+# worker are seen by the others (response cache, landing payload, stats)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# =================== STYLER SETTINGS - START ===================
+# Update clicks are buffered as PendingClick rows and written in bulk UPDATEs
+STYLER_CLICK_FLUSH_INTERVAL = 5  # seconds, 0 = write every click immediately
+STYLER_CLICK_FLUSH_MAX_PENDING = 1000  # pending rows per flush, and clicks of a process that force an early one
+# Click rollups used for timeframe rankings (see `manage.py compact_click_rollups`)
+STYLER_CLICK_HOURLY_RETENTION_DAYS = 8  # hourly buckets older than this become daily buckets
+STYLER_CLICK_DAILY_RETENTION_DAYS = 400  # daily buckets older than this are deleted
+# Trending scores decay exponentially (see styler/trending.py)
+STYLER_TRENDING_HALF_LIFE_HOURS = 72
+STYLER_TRENDING_EPOCH = '2025-01-01T00:00:00+00:00'  # move forward + refresh_trending_scores every few years
+STYLER_TRENDING_MIN_SCORE = 0.1  # decayed clicks below which an image stops trending
+# Statistics snapshot for api/images/stats/ and api/most-updated/
+STYLER_STATS_SNAPSHOT_TTL = 30  # seconds
+# Cached landing payloads (per site), dropped on category/image writes and on clicks of featured images
+STYLER_LANDING_CACHE_TTL = 300  # seconds
+# Cached GET responses, invalidated by per-model generation counters
+STYLER_RESPONSE_CACHE_TTL = 600  # seconds
+# Downscaled WebP previews of originals and outputs (see `manage.py build_thumbnails`)
+STYLER_THUMBNAIL_WIDTHS = (64, 320, 1024)
+STYLER_THUMBNAIL_QUALITY = 80
+# Admin changelists show the database's row estimate instead of COUNT(*) above this size
+STYLER_ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+# Background re-rendering (admin "Regenerate output images", `manage.py rerender`)
+STYLER_RENDER_WORKERS = None  # process pool size, None = CPU count
+STYLER_RENDER_BATCH_SIZE = 25  # images per progress update / bulk update
+STYLER_RENDER_JOB_STALE_SECONDS = 600  # `manage.py fail_stale_render_jobs` fails jobs without progress this long
+STYLER_PERSIST_OUTPUTS_IN_BACKGROUND = True  # api/update-text/ writes its output after responding
+STYLER_TEXT_SPRITE_CACHE_BYTES = 64 * 1024 * 1024  # rasterized caption cache per process, 0 disables it
+
+# Superseded outputs (see `manage.py gc_outputs`)
+STYLER_OUTPUT_KEEP_VERSIONS = 0  # unreferenced versions of each source kept by gc_outputs
+STYLER_DELETE_SUPERSEDED_OUTPUTS = False  # delete the previous output as soon as it is replaced
+
+# Upload ingestion (see styler/ingest.py)
+STYLER_MAX_UPLOAD_PIXELS = 50_000_000  # larger uploads are rejected before decoding
+STYLER_WORKING_MAX_PIXELS = 8_000_000  # renders use a copy downscaled to this many pixels
+
+# Bulk uploads (see styler/bulk_upload.py)
+STYLER_BULK_UPLOAD_MAX_FILES = 500  # images per bulk upload, ZIP members included
+STYLER_BULK_UPLOAD_MAX_MEMBER_BYTES = 50 * 1024 * 1024  # largest uncompressed ZIP member
+
+# Style presets (see styler/presets.py)
+STYLER_PRESET_APPLY_MAX_IMAGES = 1000  # images one api/presets/apply/ request may restyle
+# =================== STYLER SETTINGS - END ===================
+
 # =================== JAZZMIN CONFIGURATION - START ===================
 JAZZMIN_SETTINGS = {
     # Title on the brand (19 chars max) (defaults to current_admin_site.site_header)